@@ -1,3 +1,5 @@
+import threading
+import time as tm
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardMarkup, ParseMode
 from telegram.ext import Updater, CallbackContext
@@ -5,39 +7,69 @@ from telegram.ext import Defaults, Filters
 from telegram.ext import MessageHandler, CallbackQueryHandler
 
 from lib.logger import get_logger
+from lib.Metrics import REGISTRY
 from database.DAO import DAO
-from control.Config import Config
+from control.Config import get_config
+import control.controller as controller
 from app.view import View
 from app.modal import Modal
 
 logger = get_logger(__name__)
-config = Config()
+
+HANDLER_SECONDS = REGISTRY.histogram('meross_telegram_handler_seconds', 'Duration of the Telegram handlers',
+                                     ('kind',))
+_MESSAGE = HANDLER_SECONDS.labels('message')
+_CALLBACK_QUERY = HANDLER_SECONDS.labels('callback_query')
 
 
 class App:
 
-    def __init__(self, loop):
+    def __init__(self, loop, started_at=None, align=True):
+        """
+        :param started_at: float | perf_counter() when the process started, startup times are logged from it
+        :param align: bool | Run the safety ticks on the wall clock grid of their interval
+        """
+        config = get_config()
         self.__loop = loop
-        self.__dao = None
+        self.__started_at = started_at if started_at is not None else tm.perf_counter()
+        self.__responded = False
+        self.__responded_lock = threading.Lock()
 
-        self.__updater = Updater(config.telegram.token, defaults=Defaults(parse_mode=ParseMode.MARKDOWN))
-        self.__updater.dispatcher.add_handler(MessageHandler(Filters.chat_type, self.__handler))
-        self.__updater.dispatcher.add_handler(CallbackQueryHandler(self.__handler))
+        # Everything the handlers use exists before the first update is handled
+        self.__view = View()
+        self.__modal = Modal(config.meross, config.solaredge, config.sun, config.health_check, config.sampler,
+                             config.metrics, config.profiler, started_at=self.__started_at, align=align,
+                             turn_on_threshold=config.control.turn_on_threshold,
+                             min_off_time=config.control.min_off_time)
+
+        # The bot answers while the devices are still being discovered.
+        # Updates are handled concurrently by the dispatcher workers, each with its own DAO over the shared pool
+        self.__updater = Updater(config.telegram.token, workers=config.telegram.workers,
+                                 defaults=Defaults(parse_mode=ParseMode.MARKDOWN))
+        self.__updater.dispatcher.add_handler(MessageHandler(Filters.chat_type, self.__on_update, run_async=True))
+        self.__updater.dispatcher.add_handler(CallbackQueryHandler(self.__on_update, run_async=True))
         self.__updater.dispatcher.add_error_handler(self.__handler_error)
         self.__updater.start_polling()
 
-        self.__view = View()
-        self.__modal = Modal(config.meross, config.solaredge, config.sun, config.health_check)
-
         self.__loop.run_until_complete(self.__modal.async_init())
 
-    def __handler(self, update: Update, _: CallbackContext) -> None:
-        if self.__dao is not None:
-            self.__dao.close()
-        self.__dao = DAO()
-
+    def __on_update(self, update: Update, _: CallbackContext) -> None:
+        start = tm.perf_counter()
+        try:
+            self.__handler(update, DAO())
+        finally:
+            (_CALLBACK_QUERY if update.callback_query else _MESSAGE).observe(tm.perf_counter() - start)
+        with self.__responded_lock:
+            first, self.__responded = not self.__responded, True
+        if first:
+            logger.info('First Telegram response %.3f s after startup', tm.perf_counter() - self.__started_at)
+
+    def __handler(self, update: Update, dao: DAO) -> None:
+        """
+        Runs on a dispatcher worker: state is read from `dao` and from the snapshots of the Modal, never shared
+        """
         user = update.effective_user
-        search = self.__dao.search_user(user.id)
+        search = dao.search_user(user.id)
         if search is None:
             if update.message:
                 update.message.reply_text('You cannot use this bot.')
@@ -51,7 +83,7 @@ class App:
                 text = self.__view.welcome(user.first_name)
                 message.reply_text(text)
 
-                devices = self.__dao.get_all_devices()
+                devices = dao.get_all_devices()
                 text, inline_keyboard = self.__view.menu(devices)
                 message.reply_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard))
             else:
@@ -65,7 +97,7 @@ class App:
             data = query.data.split('|')[1:]
 
             if 'menu' == action:
-                devices = self.__dao.get_all_devices()
+                devices = dao.get_all_devices()
                 text, inline_keyboard = self.__view.menu(devices)
                 query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard))
             elif 'device' == action:
@@ -73,7 +105,7 @@ class App:
                 0: device_id
                 1: day
                 """
-                self.__device(query, data[0], int(data[1]))
+                self.__device(query, dao, data[0], int(data[1]))
             elif 'lock' == action:
                 """
                 0: device_id
@@ -84,14 +116,14 @@ class App:
                     query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard))
                 elif len(data) == 2:
                     self.__modal.lock_device(data[0], int(data[1]))
-                    self.__device(query, data[0], 0)
+                    self.__device(query, dao, data[0], 0)
                     query.answer('Dispositivo bloccato')
             elif 'unlock' == action:
                 """
                 0: device_id
                 """
                 self.__modal.unlock_device(data[0])
-                self.__device(query, data[0], 0)
+                self.__device(query, dao, data[0], 0)
                 query.answer('Dispositivo sbloccato')
             else:
                 query.answer('Command not found', show_alert=True)
@@ -101,19 +133,21 @@ class App:
     def __handler_error(update, context: CallbackContext):
         logger.error('TelegramError: %s', context.error)
 
-    def __device(self, query, device_id, day=0):
+    def __device(self, query, dao: DAO, device_id, day=0):
         date = datetime.today() + timedelta(days=day)
 
         _type = 'local'
         device = self.__modal.get_device(device_id)
         if device is None:  # get from DB if not exist
             _type = 'db'
-            device = self.__dao.get_device(device_id)
-        powers_on = self.__dao.get_device_powers_on(device_id, date.strftime('%Y-%m-%d'))
-        attributes = self.__dao.get_device_attributes(device_id)
+            device = dao.get_device(device_id)
+        powers_on = controller.get_history().get(device_id, date.date())
+        attributes = dao.get_device_attributes(device_id)
+        measured = controller.get_timeseries().mean(f'device.{device_id}', datetime.now() - timedelta(days=30),
+                                                    datetime.now())
 
         if device is not None:
-            text, inline_keyboard = self.__view.device(_type, device, powers_on, attributes, day)
+            text, inline_keyboard = self.__view.device(_type, device, powers_on, attributes, day, measured)
             query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard))
         else:
             query.answer('Device not found', show_alert=True)
@@ -121,3 +155,6 @@ class App:
     def close(self):
         self.__updater.stop()
         self.__loop.run_until_complete(self.__modal.async_close())
+        dao = DAO()
+        logger.info('Database pool: %s', dao.stats)
+        dao.close()
@@ -1,11 +1,23 @@
+import asyncio
 import logging
-from datetime import datetime
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import time as tm
+from datetime import datetime, timedelta
 
+from control.allocation import Allocator, KnapsackAllocator
 from control.Meross import Meross
+from control.policy import DeviceState, decide
+from control.PowerSampler import PowerSampler
+import control.controller as controller
+from lib import Clock
+from lib.HealthCheck import HealthCheck
 from lib.logger import get_logger
+from lib.Metrics import REGISTRY
+from lib.MetricsServer import MetricsServer
+from lib.Profiler import Profiler
 from lib.SolarEdge import SolarEdge
+from lib.Timer import TimerService
 from lib.Sun import Sun
+from obj.Device import DeviceSnapshot
 
 # Logging
 logging.getLogger('meross_iot').setLevel(logging.INFO)
@@ -13,90 +25,388 @@ logging.getLogger('apscheduler').setLevel(logging.WARNING)
 
 logger = get_logger(__name__)
 
+# Metrics
+TICKS = REGISTRY.counter('meross_ticks_total', 'Evaluations of the devices', ('result',))
+TICK_SECONDS = REGISTRY.histogram('meross_tick_seconds', 'Duration of an evaluation of the devices')
+STAGE_SECONDS = REGISTRY.histogram('meross_tick_stage_seconds', 'Duration of each stage of an evaluation', ('stage',))
+COMMAND_SECONDS = REGISTRY.histogram('meross_device_command_seconds', 'Duration of the commands sent to a device',
+                                     ('device', 'command'))
+COMMAND_ERRORS = REGISTRY.counter('meross_device_command_errors_total', 'Commands that timed out or failed',
+                                  ('device', 'command', 'error'))
+_TICKS_OK = TICKS.labels('ok')
+_TICKS_ERROR = TICKS.labels('error')
+_SYNC = STAGE_SECONDS.labels('sync')
+_SOLAREDGE = STAGE_SECONDS.labels('solaredge')
+_UPDATE = STAGE_SECONDS.labels('update')
+_DECIDE = STAGE_SECONDS.labels('decide')
+_ACTUATION = STAGE_SECONDS.labels('actuation')
+_HEALTH = STAGE_SECONDS.labels('health')
+
 
 class Modal:
 
-    def __init__(self, meross, solaredge, sun, health_check):
-        self.__manager = Meross(meross.email, meross.password)
-        self.__solaredge = SolarEdge(solaredge.api_token, solaredge.site_id, solaredge.home_default_load)
+    def __init__(self, meross, solaredge, sun, health_check, sampler, metrics, profiler, concurrency=10,
+                 command_timeout=15, debounce=2, safety_interval=5, power_threshold=100, started_at=None, align=False,
+                 allocator: Allocator = None, turn_on_threshold=0, min_off_time=0):
+        """
+        :param concurrency: int | Device commands sent at the same time
+        :param command_timeout: int | Seconds before a device command is given up
+        :param debounce: int | Seconds to wait after a trigger, to coalesce the following ones
+        :param safety_interval: int | Minutes between evaluations when nothing triggers one
+        :param power_threshold: int | Watts of remaining power change that trigger an evaluation
+        :param started_at: float | perf_counter() when the process started, the first tick time is logged from it
+        :param align: bool | Run the safety ticks on the wall clock grid of safety_interval (:00, :05, ...)
+        :param allocator: Allocator | Chooses the devices turned on with the surplus, KnapsackAllocator if None
+        :param turn_on_threshold: int | Watts of surplus kept in reserve when choosing the devices to turn on
+        :param min_off_time: int | Seconds a device stays off before the surplus turns it on again
+        """
+        self.__timers = TimerService()
+        self.__manager = Meross(meross.email, meross.password, self.__timers, on_change=self.__on_device_change,
+                                snapshot_file=meross.snapshot_file)
+        self.__solaredge = SolarEdge(solaredge.api_token, solaredge.site_id, solaredge.home_default_load,
+                                     daily_quota=solaredge.daily_quota, cache_file=solaredge.cache_file,
+                                     on_reading=self.__record_reading)
         self.__sun = Sun(sun.latitude, sun.longitude, sun.timezone)
-        self.__health_check = health_check
+        self.__health_check = HealthCheck(health_check.webhook_url)
+        self.__sampler = PowerSampler(lambda: self.__manager.devices, interval=sampler.interval,
+                                      capacity=sampler.capacity, window=sampler.window, concurrency=concurrency,
+                                      on_sample=self.__record_sample)
+
+        self.__allocator = allocator if allocator is not None else KnapsackAllocator()
+        self.__turn_on_threshold = turn_on_threshold
+        self.__min_off_time = timedelta(seconds=min_off_time)
+        self.__profiler = Profiler(profiler.enabled, budget=profiler.budget, directory=profiler.directory,
+                                   keep=profiler.keep, lag_interval=profiler.lag_interval,
+                                   stall_threshold=profiler.stall_threshold)
+        self.__metrics_server = MetricsServer(REGISTRY, metrics.host, metrics.port) if metrics.port else None
+        REGISTRY.gauge('meross_devices', 'Devices controlled', function=lambda: len(self.__manager.devices))
+        REGISTRY.gauge('meross_timers', 'Timers pending', function=lambda: len(self.__timers))
+        REGISTRY.gauge('solaredge_quota_remaining', 'SolarEdge requests left today',
+                       function=lambda: self.__solaredge.quota.remaining)
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.__command_timeout = command_timeout
+        self.__command_metrics = {}  # (device name, command) -> (seconds, timeouts, errors) children
+
+        self.__loop = None
+        self.__wakeup = asyncio.Event()
+        self.__reasons = set()
+        self.__debounce = debounce
+        self.__evaluated = False
+        self.__power_threshold = power_threshold
+        self.__power_produced = None
+        self.__committed = {}  # uuid -> watts the commands sent since the last SolarEdge reading add to the load
+        self.__boundary = None
+        self.__tasks = []
+        self.__snapshots = {}  # str(id) -> DeviceSnapshot, replaced as a whole on the loop, read from any thread
+        self.__started_at = started_at if started_at is not None else tm.perf_counter()
 
-        self.__scheduler = AsyncIOScheduler()
-        self.__scheduler.add_job(self.__async_loop, 'interval', minutes=5)
+        self.__safety_interval = safety_interval * 60
+        self.__align = align
 
     async def async_init(self) -> None:
         logger.info('MerossController started')
-        self.__scheduler.start()
-        await self.__manager.async_init()
-        await self.__async_loop()
+        self.__loop = asyncio.get_running_loop()
+        self.__timers.start(self.__loop)
+        self.__schedule_safety_tick()
+        self.__profiler.start()
+        if self.__metrics_server is not None:
+            await self.__metrics_server.async_start()
+
+        # Meross login and the first database connection, in parallel
+        meross, database = await asyncio.gather(self.__manager.async_init(),
+                                                self.__loop.run_in_executor(None, controller.get_dao().warm_up),
+                                                return_exceptions=True)
+        if isinstance(meross, Exception):
+            raise meross
+        if isinstance(database, Exception):
+            logger.warning('DATABASE: warm up failed: %s', repr(database))
+        logger.info('Subsystems ready %.3f s after startup', tm.perf_counter() - self.__started_at)
+
+        self.__tasks = [asyncio.ensure_future(self.__async_run()), asyncio.ensure_future(self.__async_watch_power())]
+        self.__sampler.start()
+        self.request_evaluation('startup')
+
+    def request_evaluation(self, reason: str) -> None:
+        """
+        Ask for the devices to be evaluated again, from any thread.
+        Requests close in time are coalesced into a single evaluation.
+        """
+        if self.__loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.__loop:
+            self.__reasons.add(reason)
+            self.__wakeup.set()
+        else:
+            self.__loop.call_soon_threadsafe(self.request_evaluation, reason)
+
+    def __schedule_safety_tick(self) -> None:
+        delay = self.__safety_interval
+        if self.__align:  # Next multiple of the interval since midnight
+            now = Clock.now()
+            delay -= (now - datetime.combine(now.date(), datetime.min.time())).total_seconds() % delay
+        self.__timers.schedule(delay, self.__safety_tick)
+
+    def __safety_tick(self) -> None:
+        self.__schedule_safety_tick()
+        self.request_evaluation('safety tick')
+
+    async def __async_run(self) -> None:
+        while True:
+            await self.__wakeup.wait()
+            first = not self.__evaluated
+            if not first:  # The first evaluation after startup is not delayed
+                await asyncio.sleep(self.__debounce)
+            self.__evaluated = True
+            self.__wakeup.clear()
+            reasons, self.__reasons = self.__reasons, set()
+
+            logger.debug('Evaluating devices: %s', ', '.join(sorted(reasons)))
+            with self.__profiler.trace('tick', reasons=sorted(reasons)):
+                with self.__profiler.span('health', _HEALTH):
+                    self.__health_check.start()
+                start = tm.perf_counter()
+                try:
+                    error = await self.__async_loop()
+                except Exception as e:
+                    error = f'Evaluation failed: {repr(e)}'
+                    logger.error(error)
+                duration = tm.perf_counter() - start
+                if first:
+                    logger.info('First tick %.3f s after startup', tm.perf_counter() - self.__started_at)
+
+                TICK_SECONDS.observe(duration)
+                (_TICKS_OK if error is None else _TICKS_ERROR).inc()
+
+                with self.__profiler.span('health', _HEALTH):
+                    if error is None:
+                        self.__health_check.success(f'Tick {duration:.3f} s: {", ".join(sorted(reasons))}')
+                    else:
+                        self.__health_check.fail(f'Tick {duration:.3f} s: {error}')
+                with self.__profiler.span('boundary'):
+                    self.__schedule_boundary()
+                with self.__profiler.span('publish'):
+                    self.__publish()
+
+    async def __async_watch_power(self) -> None:
+        """
+        Poll the power flow as often as the SolarEdge quota allows,
+        and trigger an evaluation when the remaining power changed enough
+        """
+        while True:
+            expires_at = self.__solaredge.expires_at
+            delay = (expires_at - Clock.now()).total_seconds() if expires_at is not None else 0
+            await asyncio.sleep(min(max(delay, 1), 60 * 60))
+
+            if not self.__sun.is_day():  # Nothing to watch until the next sunrise
+                now = Clock.now()
+                sunrise = datetime.combine(now.date(), self.__sun.sunrise)
+                if sunrise <= now:
+                    tomorrow = now.date() + timedelta(days=1)
+                    sunrise = datetime.combine(tomorrow, self.__sun.sunrise_on(tomorrow))
+                await asyncio.sleep((sunrise - now).total_seconds() + 1)
+                continue
+            if self.__power_produced is None:
+                continue
+            result = await self.__solaredge.async_get_current_power_flow(sunrise=self.__sun.sunrise,
+                                                                         sunset=self.__sun.sunset)
+            if not result:
+                continue
+
+            power_produced = result['PV'] - result['LOAD'] - sum(self.__committed.values())
+            if abs(power_produced - self.__power_produced) >= self.__power_threshold \
+                    or (power_produced < 0) != (self.__power_produced < 0):
+                self.request_evaluation('power changed')
+
+    def __schedule_boundary(self) -> None:
+        """
+        Trigger an evaluation at the next time something is due to change:
+        an always on window starting or ending, a minimum on or off time expiring, sunrise or sunset
+        """
+        now = Clock.now()
+        moments = [datetime.combine(now.date(), self.__sun.sunrise), datetime.combine(now.date(), self.__sun.sunset)]
+        for device in self.__manager.devices:
+            for time in device.times_always_on:
+                moments.append(datetime.combine(now.date(), time['start']))
+                moments.append(datetime.combine(now.date(), time['end']))
+            if device.is_on and device.last_power_on is not None:
+                moments.append(device.next_power_status_change)
+            if not device.is_on and device.last_power_off is not None:
+                moments.append(device.last_power_off + self.__min_off_time)
+        moments = [moment for moment in moments if moment > now]
+        if not len(moments):
+            moments.append(datetime.combine(now.date(), datetime.min.time()) + timedelta(days=1))
+
+        delay = (min(moments) - now).total_seconds() + 1
+        if self.__boundary is not None:
+            self.__boundary.reschedule(delay)
+        else:
+            self.__boundary = self.__timers.schedule(delay, self.request_evaluation, 'boundary')
 
-    async def __async_loop(self):
-        now = datetime.now()
+    async def __async_loop(self) -> str or None:
+        """
+        :return: str or None | What went wrong
+        """
+        now = Clock.now()
 
-        devices = self.__manager.find_devices()
+        with self.__profiler.span('sync', _SYNC):
+            devices = self.__manager.find_devices()
         if not len(devices):
             return
 
-        result = self.__solaredge.get_current_power_flow(sunrise=self.__sun.sunrise, sunset=self.__sun.sunset)
+        with self.__profiler.span('solaredge', _SOLAREDGE):
+            result = await self.__solaredge.async_get_current_power_flow(sunrise=self.__sun.sunrise,
+                                                                         sunset=self.__sun.sunset)
         if not result:
             logger.error('SOLAREDGE: Request failed')
-            return
+            return 'SolarEdge request failed'
 
-        power_produced = result['PV'] - result['LOAD']
+        # The reading may be older than the commands sent since: count what they add or give back
+        power_produced = result['PV'] - result['LOAD'] - sum(self.__committed.values())
+        self.__power_produced = power_produced
         logger.info(f"Remaining power: {power_produced} W")
+        logger.debug('SOLAREDGE: %s requests left today, cache hit ratio %.2f',
+                     self.__solaredge.quota.remaining, self.__solaredge.cache_hit_ratio)
+
+        # 1. Update device information, concurrently
+        with self.__profiler.span('update', _UPDATE):
+            updated = await asyncio.gather(*[self.__async_command(device, device.async_update(), 'update')
+                                             for device in devices])
+        devices = [device for device, ok in zip(devices, updated) if ok]
 
+        # 2. Decide which devices to turn on or off
+        with self.__profiler.span('decide', _DECIDE):
+            commands = self.__decide(devices, power_produced, now)
+
+        # 3. Send the commands, concurrently
+        with self.__profiler.span('actuation', _ACTUATION):
+            for device, turn_on, _ in commands:
+                device.expect(turn_on)
+            sent = await asyncio.gather(*[self.__async_command(device,
+                                                               device.async_turn_on() if turn_on
+                                                               else device.async_turn_off(),
+                                                               'turn on' if turn_on else 'turn off')
+                                          for device, turn_on, _ in commands])
+        for (device, _, watts), ok in zip(commands, sent):
+            if ok:
+                self.__committed[device.uuid] = self.__committed.get(device.uuid, 0) + watts
+                self.__power_produced -= watts
+            else:
+                device.expect(None)
+
+    def __decide(self, devices: list, power_produced: int, now: datetime) -> list:
+        """
+        :return: list | (device, True to turn on / False to turn off, watts it adds to the load)
+        """
+        states = []
         for device in devices:
-            await device.async_update()  # Update device information
             if device.is_locked:  # Ignore locked device
                 logger.debug('%s ignored because locked', device.name)
                 continue
+            states.append(DeviceState(device, device.is_on, device.solar_power_on, device.priority,
+                                      device.times_always_on, device.next_power_status_change,
+                                      self.__sampler.usage(device), self.__power(device),
+                                      device.last_power_off + self.__min_off_time
+                                      if device.last_power_off is not None else datetime.min))
 
-            time_always_on = False
-            for time in device.times_always_on:
-                if time['start'] <= now.time() < time['end']:  # Check All Times Always On
-                    time_always_on = True
+        commands = []
+        by_uuid = {state.device.uuid: state for state in states}
+        for command in decide(states, power_produced, now, self.__sun.is_day(), self.__allocator,
+                              self.__turn_on_threshold):
+            logger.debug('%s is turning %s | %s', command.device.name, 'on' if command.turn_on else 'off',
+                         command.reason)
+            state = by_uuid[command.device.uuid]
+            commands.append((command.device, command.turn_on, state.usage if command.turn_on else -state.power))
+        return commands
 
-            if time_always_on:  # Time Always On
-                if not device.is_on:
-                    logger.debug(f"{device.name} is turning on | Always On")
-                    await device.async_turn_on()
+    def __power(self, device) -> float:
+        """ Watts the device draws now: sampled, else last measured, else its nominal usage """
+        power = self.__sampler.power(device)
+        if power is not None:
+            return power
+        metrics = device.last_metrics
+        if metrics is not None:
+            return metrics.power
+        return device.current_power_usage
 
-            elif device.solar_power_on and self.__sun.is_day():  # Solar-Energy Power On
-                if not device.is_on and power_produced > device.current_power_usage:  # to On
-                    logger.debug(f"{device.name} is turning on")
-                    await device.async_turn_on()
+    async def __async_command(self, device, command, name: str) -> bool:
+        """
+        Run a device command with a timeout, a failure only affects that device
+        """
+        seconds, timeouts, errors = self.__command_metrics_of(device, name)
+        async with self.__semaphore:
+            with self.__profiler.span(name, seconds, device=device.name) as span:
+                try:
+                    await asyncio.wait_for(command, timeout=self.__command_timeout)
+                    return True
+                except asyncio.TimeoutError:
+                    logger.warning('%s: %s timed out', device.name, name)
+                    timeouts.inc()
+                    error = 'timeout'
+                except Exception as e:
+                    logger.error('%s: %s failed: %s', device.name, name, e)
+                    errors.inc()
+                    error = repr(e)
+                if span is not None:
+                    span.attributes['error'] = error
+                return False
 
-                    power_produced -= device.current_power_usage
+    def __command_metrics_of(self, device, name: str) -> tuple:
+        """
+        :return: tuple | (seconds, timeouts, errors) metrics of a command of a device, resolved on its first command
+        """
+        key = (device.name, name)
+        metrics = self.__command_metrics.get(key)
+        if metrics is None:
+            metrics = (COMMAND_SECONDS.labels(*key), COMMAND_ERRORS.labels(*key, 'timeout'),
+                       COMMAND_ERRORS.labels(*key, 'error'))
+            self.__command_metrics[key] = metrics
+        return metrics
 
-                elif device.is_on and (power_produced < 0 and now > device.next_power_status_change):  # to Off
-                    logger.debug(f"{device.name} is turning off")
-                    await device.async_turn_off()
+    @staticmethod
+    def __record_sample(device, metrics) -> None:
+        controller.get_timeseries().record(f'device.{device.id}', metrics.power)
 
-                    instant_metrics = await device.async_get_instant_metrics()
-                    if instant_metrics is not None:
-                        power_produced += instant_metrics.power
-                    else:
-                        power_produced += device.current_power_usage
+    def __record_reading(self, reading: dict) -> None:
+        self.__committed = {}  # A fresh reading includes the commands sent before it
+        for key in ('PV', 'LOAD', 'GRID'):
+            if reading[key] is not None:
+                controller.get_timeseries().record(f'site.{key}', reading[key])
 
-            elif device.is_on and now > device.next_power_status_change:  # Always Off
-                logger.debug(f"{device.name} is turning off | Always Off")
-                await device.async_turn_off()
+    def __on_device_change(self, reason: str, evaluate: bool = True) -> None:
+        self.__publish()
+        if evaluate:
+            self.request_evaluation(reason)
 
-        # Ping health check service
-        self.__health_check.ping()
+    def __publish(self) -> None:
+        """
+        Copy the state of the devices for the other threads, they never read a Device while the loop changes it
+        """
+        self.__snapshots = {str(device.id): device.snapshot() for device in self.__manager.devices}
 
-    def get_device(self, device_id):
-        return self.__manager.get_device(device_id)
+    def get_device(self, device_id) -> DeviceSnapshot or None:
+        """
+        State of a device at the last evaluation or change, from any thread without waiting for the loop
+        """
+        return self.__snapshots.get(str(device_id))
 
     def unlock_device(self, device_id):
+        self.__call_on_loop(self.__unlock_device, device_id)
+
+    def lock_device(self, device_id, delay=None):
+        self.__call_on_loop(self.__lock_device, device_id, delay)
+
+    def __unlock_device(self, device_id):
         device = self.__manager.get_device(device_id)
         if device is not None:
             device.unlock()
         else:
             logger.warning('No device found for %s', device_id)
 
-    def lock_device(self, device_id, delay=None):
+    def __lock_device(self, device_id, delay=None):
         device = self.__manager.get_device(device_id)
         if device is not None:
             if delay is not None:
@@ -106,7 +416,35 @@ class Modal:
         else:
             logger.warning('No device found for %s', device_id)
 
+    def __call_on_loop(self, function, *args, timeout=5):
+        """
+        Run `function` on the loop thread, where device state is read and changed, and wait for it
+        """
+        try:
+            on_loop = asyncio.get_running_loop() is self.__loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop or self.__loop is None:
+            return function(*args)
+
+        async def call():
+            return function(*args)
+        return asyncio.run_coroutine_threadsafe(call(), self.__loop).result(timeout)
+
     async def async_close(self):
-        self.__scheduler.shutdown(wait=False)
+        await self.__profiler.async_stop()
+        if self.__metrics_server is not None:
+            await self.__metrics_server.async_stop()
+        for task in self.__tasks:
+            task.cancel()
+        self.__timers.stop()
+        await self.__sampler.async_stop()
         await self.__manager.async_stop()
+        await self.__solaredge.async_close()
+        await self.__health_check.async_close()
+        await asyncio.get_running_loop().run_in_executor(None, controller.close)
+        if controller.log_writer is not None:
+            logger.info('LogWriter: %s', controller.log_writer.stats)
+        logger.info('PowerSampler: %s', self.__sampler.stats)
+        logger.info('Profiler: %s', self.__profiler.stats)
         logger.debug('SERVICE STOPPED')
@@ -27,7 +27,7 @@ class View:
         return message, inline_keyboard
 
     @staticmethod
-    def device(_type: str, device, powers_on: list, attributes: list, day=0) -> tuple:
+    def device(_type: str, device, powers_on: list, attributes: list, day=0, measured=None) -> tuple:
         date = datetime.today() + timedelta(days=int(day))
 
         device_id = device.id if _type == 'local' else device.intIdDevice
@@ -53,6 +53,8 @@ class View:
                     caption,
                     '🔴' if not is_on else '🔵',
                     current_power_usage)
+        if measured is not None:
+            message += 'Consumo Misurato: {} W (30 giorni)\n'.format(round(measured))
 
         for _row in attributes:
             if not _row.dtaLastUpdate + timedelta(minutes=10) < datetime.now():
@@ -0,0 +1,52 @@
+"""
+Solar surplus allocation: first fit in database order vs subset sum by priority
+
+    python -m benchmarks.allocation [rounds]
+"""
+import random
+import sys
+import time
+
+from control.allocation import Candidate, GreedyAllocator, KnapsackAllocator
+
+
+def run(allocator, cases: list) -> tuple:
+    """
+    :return: tuple | (share of the surplus used, share of the top priority demand served, ms per allocation)
+    """
+    used, served, elapsed = 0.0, 0.0, 0.0
+    for candidates, surplus in cases:
+        start = time.perf_counter()
+        chosen = set(allocator.allocate(candidates, surplus))
+        elapsed += time.perf_counter() - start
+
+        power = sum(candidate.power for candidate in candidates if candidate.device in chosen)
+        assert power < surplus
+        used += power / surplus
+        top = [candidate for candidate in candidates if candidate.priority == 2]
+        demand = min(sum(candidate.power for candidate in top), surplus)
+        served += sum(candidate.power for candidate in top if candidate.device in chosen) / demand if demand else 1
+    return used / len(cases), served / len(cases), elapsed / len(cases) * 1000
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    random.seed(1)
+    allocators = (('greedy', GreedyAllocator()), ('knapsack', KnapsackAllocator()))
+
+    print(f"{'devices':>8} | " + ' | '.join(f"{name:>8} used  top  ms/alloc" for name, _ in allocators))
+    for count in (10, 100, 500):
+        cases = []
+        for _ in range(rounds):
+            candidates = [Candidate(i, random.choice((60, 150, 400, 800, 1200, 2000, 3000)) + random.randint(0, 50),
+                                    random.choice((0, 0, 1, 2))) for i in range(count)]
+            total = sum(candidate.power for candidate in candidates)
+            cases.append((candidates, random.randint(500, min(total, 8000))))
+
+        results = [run(allocator, cases) for _, allocator in allocators]
+        print(f'{count:>8} | ' + ' | '.join(f'{" " * 8} {used:>4.0%} {top:>4.0%} {ms:>9.3f}'
+                                             for used, top, ms in results))
+
+
+if __name__ == '__main__':
+    main()
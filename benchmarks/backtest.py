@@ -0,0 +1,239 @@
+"""
+Backtest of the decision policy (control.policy.decide) over a period of PV and load history,
+for a sweep of parameter sets evaluated across a process pool:
+the self-consumption, grid import and switches of each configuration
+
+    python -m benchmarks.backtest [days]
+    python -m benchmarks.backtest START END
+
+With two dates, the history is read from the database of config.json: site.PV and site.LOAD of the power history,
+with the power of the devices on according to the logs table taken out of LOAD, the devices as configured
+and the CONTROL settings.
+Otherwise `days` synthetic days of the replay (30 by default) are used, with the settings of config.json.sample.
+
+The policy is evaluated at every reading, as the power change trigger of the Modal would, and its commands
+take effect at once. Swept: the minimum on time (timeDelayBeforePowerOff, the configured one or the same for all),
+the priorities, the surplus kept in reserve before turning on (CONTROL.turn_on_threshold) and the allocator.
+The ten with the most self-consumption are listed after the current one.
+"""
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta
+from itertools import product
+
+from benchmarks.fakes import fake_config
+from benchmarks.replay import synthetic_trace
+from control.allocation import GreedyAllocator, KnapsackAllocator
+from control.policy import DeviceState, decide
+from database.TimeSeries import MINUTE, HOUR
+from lib.Sun import Sun
+
+# One configuration to evaluate: a delay in seconds and a priority per device
+Parameters = namedtuple('Parameters', ['delay', 'delays', 'scheme', 'priorities', 'threshold', 'allocator'])
+# Energy in Wh
+Result = namedtuple('Result', ['parameters', 'produced', 'self_consumed', 'imported', 'exported', 'switches'])
+
+DELAYS = (None, 5 * 60, 10 * 60, 15 * 60, 30 * 60, 60 * 60)  # None: as configured
+SCHEMES = ('configured', 'flat', 'small first', 'large first')
+THRESHOLDS = (0, 100, 250, 500, 1000)
+ALLOCATORS = {'knapsack': KnapsackAllocator, 'greedy': GreedyAllocator}
+
+# History of the worker processes, set once per process by the pool initializer
+_history = None
+_devices = None
+_sun = None
+_min_off_time = None
+
+
+def load_synthetic(days: int, start: date = date(2026, 6, 1)) -> tuple:
+    """
+    :return: tuple | (location, devices, readings as (date, PV, base load), CONTROL settings)
+    """
+    readings = []
+    for i in range(days):
+        site, devices, events = synthetic_trace(start + timedelta(days=i), seed=i)
+        readings += [(event['date'], event['PV'], event['LOAD']) for event in events if event['type'] == 'power']
+    location = (site['latitude'], site['longitude'], site['timezone'])
+    devices = [{'name': device['name'], 'usage': device['usage'], 'delay': device['delay'],
+                'priority': device['priority'], 'solar': device['solar'], 'times': []} for device in devices]
+    return location, devices, readings, fake_config().control
+
+
+def load_database(start: datetime, end: datetime) -> tuple:
+    """
+    :return: tuple | (location, devices, readings as (date, PV, base load), CONTROL settings, recorded Result)
+    """
+    from control.Config import get_config
+    import control.controller as controller
+
+    sun = get_config().sun
+    timeseries = controller.get_timeseries()
+    configured = [device for device in controller.get_devices() if not device['disabled']]
+    devices = [{'name': device['name'], 'usage': device['currentPowerUsage'],
+                'delay': device['timeDelayBeforePowerOff'].total_seconds(), 'priority': device['priority'],
+                'solar': device['solarPowerOn'], 'times': device['timesAlwaysOn']} for device in configured]
+
+    for resolution in (MINUTE, HOUR):  # Minutes are kept for two weeks only
+        pv = {row.date: row.mean for row in timeseries.query('site.PV', start, end, resolution)}
+        load = {row.date: row.mean for row in timeseries.query('site.LOAD', start, end, resolution)}
+        if len(pv):
+            break
+    dates = sorted(set(pv) & set(load))
+
+    # State of each device at each reading, from its state changes
+    changes = []  # (date, device index, state)
+    for index, device in enumerate(configured):
+        changes += [(row.dtaDate, index, bool(row.boolState))
+                    for row in controller.get_dao().get_device_powers_on(device['id'], start, end)]
+    changes.sort(key=lambda change: change[0])
+
+    readings, on, switches, position = [], [False] * len(devices), 0, 0
+    for moment in dates:
+        while position < len(changes) and changes[position][0] <= moment:
+            _, index, state = changes[position]
+            switches += on[index] != state
+            on[index] = state
+            position += 1
+        devices_load = sum(device['usage'] for device, state in zip(devices, on) if state)
+        readings.append((moment, pv[moment], max(load[moment] - devices_load, 0)))
+
+    produced, self_consumed, imported, exported = _energy([(moment, pv[moment], load[moment]) for moment in dates])
+    recorded = Result(None, produced, self_consumed, imported, exported, switches)
+    controller.close()
+    return (sun.latitude, sun.longitude, sun.timezone), devices, readings, get_config().control, recorded
+
+
+def _energy(readings: list) -> tuple:
+    """
+    :param readings: list | (date, PV, load), each held until the next one
+    :return: tuple | (produced, self-consumed, imported, exported) in Wh
+    """
+    produced = self_consumed = imported = exported = 0.0
+    for (moment, pv, load), hours in zip(readings, _durations([reading[0] for reading in readings])):
+        produced += pv * hours
+        self_consumed += min(pv, load) * hours
+        imported += max(load - pv, 0) * hours
+        exported += max(pv - load, 0) * hours
+    return produced, self_consumed, imported, exported
+
+
+def _durations(dates: list) -> list:
+    """ Hours each reading is held: until the next one, the last one as long as the previous """
+    durations = [(after - before).total_seconds() / 3600 for before, after in zip(dates, dates[1:])]
+    return durations + durations[-1:] if len(durations) else [0.0] * len(dates)
+
+
+def sweep(devices: list, threshold: int) -> list:
+    """
+    :param threshold: int | Configured turn on threshold
+    :return: list | Parameters, the configured ones first
+    """
+    usage = [device['usage'] for device in devices]
+    schemes = {
+        'configured': tuple(device['priority'] for device in devices),
+        'flat': (0,) * len(devices),
+        'small first': tuple(sorted(usage, reverse=True).index(watts) for watts in usage),
+        'large first': tuple(sorted(usage).index(watts) for watts in usage)
+    }
+    thresholds = (threshold,) + tuple(watts for watts in THRESHOLDS if watts != threshold)
+    parameters = []
+    for delay, scheme, threshold, allocator in product(DELAYS, SCHEMES, thresholds, ALLOCATORS):
+        delays = tuple(device['delay'] if delay is None else delay for device in devices)
+        parameters.append(Parameters(delay, delays, scheme, schemes[scheme], threshold, allocator))
+    return parameters
+
+
+def _init(location: tuple, devices: list, readings: list, min_off_time: int) -> None:
+    global _history, _devices, _sun, _min_off_time
+    _sun = Sun(*location)
+    _devices = devices
+    _min_off_time = timedelta(seconds=min_off_time)
+    _history = [(moment, pv, base, hours, _sun.is_day(moment.time(), moment.date()))
+                for (moment, pv, base), hours in zip(readings, _durations([reading[0] for reading in readings]))]
+
+
+def simulate(parameters: Parameters) -> Result:
+    """
+    Run the policy over the history of the process
+    """
+    allocator = ALLOCATORS[parameters.allocator]()
+    delays = [timedelta(seconds=delay) for delay in parameters.delays]
+    indexes = range(len(_devices))
+    usage = [device['usage'] for device in _devices]
+    on = [False] * len(_devices)
+    last_power_on = [None] * len(_devices)
+    last_power_off = [None] * len(_devices)
+
+    produced = self_consumed = imported = exported = 0.0
+    switches = 0
+    for moment, pv, base, hours, is_day in _history:
+        load = base + sum(watts for watts, state in zip(usage, on) if state)
+        states = [DeviceState(i, on[i], _devices[i]['solar'], parameters.priorities[i], _devices[i]['times'],
+                              last_power_on[i] + delays[i] if last_power_on[i] is not None else datetime.min,
+                              usage[i], usage[i],
+                              last_power_off[i] + _min_off_time if last_power_off[i] is not None else datetime.min)
+                  for i in indexes]
+        commands = decide(states, pv - load, moment, is_day, allocator, parameters.threshold)
+        for command in commands:
+            on[command.device] = command.turn_on
+            if command.turn_on:
+                last_power_on[command.device] = moment
+            else:
+                last_power_off[command.device] = moment
+        switches += len(commands)
+
+        load = base + sum(watts for watts, state in zip(usage, on) if state)
+        produced += pv * hours
+        self_consumed += min(pv, load) * hours
+        imported += max(load - pv, 0) * hours
+        exported += max(pv - load, 0) * hours
+    return Result(parameters, produced, self_consumed, imported, exported, switches)
+
+
+def report(name: str, result: Result) -> str:
+    ratio = result.self_consumed / result.produced if result.produced else 0
+    return f'{name:<50} | {result.self_consumed / 1000:>8.1f} {ratio:>5.0%} {result.imported / 1000:>8.1f} ' \
+           f'{result.switches:>8}'
+
+
+def label(parameters: Parameters) -> str:
+    delay = 'configured' if parameters.delay is None else f'{parameters.delay // 60:.0f} min'
+    return f'{delay:<10} {parameters.scheme:<11} {parameters.threshold:>5} W {parameters.allocator:<8}'
+
+
+def main():
+    recorded = None
+    if len(sys.argv) > 2:
+        start, end = datetime.fromisoformat(sys.argv[1]), datetime.fromisoformat(sys.argv[2])
+        location, devices, readings, control, recorded = load_database(start, end)
+    else:
+        location, devices, readings, control = load_synthetic(int(sys.argv[1]) if len(sys.argv) > 1 else 30)
+    if not len(readings):
+        print('No readings in the period')
+        return
+    parameters = sweep(devices, control.turn_on_threshold)
+    min_off_time = control.min_off_time
+
+    workers = os.cpu_count() or 1
+    began = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init, initargs=(location, devices, readings, min_off_time)) as pool:
+        results = list(pool.map(simulate, parameters, chunksize=max(len(parameters) // (workers * 4), 1)))
+    elapsed = time.perf_counter() - began
+
+    days = (readings[-1][0] - readings[0][0]).total_seconds() / 86400
+    print(f'{len(parameters)} configurations over {days:.0f} days ({len(readings)} readings, {len(devices)} devices) '
+          f'in {elapsed:.1f} s on {workers} processes, minimum off time {min_off_time // 60:.0f} min')
+    print(f"{'configuration (delay, priorities, reserve, allocator)':<50} | {'self kWh':>8} {'of PV':>5} "
+          f"{'grid kWh':>8} {'switches':>8}")
+    if recorded is not None:
+        print(report('recorded', recorded))
+    print(report(f'{label(results[0].parameters)} (current)', results[0]))
+    for result in sorted(results, key=lambda r: (-r.self_consumed, r.imported))[:10]:
+        print(report(label(result.parameters), result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+controller.get_devices: full reload every tick vs incremental sync of the changed devices
+
+    python -m benchmarks.config_sync [round-trip ms]
+"""
+import sys
+import time
+
+from benchmarks.sqlite_database import SQLiteDatabase, populate
+from database.DAO import DAO
+import control.controller as controller
+
+TICKS = 100
+CHANGE_EVERY = 10  # ticks between two configuration changes
+
+
+def run(db, full: bool) -> tuple:
+    controller.config_version = None
+    controller.get_devices()
+    db.reset_stats()
+
+    start = time.perf_counter()
+    for tick in range(TICKS):
+        if tick % CHANGE_EVERY == 0:
+            db.execute("UPDATE devices SET intUsage = intUsage + 1 WHERE intIdDevice = %s", tick + 1)
+            db.queries -= 1
+        if full:
+            controller.config_version = None
+        controller.get_devices()
+    elapsed = time.perf_counter() - start
+    return db.queries / TICKS, db.bytes / TICKS, elapsed / TICKS * 1000
+
+
+def main():
+    latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.0005
+    print(f'Simulated round-trip: {latency * 1000} ms, one change every {CHANGE_EVERY} ticks')
+    print(f"{'devices':>8} | {'full q/tick':>11} {'bytes/tick':>10} {'ms/tick':>8} | "
+          f"{'incr q/tick':>11} {'bytes/tick':>10} {'ms/tick':>8}")
+    for count in (10, 100, 1000):
+        db = SQLiteDatabase(latency)
+        populate(db, count, logs_per_device=50)
+        controller.dao = DAO(db)
+
+        full = run(db, True)
+        incremental = run(db, False)
+        print(f'{count:>8} | {full[0]:>11.1f} {full[1]:>10.0f} {full[2]:>8.2f} | '
+              f'{incremental[0]:>11.1f} {incremental[1]:>10.0f} {incremental[2]:>8.2f}')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Controller hot paths over fake plugs, a fake SolarEdge and the SQLite DAO, at 10, 100 and 1000 devices:
+an evaluation (Modal.__async_loop), Meross.find_devices, controller.get_devices and the Telegram views,
+as latency percentiles and database queries per call
+
+    python -m benchmarks.control_loop [round-trip ms] [failure rate]
+"""
+import asyncio
+import logging
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import Failures, FakeMerossHttpClient, FakeMerossManager, FakeSolarEdge, FakeSun, Latency, \
+    create_modal
+from benchmarks.sqlite_database import SQLiteDatabase, populate
+from database.DAO import DAO
+from app.view import View
+import app.modal as modal_module
+import control.controller as controller
+import control.Meross as meross_module
+
+SIZES = (10, 100, 1000)
+ROUNDS = 30
+
+
+def percentile(samples: list, q: float) -> float:
+    """ Nearest-rank percentile """
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+def reset_controller(dao: DAO or None) -> None:
+    controller.close()
+    controller.dao = dao
+    controller.log_writer = controller.history = controller.timeseries = None
+    controller.devices.clear()
+    controller.config_version = controller.last_full_sync = None
+
+
+def render_menu(dao: DAO) -> None:
+    View.menu(dao.get_all_devices())
+
+
+def render_device(modal: modal_module.Modal, dao: DAO, device_id: int) -> None:
+    """ What App.__device reads and renders for a device page """
+    device = modal.get_device(device_id)
+    powers_on = controller.get_history().get(device_id, datetime.today().date())
+    attributes = dao.get_device_attributes(device_id)
+    measured = controller.get_timeseries().mean(f'device.{device_id}', datetime.now() - timedelta(days=30),
+                                                datetime.now())
+    View.device('local', device, powers_on, attributes, 0, measured)
+
+
+async def measure(db: SQLiteDatabase, function) -> tuple:
+    """
+    :return: tuple | (p50 ms, p99 ms, queries per call)
+    """
+    samples = []
+    db.reset_stats()
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = function()
+        if asyncio.iscoroutine(result):
+            await result
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentile(samples, 0.5), percentile(samples, 0.99), db.queries / ROUNDS
+
+
+async def main():
+    latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.0005
+    Failures.update = Failures.command = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    Latency.login = Latency.list_devices = Latency.abilities = 0
+    Latency.update = Latency.command = Latency.metrics = 0.02
+    Latency.solaredge = 0.05
+    meross_module.MerossHttpClient = FakeMerossHttpClient
+    meross_module.MerossManager = FakeMerossManager
+    modal_module.SolarEdge = FakeSolarEdge
+    modal_module.Sun = FakeSun
+    logging.disable(logging.ERROR)  # Simulated failures are logged as errors
+    random.seed(1)
+
+    print(f'Simulated round-trip: {latency * 1000} ms, failure rate {Failures.update:.0%}, '
+          f'device call {Latency.update * 1000:.0f} ms, SolarEdge {Latency.solaredge * 1000:.0f} ms')
+    print(f"{'devices':>7} {'operation':<22} | {'p50 ms':>8} {'p99 ms':>8} {'queries':>7}")
+    for count in SIZES:
+        db = SQLiteDatabase(latency)
+        populate(db, count, logs_per_device=20)
+        dao = DAO(db)
+        reset_controller(dao)
+        FakeMerossManager.count = count
+
+        modal = create_modal()
+        timers = modal._Modal__timers
+        manager = modal._Modal__manager
+        timers.start(asyncio.get_running_loop())
+        await manager.async_init()
+        await modal._Modal__async_loop()  # First evaluation: devices added and updated
+        modal._Modal__publish()  # Device snapshots read by the views, published after each tick
+
+        device_ids = [device.id for device in manager.devices]
+        results = [
+            ('evaluation', await measure(db, modal._Modal__async_loop)),
+            ('Meross.find_devices', await measure(db, manager.find_devices)),
+            ('get_devices', await measure(db, controller.get_devices)),
+            ('get_devices full', await measure(db, lambda: (reset_controller(dao), controller.get_devices()))),
+            ('view menu', await measure(db, lambda: render_menu(dao))),
+            ('view device', await measure(db, lambda: render_device(modal, dao, random.choice(device_ids))))
+        ]
+        for name, (p50, p99, queries) in results:
+            print(f'{count:>7} {name:<22} | {p50:>8.2f} {p99:>8.2f} {queries:>7.1f}')
+
+        await manager.async_stop()
+        timers.stop()
+        reset_controller(None)
+        db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
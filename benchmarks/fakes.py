@@ -0,0 +1,288 @@
+"""
+In-process stand-ins of the Meross cloud, the SolarEdge API and the sun, with simulated latency and failures
+"""
+import asyncio
+import json
+import random
+from datetime import datetime, time
+from types import SimpleNamespace
+from meross_iot.controller.mixins.electricity import ElectricityMixin
+from meross_iot.model.credentials import MerossCloudCreds
+from meross_iot.model.enums import Namespace, OnlineStatus
+from meross_iot.model.exception import CommandTimeoutError
+from meross_iot.model.plugin.power import PowerInfo
+
+from app.modal import Modal
+from lib.Quota import QuotaBudget
+
+
+class Latency:
+    """ Seconds taken by the simulated cloud calls """
+    login = 1.0
+    list_devices = 0.3
+    abilities = 0.15  # per device, during discovery
+    update = 0.1  # per device
+    command = 0.1  # per device
+    metrics = 0.1  # per device
+    solaredge = 0.3
+
+
+class Failures:
+    """ Probability that a simulated call fails """
+    update = 0.0
+    command = 0.0
+    metrics = 0.0
+    solaredge = 0.0
+
+
+def _fail(rate: float, uuid: str, timeout: float) -> None:
+    if rate and random.random() < rate:
+        raise CommandTimeoutError('Simulated failure', uuid, timeout)
+
+
+class FakeMerossDevice:
+    """
+    Toggle device: like a real one, it pushes a CONTROL_TOGGLEX notification when its state changes
+    """
+
+    listener = None  # Called with the device, its new state and 'command' or 'manual' on every change
+
+    def __init__(self, uuid: str, name: str, on: bool = False):
+        self.uuid = uuid
+        self.name = name
+        self.type = 'mss310'
+        self.fwversion = '1.0.0'
+        self.hwversion = '1.0.0'
+        self.online_status = OnlineStatus.ONLINE
+        self.last_full_update_timestamp = None
+        self.updates = 0
+        self.__on = on
+        self.__handlers = []
+
+    def is_on(self) -> bool:
+        return self.__on
+
+    async def async_update(self, *args, **kwargs) -> None:
+        await asyncio.sleep(Latency.update)
+        _fail(Failures.update, self.uuid, Latency.update)
+        self.updates += 1
+        self.last_full_update_timestamp = datetime.now().timestamp()
+
+    async def async_turn_on(self, *args, **kwargs) -> None:
+        await asyncio.sleep(Latency.command)
+        _fail(Failures.command, self.uuid, Latency.command)
+        await self.async_toggle(True, 'command')
+
+    async def async_turn_off(self, *args, **kwargs) -> None:
+        await asyncio.sleep(Latency.command)
+        _fail(Failures.command, self.uuid, Latency.command)
+        await self.async_toggle(False, 'command')
+
+    async def async_toggle(self, on: bool, source: str = 'manual') -> None:
+        """
+        Change the state and push it, as the device does after a command or when its button is pressed
+        """
+        if on == self.__on:
+            return
+        self.__on = on
+        if FakeMerossDevice.listener is not None:
+            FakeMerossDevice.listener(self, on, source)
+        for handler in list(self.__handlers):
+            await handler(Namespace.CONTROL_TOGGLEX, {'togglex': [{'channel': 0, 'onoff': int(on)}]}, None)
+
+    def register_push_notification_handler_coroutine(self, coroutine) -> None:
+        self.__handlers.append(coroutine)
+
+    def unregister_push_notification_handler_coroutine(self, coroutine) -> None:
+        self.__handlers.remove(coroutine)
+
+
+class FakeMerossPlug(FakeMerossDevice, ElectricityMixin):
+    """ Toggle device with an electricity meter """
+
+    def __init__(self, uuid: str, name: str, on: bool = False, power: float = 500):
+        super().__init__(uuid, name, on)
+        self.power = power
+        self.__sample = None
+
+    async def async_get_instant_metrics(self, *args, **kwargs) -> PowerInfo:
+        await asyncio.sleep(Latency.metrics)
+        _fail(Failures.metrics, self.uuid, Latency.metrics)
+        power = self.power * random.uniform(0.9, 1.1) if self.is_on() else 0.0
+        self.__sample = PowerInfo(power / 230, 230.0, power, datetime.utcnow())
+        return self.__sample
+
+    def get_last_sample(self, *args, **kwargs) -> PowerInfo or None:
+        return self.__sample
+
+
+class FakeMerossHttpClient:
+    """ Same constructors as MerossHttpClient """
+
+    def __init__(self, cloud_credentials: MerossCloudCreds, **kwargs):
+        self.cloud_credentials = cloud_credentials
+        self.logins = 0
+
+    @classmethod
+    async def async_from_user_password(cls, email: str, password: str, **kwargs):
+        await asyncio.sleep(Latency.login)
+        client = cls(MerossCloudCreds('token', 'key', 'user', email, datetime.now(),
+                                      'https://iotx-eu.meross.com', 'mqtt-eu.meross.com'))
+        client.logins = 1
+        return client
+
+    async def async_logout(self) -> None:
+        await asyncio.sleep(Latency.list_devices)
+
+
+class FakeMerossManager:
+    """
+    Same discovery and registry dump as MerossManager, over `FakeMerossManager.count` devices
+    named as benchmarks.sqlite_database.populate names them, or as `FakeMerossManager.names`;
+    one out of `metered` has an electricity meter, drawing its `FakeMerossManager.usage` watts if given
+    """
+
+    count = 10
+    names = None
+    usage = None  # name -> watts
+    metered = 2
+    on = 0.5  # Probability that a device is on when discovered
+    discoveries = 0
+
+    def __init__(self, http_client: FakeMerossHttpClient, **kwargs):
+        self.__http_client = http_client
+        self.__devices = {}
+
+    async def async_init(self) -> None:
+        pass
+
+    async def async_device_discovery(self, *args, **kwargs) -> list:
+        FakeMerossManager.discoveries += 1
+        await asyncio.sleep(Latency.list_devices)
+        names = self.names if self.names is not None else [f'device-{i}' for i in range(self.count)]
+        for i, name in enumerate(names):
+            uuid = f'uuid-{i}'
+            if uuid not in self.__devices:
+                await asyncio.sleep(Latency.abilities)
+                self.__devices[uuid] = self.__create(uuid, name, on=random.random() < self.on)
+        return list(self.__devices.values())
+
+    def find_devices(self, online_status: OnlineStatus = None, **kwargs) -> list:
+        return [device for device in self.__devices.values()
+                if online_status is None or device.online_status == online_status]
+
+    def dump_device_registry(self, filename: str) -> None:
+        with open(filename, 'w') as file:
+            file.write(json.dumps([{'uuid': device.uuid, 'name': device.name}
+                                   for device in self.__devices.values()]))
+
+    def load_devices_from_dump(self, filename: str) -> None:
+        with open(filename, 'r') as file:
+            for data in json.loads(file.read()):
+                self.__devices[data['uuid']] = self.__create(data['uuid'], data['name'])
+
+    def close(self) -> None:
+        pass
+
+    def __create(self, uuid: str, name: str, on: bool = False) -> FakeMerossDevice:
+        index = int(uuid.rsplit('-', 1)[-1])
+        if self.metered and index % self.metered == 0:
+            power = self.usage[name] if self.usage is not None else 100 + (index * 37) % 2000
+            return FakeMerossPlug(uuid, name, on, power=power)
+        return FakeMerossDevice(uuid, name, on)
+
+
+class FakeSolarEdge:
+    """
+    Same interface as lib.SolarEdge.SolarEdge, over a simulated power flow:
+    the production wanders around `FakeSolarEdge.pv` watts
+    """
+
+    pv = 4000
+    load = 800
+
+    def __init__(self, api_token: str, site_id: int or str, home_default_load: int, daily_quota: int = 300,
+                 on_reading=None, **kwargs):
+        self.__home_default_load = home_default_load
+        self.__quota = QuotaBudget(daily_quota)
+        self.__on_reading = on_reading
+        self.requests = 0
+
+    @property
+    def quota(self) -> QuotaBudget:
+        return self.__quota
+
+    @property
+    def expires_at(self) -> datetime or None:
+        return None
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        return 0.0
+
+    async def async_get_current_power_flow(self, sunrise: time, sunset: time) -> dict or None:
+        self.requests += 1
+        await asyncio.sleep(Latency.solaredge)
+        if Failures.solaredge and random.random() < Failures.solaredge:
+            return None
+        pv = max(round(random.gauss(self.pv, self.pv * 0.1)), 0)
+        load = max(round(random.gauss(self.load, self.load * 0.1)), 0)
+        reading = {'PV': pv, 'LOAD': load, 'GRID': load - pv, 'unit': 'W'}
+        if self.__on_reading is not None:
+            self.__on_reading(reading)
+        return dict(reading)
+
+    async def async_close(self) -> None:
+        pass
+
+
+class FakeSun:
+    """ Same interface as lib.Sun.Sun, where the sun never sets """
+
+    def __init__(self, *args, **kwargs):
+        self.sunrise = time(0, 0)
+        self.sunset = time(23, 59, 59)
+
+    def sunrise_on(self, *args) -> time:
+        return self.sunrise
+
+    def sunset_on(self, *args) -> time:
+        return self.sunset
+
+    def is_day(self, *args, **kwargs) -> bool:
+        return True
+
+
+def fake_config(location: tuple = (41.90438, 12.49415, 1), lag_interval: float = 0.5, workers: int = 4):
+    """
+    The sections of Config as in config.json.sample, without webhook, metrics endpoint nor profiling
+    :param location: tuple | (latitude, longitude, timezone)
+    """
+    latitude, longitude, timezone = location
+    return SimpleNamespace(
+        env='development',
+        meross=SimpleNamespace(email='user@example.com', password='password', snapshot_file=None),
+        solaredge=SimpleNamespace(api_token='token', site_id=1, home_default_load=500, daily_quota=300,
+                                  cache_file=None),
+        sun=SimpleNamespace(latitude=latitude, longitude=longitude, timezone=timezone),
+        telegram=SimpleNamespace(token='123:benchmark', workers=workers),
+        health_check=SimpleNamespace(webhook_url=''),
+        sampler=SimpleNamespace(interval=30, capacity=720, window=3600),
+        metrics=SimpleNamespace(host='127.0.0.1', port=None),
+        profiler=SimpleNamespace(enabled=False, budget=5, directory='profiles', keep=50, lag_interval=lag_interval,
+                                 stall_threshold=0.1),
+        control=SimpleNamespace(turn_on_threshold=0, min_off_time=300)
+    )
+
+
+def create_modal(location: tuple = (41.90438, 12.49415, 1), lag_interval: float = 0.5, **kwargs) -> Modal:
+    """
+    A Modal configured by fake_config; the fakes replace the cloud services once installed on the modules
+    :param location: tuple | (latitude, longitude, timezone)
+    :param kwargs: Other arguments of Modal
+    """
+    config = fake_config(location, lag_interval)
+    kwargs.setdefault('turn_on_threshold', config.control.turn_on_threshold)
+    kwargs.setdefault('min_off_time', config.control.min_off_time)
+    return Modal(config.meross, config.solaredge, config.sun, config.health_check, config.sampler, config.metrics,
+                 config.profiler, **kwargs)
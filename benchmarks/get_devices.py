@@ -0,0 +1,64 @@
+"""
+controller.get_devices: legacy N+1 queries vs single snapshot
+
+    python -m benchmarks.get_devices [round-trip ms]
+
+SQLite has no loose index scan, so the snapshot GROUP BY reads the whole logs index here
+while MySQL reads ~2 index entries per device: the round-trip term is the one that matters.
+"""
+import sys
+import time
+
+from benchmarks.sqlite_database import SQLiteDatabase, populate
+from database.DAO import DAO
+import control.controller as controller
+
+LEGACY_ALL_DEVICES = "SELECT *, " \
+                       "(SELECT dtaDate " \
+                       "FROM logs l " \
+                       "WHERE l.intIdDevice = d.intIdDevice and boolState = 1 " \
+                       "ORDER BY dtaDate DESC " \
+                       "LIMIT 1) as dtaLastPowerOn " \
+                     "FROM devices d"
+
+ROUNDS = 20
+
+
+def legacy_get_devices(db, dao):
+    """ The previous controller.get_devices query pattern """
+    for row in db.fetchall(LEGACY_ALL_DEVICES):
+        dao.get_device_times_always_power_on(row.intIdDevice)
+
+
+def snapshot_get_devices():
+    controller.config_version = None  # Full snapshot, not the incremental sync
+    controller.get_devices()
+
+
+def measure(db, fn) -> tuple:
+    db.reset_stats()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn()
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    return db.queries // ROUNDS, elapsed * 1000
+
+
+def main():
+    latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.0005
+    print(f'Simulated round-trip: {latency * 1000} ms')
+    print(f"{'devices':>8} | {'legacy queries':>14} {'legacy ms':>10} | {'snapshot queries':>16} {'snapshot ms':>11}")
+    for count in (10, 100, 300, 1000):
+        db = SQLiteDatabase(latency)
+        populate(db, count)
+        dao = DAO(db)
+        controller.dao = dao
+
+        legacy = measure(db, lambda: legacy_get_devices(db, dao))
+        snapshot = measure(db, snapshot_get_devices)
+        print(f'{count:>8} | {legacy[0]:>14} {legacy[1]:>10.2f} | {snapshot[0]:>16} {snapshot[1]:>11.2f}')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Import time of every top-level module, each in a fresh interpreter (python -X importtime).
+Imports run in an empty directory, with no config.json: a module that needs it, or leaves a file behind,
+does I/O at import time.
+
+    python -m benchmarks.import_time [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGES = ('app', 'control', 'database', 'lib', 'obj')
+
+
+def modules() -> list:
+    names = ['main']
+    for package in PACKAGES:
+        for filename in sorted(os.listdir(os.path.join(ROOT, package))):
+            if filename.endswith('.py') and filename != '__init__.py':
+                names.append(f'{package}.{filename[:-3]}')
+    return names
+
+
+def measure(module: str, directory: str) -> tuple:
+    """
+    :return: tuple | (cumulative microseconds or None if the import failed, files left in the directory)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=directory, env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True, text=True)
+    files = os.listdir(directory)
+    for name in files:
+        os.remove(os.path.join(directory, name))
+    if result.returncode != 0:
+        return None, files
+
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]), files
+    return None, files
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print(f"{'module':<28} {'cumulative ms':>13}  I/O at import")
+    with tempfile.TemporaryDirectory() as directory:
+        for module in modules():
+            times, files = [], []
+            for _ in range(runs):
+                elapsed, created = measure(module, directory)
+                times.append(elapsed)
+                files += created
+            if None in times:
+                print(f'{module:<28} {"failed":>13}  import failed')
+            else:
+                print(f'{module:<28} {min(times) / 1000:>13.1f}  {", ".join(sorted(set(files))) or "-"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+PowerSampler over fake metered plugs: time of a sampling round, memory after days of samples,
+against keeping every PowerInfo in a list
+
+    python -m benchmarks.power_sampler
+"""
+import asyncio
+import random
+import time
+import tracemalloc
+from datetime import datetime
+from meross_iot.model.plugin.power import PowerInfo
+
+from control.PowerSampler import PowerSampler
+
+LATENCY = 0.05  # Seconds of a poll
+ROUNDS = 2880  # One day at 30 s
+
+
+class FakePlug:
+
+    def __init__(self, i: int):
+        self.uuid = f'uuid-{i}'
+        self.name = f'plug-{i}'
+        self.is_on = True
+        self.has_electricity_mixin = True
+        self.current_power_usage = random.choice((60, 400, 1200, 2000))
+        self.polls = 0
+
+    async def async_get_instant_metrics(self) -> PowerInfo:
+        self.polls += 1
+        await asyncio.sleep(LATENCY)
+        return self.metrics()
+
+    def metrics(self) -> PowerInfo:
+        return PowerInfo(1.2, 230.0, self.current_power_usage * random.uniform(0.8, 1.1), datetime.now())
+
+
+async def main():
+    print(f"{'plugs':>6} | {'round ms':>8} | {'sampler KB':>10} {'PowerInfo list KB':>17} | "
+          f"{'usage W':>7} {'p95 W':>7} {'nominal W':>9}")
+    for count in (10, 100, 300):
+        plugs = [FakePlug(i) for i in range(count)]
+        sampler = PowerSampler(lambda: plugs, interval=0, capacity=ROUNDS, concurrency=50)
+
+        start = time.perf_counter()
+        await sampler.async_sample()
+        round_ms = (time.perf_counter() - start) * 1000
+
+        # A day of samples, the buffers are full and stay that size
+        global LATENCY
+        latency, LATENCY = LATENCY, 0
+        for _ in range(ROUNDS + 100):
+            await sampler.async_sample()
+        sampler_bytes = sampler.stats['bytes']
+
+        tracemalloc.start()
+        history = {plug.uuid: [plug.metrics() for _ in range(ROUNDS)] for plug in plugs}
+        list_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del history
+        LATENCY = latency
+
+        plug = plugs[0]
+        print(f'{count:>6} | {round_ms:>8.1f} | {sampler_bytes / 1024:>10.0f} {list_bytes / 1024:>17.0f} | '
+              f'{sampler.usage(plug):>7} {sampler.get(plug).percentile("power", 0.95):>7.0f} '
+              f'{plug.current_power_usage:>9}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
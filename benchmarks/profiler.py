@@ -0,0 +1,66 @@
+"""
+Profiler: cost of the spans of a tick with profiling disabled and enabled,
+then a slow tick with a blocking call, written to disk with the stall attributed to its span
+
+    python -m benchmarks.profiler
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from lib.Metrics import Histogram
+from lib.Profiler import Profiler
+
+TICKS = 200
+
+
+async def tick(profiler: Profiler, devices: int, histogram: Histogram, block: float = 0.0) -> None:
+    async def command(i: int):
+        with profiler.span('update', histogram, device=f'device-{i}'):
+            await asyncio.sleep(0)
+            if i == 3 and block:
+                time.sleep(block)  # A blocking call on the event loop
+
+    with profiler.trace('tick', reasons=['benchmark']):
+        with profiler.span('sync', histogram):
+            pass
+        with profiler.span('update', histogram):
+            await asyncio.gather(*[command(i) for i in range(devices)])
+        with profiler.span('decide', histogram):
+            pass
+
+
+async def main():
+    histogram = Histogram()
+    print(f"{'devices':>7} | {'disabled ms':>11} {'enabled ms':>10} {'overhead':>8}")
+    for devices in (10, 100, 1000):
+        times = []
+        for enabled in (False, True):
+            profiler = Profiler(enabled, budget=60)
+            start = time.perf_counter()
+            for _ in range(TICKS):
+                await tick(profiler, devices, histogram)
+            times.append((time.perf_counter() - start) / TICKS * 1000)
+        print(f'{devices:>7} | {times[0]:>11.3f} {times[1]:>10.3f} {times[1] / times[0] - 1:>8.0%}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        profiler = Profiler(True, budget=0.2, directory=directory, lag_interval=0.05, stall_threshold=0.1)
+        profiler.start()
+        await asyncio.sleep(0.1)
+        await tick(profiler, 10, histogram, block=0.5)
+        await asyncio.sleep(0.2)  # Written in the background
+        await profiler.async_stop()
+
+        name = next(name for name in os.listdir(directory) if name.endswith('.json'))
+        with open(os.path.join(directory, name)) as file:
+            trace = json.load(file)
+        print(f"\nslow tick: {trace['duration_ms']:.0f} ms over a {trace['budget_ms']:.0f} ms budget, "
+              f"{len(trace['tasks'])} pending tasks, stats {profiler.stats}")
+        for stall in trace['stalls']:
+            print(f"  stall of {stall['duration_ms']:.0f} ms in {stall['span']}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,288 @@
+"""
+Replay of a day of SolarEdge readings, push notifications and Telegram lock commands
+through the real Modal, under a virtual clock: the commands it sends and the self-consumption it achieves
+
+    python -m benchmarks.replay [trace.jsonl | YYYY-MM-DD] [cache TTL s]
+
+A trace is JSON lines: the site and the devices, then the events of the day in order.
+LOAD is the load of the house without the controlled devices, whose power is added as they are turned on.
+
+    {"type": "site", "latitude": 41.90438, "longitude": 12.49415, "timezone": 1}
+    {"type": "device", "name": "boiler", "usage": 1500, "delay": 1800, "priority": 2, "solar": true}
+    {"date": "2026-06-21T06:05:00", "type": "power", "PV": 120, "LOAD": 300}
+    {"date": "2026-06-21T21:00:00", "type": "toggle", "device": "boiler", "on": true}
+    {"date": "2026-06-21T13:00:00", "type": "lock", "device": "boiler", "delay": 7200}
+    {"date": "2026-06-21T14:00:00", "type": "unlock", "device": "boiler"}
+
+Without a trace file, a synthetic day is generated.
+With a cache TTL, a reading is answered again for that many seconds, as the SolarEdge client does between
+two requests: the evaluations meanwhile see a load that misses the commands sent since.
+"""
+import asyncio
+import json
+import logging
+import math
+import random
+import sys
+import time
+from bisect import bisect_right
+from datetime import datetime, date, timedelta
+
+from benchmarks.fakes import FakeMerossDevice, FakeMerossHttpClient, FakeMerossManager, create_modal
+from benchmarks.sqlite_database import SQLiteDatabase
+from database.DAO import DAO
+from lib import Clock
+from lib.Quota import QuotaBudget
+from lib.Sun import Sun
+import app.modal as modal_module
+import control.controller as controller
+import control.Meross as meross_module
+
+
+class Meter:
+    """
+    Energy of the site, integrated between changes of the production, the base load or a device
+    """
+
+    def __init__(self, start: datetime):
+        self.__at = start
+        self.pv = 0
+        self.base = 0
+        self.devices = {}  # name -> watts drawn
+        self.produced = self.consumed = self.self_consumed = self.imported = self.exported = 0.0  # Wh
+
+    @property
+    def load(self) -> float:
+        return self.base + sum(self.devices.values())
+
+    def update(self) -> None:
+        now = Clock.now()
+        hours = (now - self.__at).total_seconds() / 3600
+        self.__at = now
+        load = self.load
+        self.produced += self.pv * hours
+        self.consumed += load * hours
+        self.self_consumed += min(self.pv, load) * hours
+        self.imported += max(load - self.pv, 0) * hours
+        self.exported += max(self.pv - load, 0) * hours
+
+
+class ReplaySolarEdge:
+    """
+    Same interface as lib.SolarEdge.SolarEdge, answering the reading of the trace in effect,
+    with the power of the controlled devices added to the load, cached for `ttl` seconds
+    """
+
+    readings = []  # (date, PV, base load), in order
+    meter = None
+    ttl = 0
+
+    def __init__(self, api_token: str, site_id: int or str, home_default_load: int, daily_quota: int = 300,
+                 on_reading=None, **kwargs):
+        self.__quota = QuotaBudget(daily_quota)
+        self.__on_reading = on_reading
+        self.__dates = [reading[0] for reading in self.readings]
+        self.__cached = None
+        self.__cached_until = None
+        self.__calls = 0
+        self.__hits = 0
+
+    @property
+    def quota(self) -> QuotaBudget:
+        return self.__quota
+
+    @property
+    def expires_at(self) -> datetime or None:
+        """ End of the cached reading, else date of the next reading """
+        now = Clock.now()
+        if self.__cached_until is not None and self.__cached_until > now:
+            return self.__cached_until
+        index = bisect_right(self.__dates, now)
+        return self.__dates[index] if index < len(self.__dates) else None
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        return self.__hits / self.__calls if self.__calls else 0.0
+
+    async def async_get_current_power_flow(self, sunrise, sunset) -> dict or None:
+        now = Clock.now()
+        self.__calls += 1
+        if self.__cached_until is not None and self.__cached_until > now:
+            self.__hits += 1
+            return dict(self.__cached)
+
+        index = bisect_right(self.__dates, now) - 1
+        if index < 0:
+            return None
+        pv = self.readings[index][1]
+        load = round(self.meter.load)
+        reading = {'PV': pv, 'LOAD': load, 'GRID': load - pv, 'unit': 'W'}
+        if self.ttl:
+            self.__cached, self.__cached_until = reading, now + timedelta(seconds=self.ttl)
+        if self.__on_reading is not None:
+            self.__on_reading(reading)
+        return dict(reading)
+
+    async def async_close(self) -> None:
+        pass
+
+
+def load_trace(filename: str) -> tuple:
+    """
+    :return: tuple | (site, devices, events ordered by date)
+    """
+    site, devices, events = None, [], []
+    with open(filename, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['type'] == 'site':
+                site = record
+            elif record['type'] == 'device':
+                devices.append(record)
+            else:
+                record['date'] = datetime.fromisoformat(record['date'])
+                events.append(record)
+    events.sort(key=lambda event: event['date'])
+    return site, devices, events
+
+
+def synthetic_trace(day: date, seed: int = 1) -> tuple:
+    """
+    A sunny day with passing clouds, meals on the base load, a button pressed and a device locked
+    """
+    rng = random.Random(seed)
+    site = {'type': 'site', 'latitude': 41.90438, 'longitude': 12.49415, 'timezone': 1}
+    devices = [
+        {'type': 'device', 'name': 'boiler', 'usage': 1500, 'delay': 1800, 'priority': 2, 'solar': True},
+        {'type': 'device', 'name': 'washing machine', 'usage': 2000, 'delay': 3600, 'priority': 1, 'solar': True},
+        {'type': 'device', 'name': 'car charger', 'usage': 2300, 'delay': 1800, 'priority': 1, 'solar': True},
+        {'type': 'device', 'name': 'pool pump', 'usage': 800, 'delay': 900, 'priority': 0, 'solar': True},
+        {'type': 'device', 'name': 'dehumidifier', 'usage': 300, 'delay': 600, 'priority': 0, 'solar': True},
+        {'type': 'device', 'name': 'heat pump', 'usage': 1200, 'delay': 1200, 'priority': 0, 'solar': True},
+    ]
+
+    sun = Sun(site['latitude'], site['longitude'], site['timezone'])
+    midnight = datetime.combine(day, datetime.min.time())
+    sunrise = datetime.combine(day, sun.sunrise_on(day))
+    sunset = datetime.combine(day, sun.sunset_on(day))
+    events, clouds = [], 1.0
+    for minute in range(0, 24 * 60, 5):
+        moment = midnight + timedelta(minutes=minute)
+        clouds = min(max(clouds + rng.uniform(-0.15, 0.15), 0.3), 1.0)
+        elevation = (moment - sunrise) / (sunset - sunrise)
+        pv = round(6000 * math.sin(math.pi * elevation) * clouds) if 0 < elevation < 1 else 0
+        meal = 1500 if moment.hour in (13, 20) else 0
+        events.append({'date': moment, 'type': 'power', 'PV': pv, 'LOAD': round(rng.uniform(200, 400)) + meal})
+    events.append({'date': midnight + timedelta(hours=21), 'type': 'toggle', 'device': 'dehumidifier', 'on': True})
+    events.append({'date': midnight + timedelta(hours=11), 'type': 'lock', 'device': 'car charger', 'delay': 7200})
+    events.sort(key=lambda event: event['date'])
+    return site, devices, events
+
+
+def create_database(devices: list) -> SQLiteDatabase:
+    db = SQLiteDatabase(0)
+    for device in devices:
+        db.execute("INSERT INTO devices (strName, intUsage, timeDelayBeforePowerOff, boolSolarPowerOn, intPriority) "
+                   "VALUES (%s, %s, %s, %s, %s)",
+                   device['name'], device['usage'], str(timedelta(seconds=device.get('delay', 0))),
+                   int(device.get('solar', True)), device.get('priority', 0))
+    return db
+
+
+async def replay(site: dict, devices: list, events: list) -> tuple:
+    """
+    :return: tuple | (commands as (date, device name, on), Meter)
+    """
+    start = Clock.now()
+    db = create_database(devices)
+    controller.dao = DAO(db)
+
+    meter = Meter(start)
+    commands = []
+
+    def on_toggle(device: FakeMerossDevice, on: bool, source: str) -> None:
+        meter.update()
+        meter.devices[device.name] = usage[device.name] if on else 0
+        if source == 'command':
+            commands.append((Clock.now(), device.name, on))
+
+    usage = {device['name']: device['usage'] for device in devices}
+    FakeMerossDevice.listener = on_toggle
+    FakeMerossManager.names = [device['name'] for device in devices]
+    FakeMerossManager.usage = usage
+    FakeMerossManager.metered = 1
+    FakeMerossManager.on = 0
+    ReplaySolarEdge.readings = [(event['date'], event['PV'], event['LOAD']) for event in events
+                                if event['type'] == 'power']
+    ReplaySolarEdge.meter = meter
+
+    modal = create_modal((site['latitude'], site['longitude'], site['timezone']), lag_interval=60, align=True)
+    await modal.async_init()
+    manager = modal._Modal__manager
+
+    for event in events:
+        await asyncio.sleep((event['date'] - Clock.now()).total_seconds())
+        if event['type'] == 'power':
+            meter.update()
+            meter.pv, meter.base = event['PV'], event['LOAD']
+            continue
+
+        device = manager.get_device_by_name(event['device'])
+        if device is None:
+            continue
+        if event['type'] == 'toggle':
+            await device.get().async_toggle(event['on'])
+        elif event['type'] == 'lock':
+            modal.lock_device(device.id, event.get('delay', 0))
+        elif event['type'] == 'unlock':
+            modal.unlock_device(device.id)
+
+    end = datetime.combine(start.date(), datetime.min.time()) + timedelta(days=1)
+    await asyncio.sleep((end - Clock.now()).total_seconds())
+    meter.update()
+    await modal.async_close()
+    db.close()
+    return commands, meter
+
+
+def main():
+    argument = sys.argv[1] if len(sys.argv) > 1 else None
+    if argument is not None and argument.endswith('.jsonl'):
+        site, devices, events = load_trace(argument)
+    else:
+        site, devices, events = synthetic_trace(date.fromisoformat(argument) if argument else date(2026, 6, 21))
+    day = events[0]['date'].date()
+    ReplaySolarEdge.ttl = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    meross_module.MerossHttpClient = FakeMerossHttpClient
+    meross_module.MerossManager = FakeMerossManager
+    modal_module.SolarEdge = ReplaySolarEdge
+    logging.disable(logging.WARNING)
+
+    clock = Clock.VirtualClock(datetime.combine(day, datetime.min.time()))
+    Clock.set_clock(clock)
+    loop = asyncio.new_event_loop()
+    clock.install(loop)
+    began = time.perf_counter()
+    try:
+        commands, meter = loop.run_until_complete(replay(site, devices, events))
+    finally:
+        loop.close()
+        Clock.set_clock(Clock.SystemClock())
+    elapsed = time.perf_counter() - began
+
+    print(f'{day}: {clock.monotonic():.0f} s replayed in {elapsed:.2f} s ({clock.monotonic() / elapsed:.0f}x), '
+          f'{len(devices)} devices, {len(events)} events, SolarEdge cache TTL {ReplaySolarEdge.ttl} s')
+    print(f'{len(commands)} commands')
+    for moment, name, on in commands:
+        print(f"  {moment:%H:%M:%S} {'turn on ' if on else 'turn off'} {name}")
+    print(f'PV {meter.produced / 1000:.1f} kWh, load {meter.consumed / 1000:.1f} kWh, '
+          f'self-consumed {meter.self_consumed / 1000:.1f} kWh '
+          f'({meter.self_consumed / meter.produced if meter.produced else 0:.0%} of PV), '
+          f'grid import {meter.imported / 1000:.1f} kWh, export {meter.exported / 1000:.1f} kWh')
+
+
+if __name__ == '__main__':
+    main()
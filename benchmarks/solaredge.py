@@ -0,0 +1,113 @@
+"""
+SolarEdge client against a local fake monitoring API:
+shared cache, latency, timeouts, retries and circuit breaker
+
+    python -m benchmarks.solaredge
+"""
+import asyncio
+import time
+from datetime import datetime, time as dtime
+from aiohttp import web
+
+from lib.SolarEdge import SolarEdge
+
+REQUESTS = 200
+POWER_FLOW = {'siteCurrentPowerFlow': {'unit': 'kW',
+                                       'PV': {'currentPower': 3.2},
+                                       'LOAD': {'currentPower': 1.1},
+                                       'GRID': {'currentPower': 0.0}}}
+
+
+class FakeSolarEdgeServer:
+    """
+    Serves currentPowerFlow.json, optionally slow or failing
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self.status = 200
+        self.payload = POWER_FLOW
+        self.requests = 0
+        self.connections = set()
+        self.__runner = None
+        self.port = None
+
+    async def __handler(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.connections.add(request.transport.get_extra_info('peername'))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.status != 200:
+            return web.Response(status=self.status)
+        return web.json_response(self.payload)
+
+    async def async_start(self) -> None:
+        app = web.Application()
+        app.router.add_get('/site/{site_id}/currentPowerFlow.json', self.__handler)
+        self.__runner = web.AppRunner(app)
+        await self.__runner.setup()
+        site = web.TCPSite(self.__runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def async_stop(self) -> None:
+        await self.__runner.cleanup()
+
+
+async def main():
+    server = FakeSolarEdgeServer()
+    await server.async_start()
+    client = SolarEdge('token', 1, 500, connect_timeout=1, read_timeout=0.5, retries=2, backoff=0.05,
+                       daily_quota=10000, base_url=f'http://127.0.0.1:{server.port}')
+    day = (dtime.min, dtime.max)
+
+    # Cached power flow: concurrent callers share one request
+    await asyncio.gather(*[client.async_get_current_power_flow(*day) for _ in range(REQUESTS)])
+    print(f'cache: {REQUESTS} calls, {server.requests} request(s), hit ratio {client.cache_hit_ratio:.3f}, '
+          f'next refresh in {(client.expires_at - datetime.now()).total_seconds():.0f} s, '
+          f'{client.quota.remaining} requests left today')
+
+    # Healthy API: one kept-alive connection for every request
+    for _ in range(REQUESTS):
+        client.invalidate()
+        assert (await client.async_get_current_power_flow(*day))['PV'] == 3200
+    latency = client.latency
+    print(f'healthy: {REQUESTS} requests over {len(server.connections)} connection(s), '
+          f'p50 {latency.quantile(0.5) * 1000:.2f} ms, p99 {latency.quantile(0.99) * 1000:.2f} ms')
+
+    # Slow API: read timeout, then retries, the event loop keeps running meanwhile
+    server.delay, server.requests = 2, 0
+    client.invalidate()
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    result = await client.async_get_current_power_flow(*day)
+    print(f'slow: result {result} after {time.perf_counter() - start:.2f} s and {server.requests} attempts, '
+          f'{ticks} loop ticks meanwhile')
+    task.cancel()
+
+    # Failing API: the circuit opens and the next calls do not reach the server
+    server.delay, server.status = 0, 500
+    for _ in range(5):
+        client.invalidate()
+        await client.async_get_current_power_flow(*day)
+    server.requests = 0
+    client.invalidate()
+    start = time.perf_counter()
+    result = await client.async_get_current_power_flow(*day)
+    print(f'failing: circuit {client.breaker.state}, result {result} in {(time.perf_counter() - start) * 1000:.2f} ms, '
+          f'{server.requests} requests sent')
+
+    await client.async_close()
+    await server.async_stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
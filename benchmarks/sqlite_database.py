@@ -0,0 +1,194 @@
+import re
+import sqlite3
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE devices (
+  intIdDevice INTEGER PRIMARY KEY AUTOINCREMENT,
+  strName varchar(50) NOT NULL,
+  intUsage int NOT NULL,
+  timeDelayBeforePowerOff time NOT NULL DEFAULT '00:00:00',
+  boolSolarPowerOn tinyint NOT NULL DEFAULT 1,
+  intPriority int NOT NULL DEFAULT 0,
+  boolDisable tinyint NOT NULL DEFAULT 0
+);
+CREATE TABLE logs (
+  intIdDevice int NOT NULL,
+  dtaDate datetime NOT NULL DEFAULT current_timestamp,
+  boolState tinyint NOT NULL,
+  PRIMARY KEY (intIdDevice, dtaDate, boolState)
+);
+CREATE INDEX idxLastState ON logs (intIdDevice, boolState, dtaDate);
+CREATE TABLE timesalwayspoweron (
+  intIdDevice int NOT NULL,
+  timePowerOn time NOT NULL,
+  timePowerOff time NOT NULL,
+  boolDisable tinyint NOT NULL DEFAULT 0,
+  PRIMARY KEY (intIdDevice, timePowerOn, timePowerOff)
+);
+CREATE TABLE attributes (
+  strIdAttribute varchar(25) NOT NULL,
+  intIdDevice int NOT NULL,
+  strText varchar(50) NULL,
+  strValue varchar(50) NULL,
+  dtaLastUpdate datetime DEFAULT NULL,
+  boolDisable tinyint DEFAULT 0 NOT NULL,
+  PRIMARY KEY (strIdAttribute, intIdDevice)
+);
+CREATE TABLE configchanges (
+  intIdChange INTEGER PRIMARY KEY AUTOINCREMENT,
+  intIdDevice int NOT NULL,
+  dtaDate datetime NOT NULL DEFAULT current_timestamp
+);
+CREATE TRIGGER trgDevicesInsert AFTER INSERT ON devices
+  BEGIN INSERT INTO configchanges (intIdDevice) VALUES (NEW.intIdDevice); END;
+CREATE TRIGGER trgDevicesUpdate AFTER UPDATE ON devices
+  BEGIN INSERT INTO configchanges (intIdDevice) VALUES (NEW.intIdDevice); END;
+CREATE TRIGGER trgDevicesDelete AFTER DELETE ON devices
+  BEGIN INSERT INTO configchanges (intIdDevice) VALUES (OLD.intIdDevice); END;
+CREATE TRIGGER trgTimesInsert AFTER INSERT ON timesalwayspoweron
+  BEGIN INSERT INTO configchanges (intIdDevice) VALUES (NEW.intIdDevice); END;
+CREATE TRIGGER trgTimesUpdate AFTER UPDATE ON timesalwayspoweron
+  BEGIN INSERT INTO configchanges (intIdDevice) VALUES (NEW.intIdDevice); END;
+CREATE TRIGGER trgTimesDelete AFTER DELETE ON timesalwayspoweron
+  BEGIN INSERT INTO configchanges (intIdDevice) VALUES (OLD.intIdDevice); END;
+CREATE TABLE powersamples (
+  strSeries varchar(32) NOT NULL,
+  dtaDate datetime NOT NULL,
+  dblValue double NOT NULL,
+  PRIMARY KEY (strSeries, dtaDate)
+);
+CREATE INDEX idxSamplesDate ON powersamples (dtaDate);
+CREATE TABLE powerrollups (
+  intResolution int NOT NULL,
+  strSeries varchar(32) NOT NULL,
+  dtaDate datetime NOT NULL,
+  intCount int NOT NULL,
+  dblSum double NOT NULL,
+  dblMin double NOT NULL,
+  dblMax double NOT NULL,
+  PRIMARY KEY (intResolution, strSeries, dtaDate)
+);
+CREATE INDEX idxRollupsDate ON powerrollups (intResolution, dtaDate);
+CREATE TABLE users (
+  strIdTelegram varchar(15) NOT NULL PRIMARY KEY,
+  strName varchar(50) NOT NULL
+);
+"""
+
+
+def _to_timedelta(value: bytes) -> timedelta:
+    hours, minutes, seconds = (int(x) for x in value.decode().split(':'))
+    return timedelta(hours=hours, minutes=minutes, seconds=seconds)
+
+
+def _to_datetime(value: bytes) -> datetime:
+    return datetime.fromisoformat(value.decode())
+
+
+def _translate(sql: str) -> str:
+    """
+    MySQL statements used by the DAO, in SQLite syntax
+    """
+    sql = sql.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE')
+    sql = sql.replace('ON DUPLICATE KEY UPDATE', 'ON CONFLICT DO UPDATE SET')
+    sql = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', sql)
+    return sql.replace('LEAST(', 'MIN(').replace('GREATEST(', 'MAX(')
+
+
+sqlite3.register_converter('time', _to_timedelta)
+sqlite3.register_converter('datetime', _to_datetime)
+
+
+class SQLiteDatabase:
+    """
+    In-memory stand-in for database.Database, with the same interface,
+    named tuple rows and MySQL-like TIME/DATETIME values.
+    Counts the queries it runs, the bytes they return (as text, like the MySQL protocol) and the time spent on them.
+    :param latency: seconds | Simulated network round-trip added to every query
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.__latency = latency
+        self.__db = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self.__db.executescript(SCHEMA)
+        self.__rows = {}
+
+        self.queries = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    def __row_factory(self, cursor, row):
+        fields = tuple(column[0] for column in cursor.description)
+        if fields not in self.__rows:
+            self.__rows[fields] = namedtuple('Row', fields)
+        self.bytes += sum(len(str(value)) for value in row if value is not None)
+        row = [datetime.fromisoformat(value) if field.startswith('dta') and isinstance(value, str) else value
+               for field, value in zip(fields, row)]  # Computed datetimes (MAX(dtaDate)) have no declared type
+        return self.__rows[fields](*row)
+
+    def reset_stats(self) -> None:
+        self.queries = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    @property
+    def stats(self) -> dict:
+        return {'queries': self.queries, 'bytes': self.bytes, 'elapsed': self.elapsed}
+
+    def __execute(self, sql, args):
+        start = time.perf_counter()
+        cursor = self.__db.cursor()
+        cursor.row_factory = self.__row_factory
+        cursor.execute(_translate(sql), args)
+        if self.__latency:
+            time.sleep(self.__latency)
+        self.queries += 1
+        self.elapsed += time.perf_counter() - start
+        return cursor
+
+    def fetchall(self, sql, *args) -> list:
+        return self.__execute(sql, args).fetchall()
+
+    def fetchone(self, sql, *args):
+        return self.__execute(sql, args).fetchone()
+
+    def execute(self, sql, *args) -> int:
+        cursor = self.__execute(sql, args)
+        self.__db.commit()
+        return cursor.rowcount
+
+    def executemany(self, sql, rows: list) -> int:
+        start = time.perf_counter()
+        cursor = self.__db.executemany(_translate(sql), rows)
+        self.__db.commit()
+        if self.__latency:
+            time.sleep(self.__latency)
+        self.queries += 1
+        self.elapsed += time.perf_counter() - start
+        return cursor.rowcount
+
+    def warm_up(self, connections: int = 1) -> None:
+        pass
+
+    def close(self):
+        self.__db.close()
+
+
+def populate(db: SQLiteDatabase, devices: int, logs_per_device: int = 500, times_per_device: int = 2) -> None:
+    """
+    Fill the database with synthetic devices, on/off logs and times always power on
+    """
+    now = datetime.now().replace(microsecond=0)
+    for i in range(devices):
+        db.execute("INSERT INTO devices (strName, intUsage, timeDelayBeforePowerOff) VALUES (%s, %s, %s)",
+                   f'device-{i}', 100 + (i * 37) % 2000, '00:15:00')
+    db.executemany("INSERT INTO logs (intIdDevice, dtaDate, boolState) VALUES (%s, %s, %s)",
+                   [(i + 1, str(now - timedelta(hours=j)), j % 2)
+                    for i in range(devices) for j in range(logs_per_device)])
+    db.executemany("INSERT INTO timesalwayspoweron (intIdDevice, timePowerOn, timePowerOff) VALUES (%s, %s, %s)",
+                   [(i + 1, f'{8 + j * 4:02}:00:00', f'{9 + j * 4:02}:30:00')
+                    for i in range(devices) for j in range(times_per_device)])
+    db.reset_stats()
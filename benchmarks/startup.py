@@ -0,0 +1,77 @@
+"""
+Meross startup: cold login and discovery vs warm start from the snapshot,
+until every device has a known state and the first decision can be taken
+
+    python -m benchmarks.startup
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import FakeMerossHttpClient, FakeMerossManager
+from benchmarks.sqlite_database import SQLiteDatabase, populate
+from database.DAO import DAO
+from lib.Timer import TimerService
+import control.controller as controller
+import control.Meross as meross_module
+
+CONCURRENCY = 10
+
+
+async def start(snapshot_file: str) -> tuple:
+    """
+    :return: tuple | (seconds to the first decision, seconds until validated, device updates, discoveries)
+    """
+    FakeMerossManager.discoveries = 0
+    meross = meross_module.Meross('user@example.com', 'password', TimerService(), snapshot_file=snapshot_file)
+
+    start_time = time.perf_counter()
+    await meross.async_init()
+    devices = meross.find_devices()
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def update(device):
+        async with semaphore:
+            await device.async_update()
+
+    await asyncio.gather(*[update(device) for device in devices])
+    assert all(device.is_on in (True, False) for device in devices)
+    ready = time.perf_counter() - start_time
+
+    refresh = meross._Meross__refresh_task
+    if refresh is not None:
+        await refresh
+    validated = time.perf_counter() - start_time
+    updates = sum(device.get().updates for device in devices)
+
+    await meross.async_stop()
+    return ready, validated, updates, FakeMerossManager.discoveries
+
+
+async def main():
+    meross_module.MerossHttpClient = FakeMerossHttpClient
+    meross_module.MerossManager = FakeMerossManager
+    logging.disable(logging.INFO)
+
+    print(f"{'devices':>8} | {'cold ready s':>12} {'updates':>7} | "
+          f"{'warm ready s':>12} {'validated s':>11} {'updates':>7}")
+    for count in (10, 50, 100):
+        db = SQLiteDatabase(0)
+        populate(db, count, logs_per_device=1)
+        controller.dao = DAO(db)
+        controller.config_version = None
+        FakeMerossManager.count = count
+
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_file = os.path.join(directory, 'meross.json')
+            cold = await start(snapshot_file)  # No snapshot yet, writes it
+            warm = await start(snapshot_file)
+        print(f'{count:>8} | {cold[0]:>12.3f} {cold[2]:>7} | {warm[0]:>12.3f} {warm[1]:>11.3f} {warm[2]:>7}')
+        db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,47 @@
+"""
+lib.Sun: sunrise and sunset of random dates, computed on every call vs looked up in the year tables
+
+    python -m benchmarks.sun [lookups]
+"""
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from lib.Sun import Sun, year_table, _calc, _SUNRISE, _SUNSET
+
+LATITUDE, LONGITUDE, TIMEZONE = 41.90438, 12.49415, 1
+
+
+def main():
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    first = date(2020, 1, 1)
+    days = [first + timedelta(days=random.randrange(366 * 5)) for _ in range(lookups)]
+    sun = Sun(LATITUDE, LONGITUDE, TIMEZONE)
+
+    start = time.perf_counter()
+    for day in days:
+        _calc(LATITUDE, LONGITUDE, TIMEZONE, day, _SUNRISE)
+        _calc(LATITUDE, LONGITUDE, TIMEZONE, day, _SUNSET)
+    computed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for year in range(2020, 2026):
+        year_table(LATITUDE, LONGITUDE, TIMEZONE, year)
+    tables = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for day in days:
+        sun.sunrise_on(day)
+        sun.sunset_on(day)
+    looked_up = time.perf_counter() - start
+
+    sunrises, sunsets = year_table(LATITUDE, LONGITUDE, TIMEZONE, 2020)
+    print(f'{lookups} dates over 5 years')
+    print(f'computed:  {computed / lookups * 1e6:.2f} us/date')
+    print(f'tables:    {tables * 1000:.1f} ms for 6 years, {sunrises.itemsize * (len(sunrises) + len(sunsets))} bytes/year')
+    print(f'looked up: {looked_up / lookups * 1e6:.2f} us/date')
+
+
+if __name__ == '__main__':
+    main()
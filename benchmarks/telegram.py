@@ -0,0 +1,161 @@
+"""
+Telegram handler latency under a burst of callback queries, from the update being received
+to its last answer, with 1 dispatcher worker (one update at a time) and with a pool of workers.
+The real App runs over the fake Meross cloud and SolarEdge, the SQLite DAO and a fake Bot API,
+with the control loop running on its own thread.
+
+    python -m benchmarks.telegram [callbacks] [Bot API round-trip ms]
+"""
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+from telegram import Update
+from telegram.ext import ExtBot, Updater
+from telegram.utils.request import Request
+
+from benchmarks.control_loop import percentile, reset_controller
+from benchmarks.fakes import FakeMerossHttpClient, FakeMerossManager, FakeSolarEdge, FakeSun, Latency, fake_config
+from benchmarks.sqlite_database import SQLiteDatabase, populate
+from database.DAO import DAO
+import app.App as app_module
+import app.modal as modal_module
+import control.Meross as meross_module
+import database.DAO as dao_module
+
+WORKERS = (1, 4, 8)
+DEVICES = 20
+USERS = 4
+
+
+class TelegramRequest(Request):
+    """
+    The Bot API, answering every method after `latency` seconds, and recording when each callback query is answered
+    """
+
+    latency = 0.05
+    answered = {}  # callback query id -> perf_counter() of its last answer
+    condition = threading.Condition()
+
+    def post(self, url: str, data: dict, timeout: float = None):
+        time.sleep(self.latency)
+        if url.endswith('/getMe'):
+            return {'id': 123, 'is_bot': True, 'first_name': 'benchmark', 'username': 'benchmark_bot'}
+        if url.endswith('/answerCallbackQuery'):
+            with self.condition:
+                self.answered[data['callback_query_id']] = time.perf_counter()
+                self.condition.notify_all()
+        return True
+
+
+class OfflineUpdater(Updater):
+    """ An Updater whose updates are put on its queue by the benchmark instead of being polled """
+
+    def start_polling(self, *args, **kwargs):
+        self.running = True
+        threading.Thread(target=self.dispatcher.start, name='dispatcher', daemon=True).start()
+        return self.update_queue
+
+
+def callback_query(update_id: int, user_id: int, data: str, bot: ExtBot) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user-{user_id}'},
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {'message_id': update_id, 'date': int(time.time()), 'text': '',
+                        'chat': {'id': user_id, 'type': 'private'}}
+        }
+    }, bot)
+
+
+def burst(count: int) -> list:
+    """
+    :return: list | (user id, callback data): device pages mostly, the menu, past days, the lock flow
+    """
+    callbacks = []
+    for _ in range(count):
+        device_id = random.randint(1, DEVICES)
+        data = random.choices([f'device|{device_id}|0', 'menu', f'device|{device_id}|-1', f'lock|{device_id}',
+                               f'lock|{device_id}|30', f'unlock|{device_id}'], weights=(50, 20, 10, 10, 5, 5))[0]
+        callbacks.append((1000 + random.randrange(USERS), data))
+    return callbacks
+
+
+def run(workers: int, callbacks: list, db_latency: float) -> tuple:
+    """
+    :return: tuple | (latencies in ms, seconds to answer the whole burst)
+    """
+    db = SQLiteDatabase(db_latency)
+    populate(db, DEVICES, logs_per_device=50)
+    for user_id in range(1000, 1000 + USERS):
+        db.execute("INSERT INTO users (strIdTelegram, strName) VALUES (%s, %s)", str(user_id), f'user-{user_id}')
+    dao_module._database = db
+    reset_controller(DAO(db))
+    FakeMerossManager.count = DEVICES
+
+    TelegramRequest.answered = {}
+
+    def updater(token: str, workers: int, defaults) -> Updater:
+        request = TelegramRequest(con_pool_size=workers + 4)
+        return OfflineUpdater(bot=ExtBot(token, request=request, defaults=defaults), workers=workers)
+
+    app_module.get_config = lambda: fake_config(workers=workers)
+    app_module.Updater = updater
+    loop = asyncio.new_event_loop()
+    app = app_module.App(loop, align=False)
+    thread = threading.Thread(target=loop.run_forever, name='loop', daemon=True)
+    thread.start()
+    time.sleep(0.5)  # First evaluation
+
+    bot = app._App__updater.bot
+    updates = [callback_query(i, user_id, data, bot) for i, (user_id, data) in enumerate(callbacks)]
+    received = {}
+    start = time.perf_counter()
+    for update in updates:
+        received[update.callback_query.id] = time.perf_counter()
+        app._App__updater.update_queue.put(update)
+    with TelegramRequest.condition:
+        TelegramRequest.condition.wait_for(lambda: len(TelegramRequest.answered) == len(updates), timeout=120)
+    elapsed = time.perf_counter() - start
+
+    answered = TelegramRequest.answered
+    latencies = [(answered[query_id] - at) * 1000 for query_id, at in received.items() if query_id in answered]
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    app.close()
+    loop.close()
+    reset_controller(None)
+    return latencies, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    TelegramRequest.latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.05
+    db_latency = 0.002
+    Latency.login = Latency.list_devices = Latency.abilities = 0
+    Latency.update = Latency.command = Latency.metrics = 0.02
+    Latency.solaredge = 0.05
+    meross_module.MerossHttpClient = FakeMerossHttpClient
+    meross_module.MerossManager = FakeMerossManager
+    modal_module.SolarEdge = FakeSolarEdge
+    modal_module.Sun = FakeSun
+    logging.disable(logging.WARNING)
+    random.seed(1)
+    callbacks = burst(count)
+
+    print(f'{count} callback queries from {USERS} users at once, Bot API {TelegramRequest.latency * 1000:.0f} ms, '
+          f'database {db_latency * 1000:.0f} ms, {DEVICES} devices')
+    print(f"{'workers':>7} | {'p50 ms':>8} {'p99 ms':>8} {'burst s':>8} {'answered':>8}")
+    for workers in WORKERS:
+        latencies, elapsed = run(workers, callbacks, db_latency)
+        print(f'{workers:>7} | {percentile(latencies, 0.5):>8.0f} {percentile(latencies, 0.99):>8.0f} '
+              f'{elapsed:>8.2f} {len(latencies):>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+TimeSeries: insert throughput with batched writes and incremental rollups,
+then the mean power over the days from the daily rollups vs from the raw samples
+
+    python -m benchmarks.timeseries [devices] [days]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.sqlite_database import SQLiteDatabase
+from database.DAO import DAO
+from database.TimeSeries import TimeSeries, RAW, MINUTE, HOUR, DAY
+
+SAMPLE_INTERVAL = 60  # Seconds between two samples of a device
+QUERIES = 20
+
+
+def main():
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    db = SQLiteDatabase(0.0005)
+    dao = DAO(db)
+    keep = {RAW: None, MINUTE: None, HOUR: None, DAY: None}  # Nothing expires, to compare with the raw samples
+    timeseries = TimeSeries(dao, retention=keep, batch_size=5000, interval=1)
+
+    end = datetime.now().replace(second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    samples = 0
+    began = time.perf_counter()
+    date = start
+    while date < end:
+        for device in range(devices):
+            timeseries.record(f'device.{device}', random.uniform(50, 2000), date)
+            samples += 1
+        date += timedelta(seconds=SAMPLE_INTERVAL)
+    timeseries.flush()
+    elapsed = time.perf_counter() - began
+    print(f'insert: {samples} samples of {devices} devices over {days} days in {elapsed:.1f} s, '
+          f'{samples / elapsed:.0f} samples/s, {timeseries.stats["batches"]} batches, {db.queries} queries')
+
+    for name, table, where in (('raw', 'powersamples', ''), ('1 minute', 'powerrollups', 'WHERE intResolution = 60'),
+                               ('1 hour', 'powerrollups', 'WHERE intResolution = 3600'),
+                               ('1 day', 'powerrollups', 'WHERE intResolution = 86400')):
+        print(f'  {name:>8}: {db.fetchone(f"SELECT COUNT(*) as n FROM {table} {where}").n} rows')
+
+    for name, resolution in (('raw samples', RAW), ('daily rollups', DAY)):
+        db.reset_stats()
+        began = time.perf_counter()
+        for i in range(QUERIES):
+            rows = timeseries.query(f'device.{i % devices}', start, end, resolution)
+            mean = sum(row.mean * row.count for row in rows) / sum(row.count for row in rows)
+        elapsed = (time.perf_counter() - began) / QUERIES
+        print(f'{days} day mean from {name}: {elapsed * 1000:.2f} ms, {len(rows)} rows, '
+              f'{db.bytes / QUERIES / 1024:.0f} KB read per query, mean {mean:.0f} W')
+
+    timeseries.close()
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
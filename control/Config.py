@@ -1,5 +1,5 @@
 import json
-import requests
+from functools import lru_cache
 
 FILENAME = 'config.json'
 
@@ -11,9 +11,11 @@ class Config:
         def __init__(self, config):
             self.__email = config['email']
             self.__password = config['password']
+            self.__snapshot_file = config.get('snapshot_file', 'meross.json')
 
         email = property(lambda self: self.__email)
         password = property(lambda self: self.__password)
+        snapshot_file = property(lambda self: self.__snapshot_file)
 
     class __SolarEdgeConfig:
 
@@ -21,10 +23,14 @@ class Config:
             self.__api_token = config['api_token']
             self.__site_id = config['site_id']
             self.__home_default_load = config['home_default_load']
+            self.__daily_quota = config.get('daily_quota', 300)
+            self.__cache_file = config.get('cache_file', 'solaredge.json')
 
         api_token = property(lambda self: self.__api_token)
         site_id = property(lambda self: self.__site_id)
         home_default_load = property(lambda self: self.__home_default_load)
+        daily_quota = property(lambda self: self.__daily_quota)
+        cache_file = property(lambda self: self.__cache_file)
 
     class __Sun:
 
@@ -41,8 +47,10 @@ class Config:
 
         def __init__(self, config):
             self.__token = config['token']
+            self.__workers = config.get('workers', 4)
 
         token = property(lambda self: self.__token)
+        workers = property(lambda self: self.__workers)
 
     class __DatabaseConfig:
 
@@ -51,41 +59,93 @@ class Config:
             self.__user = config['user']
             self.__password = config['password']
             self.__database = config['database']
+            self.__pool_size = config.get('pool_size', 5)
 
         host = property(lambda self: self.__host)
         user = property(lambda self: self.__user)
         password = property(lambda self: self.__password)
         database = property(lambda self: self.__database)
+        pool_size = property(lambda self: self.__pool_size)
+
+    class __SamplerConfig:
+
+        def __init__(self, config):
+            self.__interval = config.get('interval', 30)
+            self.__capacity = config.get('capacity', 720)
+            self.__window = config.get('window', 3600)
+
+        interval = property(lambda self: self.__interval)
+        capacity = property(lambda self: self.__capacity)
+        window = property(lambda self: self.__window)
+
+    class __MetricsConfig:
+
+        def __init__(self, config):
+            self.__host = config.get('host', '127.0.0.1')
+            self.__port = config.get('port')  # None: no endpoint
+
+        host = property(lambda self: self.__host)
+        port = property(lambda self: self.__port)
+
+    class __ProfilerConfig:
+
+        def __init__(self, config):
+            self.__enabled = config.get('enabled', False)
+            self.__budget = config.get('budget', 5)
+            self.__directory = config.get('directory', 'profiles')
+            self.__keep = config.get('keep', 50)
+            self.__lag_interval = config.get('lag_interval', 0.5)
+            self.__stall_threshold = config.get('stall_threshold', 0.1)
+
+        enabled = property(lambda self: self.__enabled)
+        budget = property(lambda self: self.__budget)
+        directory = property(lambda self: self.__directory)
+        keep = property(lambda self: self.__keep)
+        lag_interval = property(lambda self: self.__lag_interval)
+        stall_threshold = property(lambda self: self.__stall_threshold)
+
+    class __ControlConfig:
+
+        def __init__(self, config):
+            self.__turn_on_threshold = config.get('turn_on_threshold', 0)
+            self.__min_off_time = config.get('min_off_time', 300)
+
+        turn_on_threshold = property(lambda self: self.__turn_on_threshold)
+        min_off_time = property(lambda self: self.__min_off_time)
 
     class __HealthCheckConfig:
         
         def __init__(self, config):
             self.__webhook_url = config['webhook_url']
 
-        def ping(self):
-            try:
-                response = requests.head(self.__webhook_url, timeout=60)
-                response.raise_for_status()
-            except Exception as e:
-                return f"Health check failed: {e}"
+        webhook_url = property(lambda self: self.__webhook_url)
 
     def __init__(self):
-        file = open(FILENAME, 'r')
-        self.__config = json.loads(file.read())
+        with open(FILENAME, 'r') as file:
+            config = json.loads(file.read())
 
-        self.__env = self.__config['ENV'] if 'ENV' in self.__config else 'production'
+        self.__env = config['ENV'] if 'ENV' in config else 'production'
         if self.__env not in ['development', 'production']:
             raise ValueError('Invalid ENV value in config.json')
 
         # Initialize configurations
-        self.__meross = self.__MerossConfig(self.__config['MEROSS'])
-        self.__solaredge = self.__SolarEdgeConfig(self.__config['SOLAREDGE'])
-        self.__sun = self.__Sun(self.__config['LOCATION'])
-        self.__telegram = self.__TelegramConfig(self.__config['TELEGRAM'])
-        self.__database = self.__DatabaseConfig(self.__config['DATABASE'])
-        self.__healthCheck = self.__HealthCheckConfig(self.__config['HEALTH_CHECK'])
-
-        file.close()
+        self.__meross = self.__MerossConfig(config['MEROSS'])
+        self.__solaredge = self.__SolarEdgeConfig(config['SOLAREDGE'])
+        self.__sun = self.__Sun(config['LOCATION'])
+        self.__telegram = self.__TelegramConfig(config['TELEGRAM'])
+        self.__database = self.__DatabaseConfig(config['DATABASE'])
+        self.__healthCheck = self.__HealthCheckConfig(config['HEALTH_CHECK'])
+        self.__sampler = self.__SamplerConfig(config.get('SAMPLER', {}))
+        self.__metrics = self.__MetricsConfig(config.get('METRICS', {}))
+        self.__profiler = self.__ProfilerConfig(config.get('PROFILER', {}))
+        self.__control = self.__ControlConfig(config.get('CONTROL', {}))
+
+        self.__frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_Config__frozen', False):
+            raise AttributeError('Config is read-only')
+        super().__setattr__(name, value)
 
     env = property(lambda self: self.__env)
     meross = property(lambda self: self.__meross)
@@ -94,3 +154,16 @@ class Config:
     telegram = property(lambda self: self.__telegram)
     database = property(lambda self: self.__database)
     health_check = property(lambda self: self.__healthCheck)
+    sampler = property(lambda self: self.__sampler)
+    metrics = property(lambda self: self.__metrics)
+    profiler = property(lambda self: self.__profiler)
+    control = property(lambda self: self.__control)
+
+
+@lru_cache(maxsize=None)
+def get_config() -> Config:
+    """
+    Configuration of the process, config.json is read on the first call only
+    :return: Config
+    """
+    return Config()
@@ -1,97 +1,272 @@
+import asyncio
+import json
+import os
+from datetime import datetime
 from meross_iot.http_api import MerossHttpClient
 from meross_iot.manager import MerossManager
+from meross_iot.model.credentials import MerossCloudCreds
 from meross_iot.model.enums import OnlineStatus
 
 from lib.logger import get_logger
+from lib.Timer import TimerService
 from obj.Device import Device
 import control.controller as controller
 
 logger = get_logger(__name__)
 
+RELOGIN_DELAY = 5  # Seconds before the first retry of a failed login, doubled on each failure
+RELOGIN_MAX_DELAY = 5 * 60
+
 
 class Meross:
 
-    def __init__(self, email, password):
+    def __init__(self, email, password, timers: TimerService, on_change=None, snapshot_file=None):
+        """
+        :param timers: TimerService | Where device lock expiry is scheduled
+        :param on_change: callable | Called with a reason when the state of a device changes,
+                                     and whether the devices should be evaluated again
+        :param snapshot_file: str | Session and last device states for a warm restart, the discovered
+                                    devices are kept next to it (-devices.json). No warm restart if None
+        """
         self.__email = email
         self.__password = password
+        self.__timers = timers
+        self.__on_change = on_change
+        self.__snapshot_file = snapshot_file
+        self.__devices_file = os.path.splitext(snapshot_file)[0] + '-devices.json' if snapshot_file else None
 
         self.__http_client = None
         self.__manager = None
+        self.__states = {}  # uuid -> last known on/off, until the device is updated
+        self.__refresh_task = None
 
-        self.__devices = []
+        self.__devices = {}  # str(id) -> Device
+        self.__devices_by_name = {}
+        self.__devices_by_uuid = {}
+        self.__applied = {}  # name -> configuration last applied
 
     async def async_init(self) -> None:
-        self.__http_client = await MerossHttpClient.async_from_user_password(
+        if self.__load_snapshot() and await self.__async_init_snapshot():
+            logger.info('MEROSS: warm start, %s devices from snapshot', len(self.__manager.find_devices()))
+            self.__refresh_task = asyncio.ensure_future(self.__async_refresh())
+        else:
+            await self.__async_login()
+            await self.__manager.async_device_discovery()
+            self.__save_snapshot()
+
+    async def __async_init_snapshot(self) -> bool:
+        """
+        Start the manager of the saved session, or forget the session if it cannot start
+        """
+        try:
+            await self.__manager.async_init()
+            return True
+        except Exception as e:
+            logger.warning('MEROSS: saved session failed to start (%s), cold start', repr(e))
+            self.__manager.close()
+            self.__http_client = None
+            self.__manager = None
+            self.__states = {}
+            return False
+
+    async def __async_login(self) -> None:
+        self.__http_client, self.__manager = await self.__async_connect()
+
+    async def __async_connect(self) -> tuple:
+        """
+        :return: tuple | (http client, manager) of a new session
+        """
+        http_client = await MerossHttpClient.async_from_user_password(
             api_base_url='https://iotx-eu.meross.com',
             email=self.__email,
             password=self.__password
         )
-        self.__manager = MerossManager(http_client=self.__http_client)
-        await self.__manager.async_init()
-        await self.__manager.async_device_discovery()
+        manager = MerossManager(http_client=http_client)
+        await manager.async_init()
+        return http_client, manager
+
+    async def __async_refresh(self) -> None:
+        """
+        Validate a warm start in background: discover again with the saved session,
+        or login again if it is no longer valid, then update every device
+        """
+        try:
+            await self.__manager.async_device_discovery()
+        except Exception as e:
+            logger.warning('MEROSS: saved session rejected (%s), login again', repr(e))
+            await self.__async_relogin()
+
+        devices = self.__manager.find_devices(online_status=OnlineStatus.ONLINE)
+        await asyncio.gather(*[device.async_update() for device in devices], return_exceptions=True)
+        self.__states = {}
+        for device in self.devices:  # Offline during the refresh: updated once back online
+            device.forget_last_state()
+        self.__save_snapshot()
+        logger.info('MEROSS: warm start validated, %s devices online', len(devices))
+
+    async def __async_relogin(self) -> None:
+        """
+        Login and discover again until it succeeds, the devices of the saved session are kept until then.
+        Their Device is then bound to the device of the new session, a lock set meanwhile is kept
+        """
+        delay = RELOGIN_DELAY
+        while True:
+            manager = None
+            try:
+                http_client, manager = await self.__async_connect()
+                await manager.async_device_discovery()
+                break
+            except Exception as e:
+                logger.error('MEROSS: login failed (%s), retry in %s s', repr(e), delay)
+                if manager is not None:
+                    manager.close()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RELOGIN_MAX_DELAY)
+
+        discovered = {device.uuid: device for device in manager.find_devices()}
+        for name, device in list(self.__devices_by_name.items()):
+            if device.uuid in discovered:
+                device.rebind(discovered[device.uuid])
+            else:
+                self.__remove(name, device)
+        self.__manager.close()
+        self.__http_client, self.__manager = http_client, manager
+        self.__states = {}
+
+    def __load_snapshot(self) -> bool:
+        if self.__snapshot_file is None or not os.path.exists(self.__snapshot_file) \
+                or not os.path.exists(self.__devices_file):
+            return False
+        try:
+            with open(self.__snapshot_file, 'r') as file:
+                snapshot = json.loads(file.read())
+            self.__http_client = MerossHttpClient(cloud_credentials=MerossCloudCreds.from_json(snapshot['credentials']))
+            self.__manager = MerossManager(http_client=self.__http_client)
+            self.__manager.load_devices_from_dump(self.__devices_file)
+            self.__states = snapshot['states']
+            return True
+        except Exception as e:
+            logger.warning('MEROSS: invalid snapshot %s: %s', self.__snapshot_file, repr(e))
+            self.__http_client = None
+            self.__manager = None
+            return False
+
+    def __save_snapshot(self) -> None:
+        if self.__snapshot_file is None:
+            return
+        states = dict(self.__states)
+        for device in self.__manager.find_devices():
+            try:
+                if device.last_full_update_timestamp is not None:
+                    states[device.uuid] = device.is_on()
+            except AttributeError:  # Not a switch
+                pass
+
+        self.__manager.dump_device_registry(self.__devices_file)
+        descriptor = os.open(self.__snapshot_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(descriptor, 'w') as file:
+            file.write(json.dumps({
+                'saved_at': datetime.now().isoformat(),
+                'credentials': self.__http_client.cloud_credentials.to_json(),
+                'states': states
+            }))
+
+    @property
+    def devices(self) -> list:
+        return list(self.__devices.values())
 
     def get_device(self, device_id: int) -> Device or None:
-        for device in self.__devices:
-            if str(device.id) == str(device_id):
-                return device
-        return None
+        return self.__devices.get(str(device_id))
+
+    def get_device_by_name(self, name: str) -> Device or None:
+        return self.__devices_by_name.get(name)
+
+    def get_device_by_uuid(self, uuid: str) -> Device or None:
+        return self.__devices_by_uuid.get(uuid)
 
     def find_devices(self) -> list:
         global_devices = controller.get_devices()
 
         if not len(global_devices):
             logger.warning('FIND_DEVICES: no devices')
-            return self.__devices
-
-        for global_device in global_devices:
-            device = self.__manager.find_devices(device_name=global_device['name'],
-                                                 online_status=OnlineStatus.ONLINE)
-            device = device[0] if len(device) else None
-
-            obj = None
-            for d in self.__devices:  # Find in local
-                # obj = d if global_device['name'] == d.name else obj
-                if global_device['name'] == d.name:
-                    obj = d
-                    break
-
-            if global_device['disabled'] or (obj is not None and device is None):  # Remove device
-                if obj is not None:
-                    if device is None:
-                        logger.warning('LOST DEVICE: %s', global_device['name'])
-                    else:
-                        logger.info('REMOVED DEVICE: %s', global_device['name'])
-                    obj.__del__()
-                    self.__devices.remove(obj)
-
-            elif obj is None and device is not None:  # Add new device
-                logger.info('ADDED DEVICE: %s', global_device['name'])
-                logger.debug(f'DEVICE DATA: {global_device}')
-
-                self.__devices.append(
-                    Device(device,
-                           id=global_device['id'],
-                           currentPowerUsage=global_device['currentPowerUsage'],
-                           solarPowerOn=global_device['solarPowerOn'],
-                           timesAlwaysOn=global_device['timesAlwaysOn'],
-                           timeDelayBeforePowerOff=global_device['timeDelayBeforePowerOff'],
-                           lastPowerOn=global_device['lastPowerOn']
-                           )
-                )
-
-            elif obj is not None and device is not None:  # Update device
-                obj.update(
-                    currentPowerUsage=global_device['currentPowerUsage'],
-                    solarPowerOn=global_device['solarPowerOn'],
-                    timesAlwaysOn=global_device['timesAlwaysOn'],
-                    timeDelayBeforePowerOff=global_device['timeDelayBeforePowerOff']
-                )
-
-        return self.__devices
+            return self.devices
+
+        online = {}
+        for device in self.__manager.find_devices(online_status=OnlineStatus.ONLINE):
+            online.setdefault(device.name, device)
+        wanted = {global_device['name']: global_device for global_device in global_devices
+                  if not global_device['disabled'] and global_device['name'] in online}
+        local = set(self.__devices_by_name)
+
+        for name in local - wanted.keys():  # Remove device
+            if name not in online:
+                logger.warning('LOST DEVICE: %s', name)
+            else:
+                logger.info('REMOVED DEVICE: %s', name)
+            self.__remove(name, self.__devices_by_name[name])
+
+        for name in wanted.keys() - local:  # Add new device
+            global_device = wanted[name]
+            logger.info('ADDED DEVICE: %s', name)
+            logger.debug(f'DEVICE DATA: {global_device}')
+
+            self.__add(
+                Device(online[name],
+                       timers=self.__timers,
+                       on_change=self.__on_change,
+                       last_state=self.__states.get(online[name].uuid),
+                       id=global_device['id'],
+                       currentPowerUsage=global_device['currentPowerUsage'],
+                       solarPowerOn=global_device['solarPowerOn'],
+                       priority=global_device['priority'],
+                       timesAlwaysOn=global_device['timesAlwaysOn'],
+                       timeDelayBeforePowerOff=global_device['timeDelayBeforePowerOff'],
+                       lastPowerOn=global_device['lastPowerOn']
+                       )
+            )
+            self.__applied[name] = global_device
+
+        for name in wanted.keys() & local:  # Update device, if its configuration changed
+            global_device = wanted[name]
+            if self.__applied.get(name) is global_device:
+                continue
+            self.__applied[name] = global_device
+            self.__devices_by_name[name].update(
+                currentPowerUsage=global_device['currentPowerUsage'],
+                solarPowerOn=global_device['solarPowerOn'],
+                priority=global_device['priority'],
+                timesAlwaysOn=global_device['timesAlwaysOn'],
+                timeDelayBeforePowerOff=global_device['timeDelayBeforePowerOff']
+            )
+
+        # Keep the database order
+        return [self.__devices_by_name[global_device['name']] for global_device in global_devices
+                if global_device['name'] in self.__devices_by_name]
+
+    def __add(self, device: Device) -> None:
+        self.__devices[str(device.id)] = device
+        self.__devices_by_name[device.name] = device
+        self.__devices_by_uuid[device.uuid] = device
+
+    def __remove(self, name: str, device: Device) -> None:
+        """
+        :param name: str | Name the device was added with, it may have been renamed since
+        """
+        device.__del__()
+        del self.__devices[str(device.id)]
+        del self.__devices_by_name[name]
+        del self.__devices_by_uuid[device.uuid]
+        self.__applied.pop(name, None)
 
     async def async_stop(self) -> None:
-        for device in self.__devices:
+        if self.__refresh_task is not None:
+            self.__refresh_task.cancel()
+        for device in self.__devices.values():
             device.__del__()
 
-        self.__manager.close()
-        await self.__http_client.async_logout()
+        if self.__snapshot_file is not None:  # Keep the session for the next start
+            self.__save_snapshot()
+            self.__manager.close()
+        else:
+            self.__manager.close()
+            await self.__http_client.async_logout()
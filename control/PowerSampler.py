@@ -0,0 +1,122 @@
+import asyncio
+
+from lib import Clock
+from lib.logger import get_logger
+from lib.RingBuffer import RingBuffer
+from obj.Device import Device
+
+logger = get_logger(__name__)
+
+
+class PowerSampler:
+    """
+    Polls the instant metrics of the devices with an electricity meter, all at once, every `interval` seconds,
+    into one RingBuffer per device. Only devices that are on are polled, so the buffers hold what a device
+    draws when it runs: that is the usage used to decide whether it fits in the surplus.
+    """
+
+    FIELDS = ('power', 'voltage', 'current')
+
+    def __init__(self, devices, interval: float = 30, capacity: int = 720, window: float = 3600,
+                 concurrency: int = 10, timeout: float = 10, on_sample=None):
+        """
+        :param devices: callable | Returns the devices to sample
+        :param interval: float | Seconds between two samples of a device
+        :param capacity: int | Samples kept per device
+        :param window: float | Seconds of samples averaged for the usage of a device
+        :param concurrency: int | Devices polled at the same time
+        :param timeout: float | Seconds before a poll is given up
+        :param on_sample: callable | Called with the device and its PowerInfo after every sample
+        """
+        self.__devices = devices
+        self.__interval = interval
+        self.__capacity = capacity
+        self.__window = window
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.__timeout = timeout
+        self.__on_sample = on_sample
+
+        self.__buffers = {}  # uuid -> RingBuffer
+        self.__task = None
+        self.__samples = 0
+        self.__failures = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'devices': len(self.__buffers),
+            'samples': self.__samples,
+            'failures': self.__failures,
+            'bytes': sum(buffer.nbytes for buffer in self.__buffers.values())
+        }
+
+    def get(self, device: Device) -> RingBuffer or None:
+        return self.__buffers.get(device.uuid)
+
+    def power(self, device: Device) -> float or None:
+        """
+        :return: float or None | Last power measured, if not older than two intervals
+        """
+        buffer = self.__buffers.get(device.uuid)
+        latest = buffer.latest('power') if buffer is not None else None
+        if latest is None or Clock.time() - latest[0] > 2 * self.__interval:
+            return None
+        return latest[1]
+
+    def usage(self, device: Device) -> int:
+        """
+        :return: int | Mean power of the last `window` seconds the device was on, its nominal usage if never measured
+        """
+        buffer = self.__buffers.get(device.uuid)
+        latest = buffer.latest('power') if buffer is not None else None
+        if latest is None:
+            return device.current_power_usage
+        return round(buffer.mean('power', since=latest[0] - self.__window))
+
+    def start(self) -> None:
+        if self.__task is None:
+            self.__task = asyncio.ensure_future(self.__async_run())
+
+    async def async_stop(self) -> None:
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+    async def async_sample(self) -> None:
+        """
+        Poll every device that is on, once
+        """
+        devices = [device for device in self.__devices() if device.has_electricity_mixin]
+        uuids = {device.uuid for device in devices}
+        for uuid in list(self.__buffers):
+            if uuid not in uuids:  # Removed device
+                del self.__buffers[uuid]
+
+        await asyncio.gather(*[self.__async_sample(device) for device in devices if device.is_on])
+
+    async def __async_sample(self, device: Device) -> None:
+        async with self.__semaphore:
+            try:
+                metrics = await asyncio.wait_for(device.async_get_instant_metrics(), timeout=self.__timeout)
+            except Exception as e:
+                self.__failures += 1
+                logger.debug('SAMPLER: %s failed: %s', device.name, repr(e))
+                return
+
+        buffer = self.__buffers.get(device.uuid)
+        if buffer is None:
+            buffer = self.__buffers[device.uuid] = RingBuffer(self.__capacity, self.FIELDS)
+        buffer.append(Clock.time(), metrics.power, metrics.voltage, metrics.current)
+        self.__samples += 1
+        if self.__on_sample is not None:
+            self.__on_sample(device, metrics)
+
+    async def __async_run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            try:
+                await self.async_sample()
+            except Exception as e:
+                logger.error('SAMPLER: %s', repr(e))
+            await asyncio.sleep(max(self.__interval - (loop.time() - start), 0))
@@ -0,0 +1,101 @@
+import math
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+# A device that could be turned on: `power` watts it would draw, higher `priority` is served first
+Candidate = namedtuple('Candidate', ['device', 'power', 'priority'])
+
+
+class Allocator(ABC):
+    """
+    Chooses which devices to turn on with the solar surplus
+    """
+
+    @abstractmethod
+    def allocate(self, candidates: list, surplus: int) -> list:
+        """
+        :param candidates: list | Candidate, in database order
+        :param surplus: int | Watts available, a device is turned on only if it needs less than this
+        :return: list | Devices to turn on
+        """
+
+
+class GreedyAllocator(Allocator):
+    """
+    First fit in database order: a device is turned on if it fits in what the previous ones left
+    """
+
+    def allocate(self, candidates: list, surplus: int) -> list:
+        chosen = []
+        for candidate in candidates:
+            if surplus > candidate.power:
+                chosen.append(candidate.device)
+                surplus -= candidate.power
+        return chosen
+
+
+class KnapsackAllocator(Allocator):
+    """
+    Uses as much of the surplus as possible, priority by priority:
+    the highest priority gets the subset of its devices closest to the surplus, the next one what is left, and so on.
+    Each subset is an exact subset sum over a bitset of the reachable watts (a Python int, one shift per device),
+    at `resolution` watts; device powers are rounded up so the choice never exceeds the surplus.
+    Above `max_capacity` steps it falls back to first fit decreasing.
+    """
+
+    def __init__(self, resolution: int = 10, max_capacity: int = 100000):
+        """
+        :param resolution: int | Watts per step of the subset sum
+        :param max_capacity: int | Steps above which the greedy fallback is used
+        """
+        self.__resolution = resolution
+        self.__max_capacity = max_capacity
+
+    def allocate(self, candidates: list, surplus: int) -> list:
+        tiers = {}
+        for candidate in candidates:
+            tiers.setdefault(candidate.priority, []).append(candidate)
+
+        chosen = []
+        for priority in sorted(tiers, reverse=True):
+            if surplus <= 0:
+                break
+            selected = self.__subset(tiers[priority], surplus - 1)  # Strictly less than the surplus
+            for candidate in selected:
+                chosen.append(candidate.device)
+                surplus -= candidate.power
+        return chosen
+
+    def __subset(self, candidates: list, capacity: int) -> list:
+        free = [candidate for candidate in candidates if candidate.power <= 0]
+        candidates = [candidate for candidate in candidates if candidate.power > 0]
+        steps = int(capacity // self.__resolution)  # The surplus is a float once measured powers are credited
+        if steps <= 0:
+            return free
+        if steps > self.__max_capacity:
+            return free + self.__first_fit_decreasing(candidates, capacity)
+
+        weights = [math.ceil(candidate.power / self.__resolution) for candidate in candidates]
+        mask = (1 << (steps + 1)) - 1
+        reachable = [1]  # reachable[i]: bit s set if s steps can be made with the first i candidates
+        for weight in weights:
+            reachable.append((reachable[-1] | (reachable[-1] << weight)) & mask)
+
+        # Walk back from the best reachable sum
+        target = reachable[-1].bit_length() - 1
+        selected = []
+        for i in range(len(candidates), 0, -1):
+            if not (reachable[i - 1] >> target) & 1:
+                selected.append(candidates[i - 1])
+                target -= weights[i - 1]
+        selected.reverse()
+        return free + selected
+
+    @staticmethod
+    def __first_fit_decreasing(candidates: list, capacity: int) -> list:
+        selected = []
+        for candidate in sorted(candidates, key=lambda c: c.power, reverse=True):
+            if candidate.power <= capacity:
+                selected.append(candidate)
+                capacity -= candidate.power
+        return selected
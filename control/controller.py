@@ -1,38 +1,145 @@
+import threading
 from datetime import datetime, timedelta
 
 from database.DAO import DAO
+from database.BatchWriter import BatchWriter
+from database.HistoryCache import HistoryCache
+from database.TimeSeries import TimeSeries
+from lib import Clock
 
-# Variables
-dao = DAO()
+# Variables, created on first use
+dao = None
+log_writer = None
+history = None
+timeseries = None
+_lock = threading.RLock()
+
+
+FULL_SYNC_INTERVAL = timedelta(hours=1)
+# Change ids read again below the last one: a transaction can commit its change after a later one
+CONFIG_CHANGES_OVERLAP = 100
+
+devices = {}  # id -> device configuration
+config_version = None
+last_full_sync = None
+applied_changes = set()  # Ids of the changes in the overlap window already applied
 
 
 # Functions
+def get_dao() -> DAO:
+    global dao
+    with _lock:
+        if dao is None:
+            dao = DAO()
+        return dao
+
+
+def get_log_writer() -> BatchWriter:
+    global log_writer
+    with _lock:
+        if log_writer is None:
+            log_writer = BatchWriter(get_dao().log_many, name='LogWriter')
+        return log_writer
+
+
+def get_history() -> HistoryCache:
+    global history
+    with _lock:
+        if history is None:
+            history = HistoryCache(get_dao())
+        return history
+
+
+def get_timeseries() -> TimeSeries:
+    global timeseries
+    with _lock:
+        if timeseries is None:
+            timeseries = TimeSeries(get_dao())
+        return timeseries
+
+
 def get_devices():
-    response = []
+    """
+    Configuration of all the devices, in database order.
+    Only devices changed since the last call are read again, the whole table every FULL_SYNC_INTERVAL.
+    The last CONFIG_CHANGES_OVERLAP change ids are looked at again, for the changes that committed late.
+    A device dict is replaced by a new one when its configuration changes.
+    """
+    global config_version, last_full_sync, applied_changes
+    now = Clock.now()
 
-    devices = dao.get_all_devices()
-    for row in devices:
-        device_id = row.intIdDevice
+    if config_version is None or now - last_full_sync > FULL_SYNC_INTERVAL:
+        # Before the snapshot: it includes these changes, those made meanwhile are read again
+        version = get_dao().get_config_version()
+        window = get_dao().get_config_changes(version - CONFIG_CHANGES_OVERLAP)
+        devices.clear()
+        devices.update(_read_devices())
+        config_version, last_full_sync = version, now
+        applied_changes = {row.intIdChange for row in window}
+        if version > CONFIG_CHANGES_OVERLAP:  # Older changes are in the snapshot and never read again
+            get_dao().delete_config_changes(version - CONFIG_CHANGES_OVERLAP)
+    else:
+        changes = [row for row in get_dao().get_config_changes(config_version - CONFIG_CHANGES_OVERLAP)
+                   if row.intIdChange not in applied_changes]
+        if len(changes):
+            device_ids = list(dict.fromkeys(row.intIdDevice for row in changes))
+            changed = _read_devices(device_ids)
+            for device_id in device_ids:
+                if device_id in changed:
+                    devices[device_id] = changed[device_id]
+                else:  # Deleted
+                    devices.pop(device_id, None)
+            config_version = max(config_version, max(row.intIdChange for row in changes))
+            applied_changes = {change for change in applied_changes | {row.intIdChange for row in changes}
+                               if change > config_version - CONFIG_CHANGES_OVERLAP}
+
+    return sorted(devices.values(), key=lambda device: device['id'])
+
+
+def _read_devices(device_ids: list = None) -> dict:
+    rows, times_always_power_on = get_dao().get_devices_snapshot(device_ids)
+
+    times = {}
+    for _row in times_always_power_on:
+        times.setdefault(_row.intIdDevice, []).append({
+            'start': (datetime.fromtimestamp(_row.timePowerOn.seconds) - timedelta(hours=1)).time(),
+            'end': (datetime.fromtimestamp(_row.timePowerOff.seconds) - timedelta(hours=1)).time()
+        })
 
-        times = []
-        for _row in dao.get_device_times_always_power_on(device_id):
-            times.append({
-                'start': (datetime.fromtimestamp(_row.timePowerOn.seconds) - timedelta(hours=1)).time(),
-                'end': (datetime.fromtimestamp(_row.timePowerOff.seconds) - timedelta(hours=1)).time()
-            })
+    response = {}
+    for row in rows:
+        device_id = row.intIdDevice
 
-        response.append({
+        response[device_id] = {
             'id': device_id,
             'name': row.strName,
             'currentPowerUsage': row.intUsage,
             'solarPowerOn': bool(row.boolSolarPowerOn),
+            'priority': row.intPriority,
             'timeDelayBeforePowerOff': row.timeDelayBeforePowerOff,
-            'timesAlwaysOn': times,
+            'timesAlwaysOn': times.get(device_id, []),
             'lastPowerOn': row.dtaLastPowerOn,
             'disabled': bool(row.boolDisable)
-        })
+        }
     return response
 
 
-async def log(device, state):
-    dao.log(device, state)
+def log(device, state):
+    """
+    Queue a state change, written in batch off the event loop
+    """
+    now = Clock.now().replace(microsecond=0)
+    get_log_writer().put((device, now, state))
+    get_history().append(device, now, state)
+    if state and device in devices:  # Not read again until the configuration changes
+        devices[device]['lastPowerOn'] = now
+
+
+def close():
+    """
+    Write the pending state changes and power samples
+    """
+    if log_writer is not None:
+        log_writer.close()
+    if timeseries is not None:
+        timeseries.close()
@@ -0,0 +1,67 @@
+from collections import namedtuple
+from datetime import datetime
+
+from control.allocation import Allocator, Candidate
+
+# What the policy knows of a device: `usage` watts it would draw if turned on,
+# `power` watts it draws now, given back to the surplus when it is turned off,
+# `next_power_on` before which the surplus does not turn it on again (minimum off time)
+DeviceState = namedtuple('DeviceState', ['device', 'is_on', 'solar_power_on', 'priority', 'times_always_on',
+                                         'next_power_status_change', 'usage', 'power', 'next_power_on'],
+                         defaults=(datetime.min,))
+
+# `device` of its DeviceState, True to turn on / False to turn off, and why
+Command = namedtuple('Command', ['device', 'turn_on', 'reason'])
+
+ALWAYS_ON = 'Always On'
+ALWAYS_OFF = 'Always Off'
+DEFICIT = 'Deficit'
+SURPLUS = 'Surplus'
+
+
+def decide(states: list, power_produced: int, now: datetime, is_day: bool, allocator: Allocator,
+           turn_on_threshold: int = 0) -> list:
+    """
+    Which devices to turn on or off; reads nothing but its arguments and changes none of them
+    :param states: list | DeviceState of the devices to evaluate, in database order, locked devices excluded
+    :param power_produced: int | Watts produced minus watts consumed
+    :param is_day: bool | Whether the sun is up at `now`
+    :param turn_on_threshold: int | Watts of surplus kept in reserve, only what exceeds it is allocated
+    :return: list | Command
+    """
+    commands = []
+    on_candidates = []
+    off_candidates = []
+    for state in states:
+        time_always_on = False
+        for time in state.times_always_on:
+            if time['start'] <= now.time() < time['end']:  # Check All Times Always On
+                time_always_on = True
+
+        if time_always_on:  # Time Always On
+            if not state.is_on:
+                commands.append(Command(state.device, True, ALWAYS_ON))
+
+        elif state.solar_power_on and is_day:  # Solar-Energy Power On
+            if not state.is_on:
+                if now >= state.next_power_on:  # Minimum off time elapsed
+                    on_candidates.append(Candidate(state, state.usage, state.priority))
+            elif now > state.next_power_status_change:  # Minimum on time elapsed
+                off_candidates.append(state)
+
+        elif state.is_on and now > state.next_power_status_change:  # Always Off
+            commands.append(Command(state.device, False, ALWAYS_OFF))
+
+    # Not enough power: turn off, lowest priority first, until there is no deficit
+    for state in sorted(off_candidates, key=lambda s: s.priority):
+        if power_produced >= 0:
+            break
+        commands.append(Command(state.device, False, DEFICIT))
+        power_produced += state.power
+
+    # Surplus: let the allocator choose what to turn on
+    surplus = power_produced - turn_on_threshold
+    if surplus > 0 and len(on_candidates):
+        for state in allocator.allocate(on_candidates, surplus):
+            commands.append(Command(state.device, True, SURPLUS))
+    return commands
@@ -0,0 +1,130 @@
+import threading
+import time
+
+from lib.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BatchWriter:
+    """
+    Write-behind buffer: rows are queued in memory and written by a background thread,
+    one `write(rows)` call per batch, as soon as `batch_size` rows are pending or every `interval` seconds
+    """
+
+    def __init__(self, write, batch_size: int = 50, interval: float = 5.0, max_pending: int = 10000,
+                 name: str = 'BatchWriter'):
+        """
+        :param write: callable | Writes a list of rows, e.g. with one executemany
+        :param max_pending: int | Rows kept while writes fail, the oldest are dropped beyond it
+        """
+        self.__write = write
+        self.__batch_size = batch_size
+        self.__interval = interval
+        self.__max_pending = max_pending
+        self.__name = name
+
+        self.__rows = []
+        self.__condition = threading.Condition()
+        self.__write_lock = threading.Lock()
+        self.__thread = None
+        self.__closed = False
+
+        self.__batches = 0
+        self.__written = 0
+        self.__failures = 0
+        self.__dropped = 0
+        self.__last_batch_size = 0
+        self.__max_batch_size = 0
+        self.__last_flush_time = 0.0
+        self.__max_flush_time = 0.0
+
+    @property
+    def pending(self) -> int:
+        with self.__condition:
+            return len(self.__rows)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'pending': self.pending,
+            'batches': self.__batches,
+            'written': self.__written,
+            'failures': self.__failures,
+            'dropped': self.__dropped,
+            'last_batch_size': self.__last_batch_size,
+            'max_batch_size': self.__max_batch_size,
+            'last_flush_time': self.__last_flush_time,
+            'max_flush_time': self.__max_flush_time
+        }
+
+    def put(self, row) -> None:
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError(f'{self.__name} closed')
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name=self.__name, daemon=True)
+                self.__thread.start()
+
+            self.__rows.append(row)
+            if len(self.__rows) >= self.__batch_size:
+                self.__condition.notify()
+
+    def flush(self) -> None:
+        """
+        Write all the pending rows now, in the calling thread
+        """
+        with self.__condition:
+            rows, self.__rows = self.__rows, []
+        self.__flush(rows)
+
+    def close(self) -> None:
+        """
+        Stop the background thread after writing all the pending rows
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify()
+        if self.__thread is not None:
+            self.__thread.join()
+        self.flush()
+
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                if not self.__closed and len(self.__rows) < self.__batch_size:
+                    self.__condition.wait(self.__interval)
+                rows, self.__rows = self.__rows, []
+                closed = self.__closed
+            self.__flush(rows)
+            if closed:
+                break
+
+    def __flush(self, rows: list) -> None:
+        if not len(rows):
+            return
+
+        with self.__write_lock:
+            start = time.perf_counter()
+            try:
+                self.__write(rows)
+            except Exception as e:
+                self.__failures += 1
+                logger.error('%s: write of %s rows failed: %s', self.__name, len(rows), e)
+                with self.__condition:  # Keep them for the next batch
+                    self.__rows = rows + self.__rows
+                    overflow = len(self.__rows) - self.__max_pending
+                    if overflow > 0:
+                        self.__dropped += overflow
+                        del self.__rows[:overflow]
+                        logger.error('%s: dropped %s rows', self.__name, overflow)
+                return
+            elapsed = time.perf_counter() - start
+
+            self.__batches += 1
+            self.__written += len(rows)
+            self.__last_batch_size = len(rows)
+            self.__max_batch_size = max(self.__max_batch_size, len(rows))
+            self.__last_flush_time = elapsed
+            self.__max_flush_time = max(self.__max_flush_time, elapsed)
+        logger.debug('%s: wrote %s rows in %.1f ms', self.__name, len(rows), elapsed * 1000)
@@ -1,81 +1,254 @@
-from control.Config import Config
+import threading
+import time as tm
+from datetime import datetime
+from functools import wraps
+
+from control.Config import get_config
 from database.Database import Database
+from lib.Metrics import REGISTRY
+
+_database = None
+_database_lock = threading.Lock()
+
+QUERY_SECONDS = REGISTRY.histogram('meross_db_query_seconds', 'Duration of the DAO methods', ('method',))
+QUERY_ERRORS = REGISTRY.counter('meross_db_query_errors_total', 'DAO methods that raised', ('method',))
+
+
+def get_database() -> Database:
+    """
+    Connection pool shared by every DAO of the process
+    :return: Database
+    """
+    global _database
+    with _database_lock:
+        if _database is None:
+            config = get_config()
+            _database = Database(config.database.host,
+                                 config.database.user,
+                                 config.database.password,
+                                 config.database.database,
+                                 size=config.database.pool_size)
+        return _database
+
+
+def timed(function):
+    """
+    Count the duration and the errors of a DAO method, under its name
+    """
+    seconds, errors = QUERY_SECONDS.labels(function.__name__), QUERY_ERRORS.labels(function.__name__)
 
-config = Config()
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = tm.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(tm.perf_counter() - start)
+    return wrapper
 
 
 class DAO:
 
-    def __init__(self):
-        self.__db = Database(config.database.host,
-                             config.database.user,
-                             config.database.password,
-                             config.database.database)
+    def __init__(self, db: Database = None):
+        self.__db = db if db is not None else get_database()
 
+    @property
+    def stats(self) -> dict:
+        return self.__db.stats
+
+    def warm_up(self, connections: int = 1) -> None:
+        self.__db.warm_up(connections)
+
+    @timed
     def get_users(self):
         sql = "SELECT * " \
               "FROM users"
-        result = self.__db.execute(sql)
-        return result.fetchall()
+        return self.__db.fetchall(sql)
 
+    @timed
     def search_user(self, telegram_from_id: str):
         sql = "SELECT * " \
               "FROM users " \
               "WHERE strIdTelegram = %s"
-        result = self.__db.execute(sql, telegram_from_id)
-        return result.fetchone()
+        return self.__db.fetchone(sql, telegram_from_id)
 
+    @timed
     def get_all_devices(self):
-        sql = "SELECT *, " \
-                "(SELECT dtaDate " \
-                "FROM logs l " \
-                "WHERE l.intIdDevice = d.intIdDevice and boolState = 1 " \
-                "ORDER BY dtaDate DESC " \
-                "LIMIT 1) as dtaLastPowerOn " \
-              "FROM devices d"
-        result = self.__db.execute(sql)
-        return result.fetchall()
+        sql = "SELECT * " \
+              "FROM devices"
+        return self.__db.fetchall(sql)
+
+    @timed
+    def get_devices_snapshot(self, device_ids: list = None) -> tuple:
+        """
+        Devices, with their last power on, and all the enabled times always power on
+        in a fixed number of queries, whatever the number of devices
+        :param device_ids: list | Only these devices, all of them if None
+        :return: (devices, times always power on)
+        """
+        devices_filter, ids_filter, args = '', '', ()
+        if device_ids is not None:
+            if not len(device_ids):
+                return [], []
+            placeholders = ', '.join(['%s'] * len(device_ids))
+            devices_filter = 'WHERE d.intIdDevice IN ({}) '.format(placeholders)
+            ids_filter = 'intIdDevice IN ({}) and '.format(placeholders)
+            args = tuple(device_ids)
+
+        sql = "SELECT d.*, l.dtaLastPowerOn " \
+              "FROM devices d " \
+              "LEFT JOIN (SELECT intIdDevice, MAX(dtaDate) as dtaLastPowerOn " \
+                         "FROM logs " \
+                         "WHERE {ids_filter}boolState = 1 " \
+                         "GROUP BY intIdDevice) l ON l.intIdDevice = d.intIdDevice " \
+              "{devices_filter}" \
+              "ORDER BY d.intIdDevice".format(ids_filter=ids_filter, devices_filter=devices_filter)
+        devices = self.__db.fetchall(sql, *(args * 2))
 
+        sql = "SELECT intIdDevice, timePowerOn, timePowerOff " \
+              "FROM timesalwayspoweron " \
+              "WHERE {ids_filter}boolDisable = 0".format(ids_filter=ids_filter)
+        times = self.__db.fetchall(sql, *args)
+        return devices, times
+
+    @timed
+    def get_config_version(self) -> int:
+        """
+        :return: int | Last change recorded on the devices configuration
+        """
+        sql = "SELECT COALESCE(MAX(intIdChange), 0) as intIdChange " \
+              "FROM configchanges"
+        return self.__db.fetchone(sql).intIdChange
+
+    @timed
+    def get_config_changes(self, version: int):
+        """
+        Changes of the devices configuration after a version, in order
+        """
+        sql = "SELECT intIdChange, intIdDevice " \
+              "FROM configchanges " \
+              "WHERE intIdChange > %s " \
+              "ORDER BY intIdChange"
+        return self.__db.fetchall(sql, version)
+
+    @timed
+    def delete_config_changes(self, version: int) -> int:
+        """
+        Changes of the devices configuration up to a version
+        """
+        sql = "DELETE FROM configchanges " \
+              "WHERE intIdChange <= %s"
+        return self.__db.execute(sql, version)
+
+    @timed
     def get_devices(self):
         sql = "SELECT * " \
               "FROM devices " \
               "WHERE boolDisable = 0"
-        result = self.__db.execute(sql)
-        return result.fetchall()
+        return self.__db.fetchall(sql)
 
+    @timed
     def get_device(self, device_id: int):
         sql = "SELECT * " \
               "FROM devices d " \
               "WHERE intIdDevice = %s"
-        result = self.__db.execute(sql, device_id)
-        return result.fetchone()
+        return self.__db.fetchone(sql, device_id)
 
+    @timed
     def get_device_times_always_power_on(self, device_id: int):
         sql = "SELECT timePowerOn, timePowerOff " \
               "FROM timesalwayspoweron " \
               "WHERE intIdDevice = %s and boolDisable = 0"
-        result = self.__db.execute(sql, device_id)
-        return result.fetchall()
+        return self.__db.fetchall(sql, device_id)
 
-    def get_device_powers_on(self, device_id: int, date: str):
-        date += '%'
-        sql = "SELECT * " \
+    @timed
+    def get_device_powers_on(self, device_id: int, start: datetime, end: datetime):
+        """
+        State changes of a device in the half-open range [start, end), served by the (intIdDevice, dtaDate) key
+        """
+        sql = "SELECT intIdDevice, dtaDate, boolState " \
               "FROM logs " \
-              "WHERE dtaDate LIKE %s and intIdDevice = %s"
-        result = self.__db.execute(sql, date, device_id)
-        return result.fetchall()
+              "WHERE intIdDevice = %s and dtaDate >= %s and dtaDate < %s " \
+              "ORDER BY dtaDate"
+        return self.__db.fetchall(sql, device_id, start, end)
 
+    @timed
     def get_device_attributes(self, device_id: int):
         sql = "SELECT * " \
               "FROM attributes " \
               "WHERE intIdDevice = %s and boolDisable = 0"
-        result = self.__db.execute(sql, device_id)
-        return result.fetchall()
+        return self.__db.fetchall(sql, device_id)
 
+    @timed
     def log(self, device_id: int, state: int):
         sql = "INSERT INTO logs (intIdDevice, boolState) VALUES (%s, %s)"
         self.__db.execute(sql, device_id, state)
-        self.__db.commit()
+
+    @timed
+    def log_many(self, rows: list):
+        """
+        :param rows: list | (device_id, date, state) tuples, written in one multi-row INSERT
+        """
+        # Duplicates are skipped with a no-op update: mysql-connector only batches executemany into one
+        # multi-row statement for a plain INSERT INTO ... VALUES, not for INSERT IGNORE
+        sql = "INSERT INTO logs (intIdDevice, dtaDate, boolState) VALUES (%s, %s, %s) " \
+              "ON DUPLICATE KEY UPDATE boolState = boolState"
+        self.__db.executemany(sql, rows)
+
+    @timed
+    def log_power_samples(self, rows: list):
+        """
+        :param rows: list | (series, date, value) tuples, written in one multi-row INSERT
+        """
+        # Duplicates are skipped with a no-op update, as in log_many
+        sql = "INSERT INTO powersamples (strSeries, dtaDate, dblValue) VALUES (%s, %s, %s) " \
+              "ON DUPLICATE KEY UPDATE dblValue = dblValue"
+        self.__db.executemany(sql, rows)
+
+    @timed
+    def merge_power_rollups(self, rows: list):
+        """
+        Add partial aggregates to the rollups, creating the missing buckets
+        :param rows: list | (resolution, series, bucket start, count, sum, min, max) tuples
+        """
+        sql = "INSERT INTO powerrollups (intResolution, strSeries, dtaDate, intCount, dblSum, dblMin, dblMax) " \
+              "VALUES (%s, %s, %s, %s, %s, %s, %s) " \
+              "ON DUPLICATE KEY UPDATE intCount = intCount + VALUES(intCount), " \
+                                      "dblSum = dblSum + VALUES(dblSum), " \
+                                      "dblMin = LEAST(dblMin, VALUES(dblMin)), " \
+                                      "dblMax = GREATEST(dblMax, VALUES(dblMax))"
+        self.__db.executemany(sql, rows)
+
+    @timed
+    def get_power_samples(self, series: str, start: datetime, end: datetime):
+        sql = "SELECT dtaDate, dblValue " \
+              "FROM powersamples " \
+              "WHERE strSeries = %s and dtaDate >= %s and dtaDate < %s " \
+              "ORDER BY dtaDate"
+        return self.__db.fetchall(sql, series, start, end)
+
+    @timed
+    def get_power_rollups(self, series: str, resolution: int, start: datetime, end: datetime):
+        sql = "SELECT dtaDate, intCount, dblSum, dblMin, dblMax " \
+              "FROM powerrollups " \
+              "WHERE intResolution = %s and strSeries = %s and dtaDate >= %s and dtaDate < %s " \
+              "ORDER BY dtaDate"
+        return self.__db.fetchall(sql, resolution, series, start, end)
+
+    @timed
+    def delete_power_samples(self, before: datetime) -> int:
+        sql = "DELETE FROM powersamples " \
+              "WHERE dtaDate < %s"
+        return self.__db.execute(sql, before)
+
+    @timed
+    def delete_power_rollups(self, resolution: int, before: datetime) -> int:
+        sql = "DELETE FROM powerrollups " \
+              "WHERE intResolution = %s and dtaDate < %s"
+        return self.__db.execute(sql, resolution, before)
 
     def close(self):
         self.__db.close()
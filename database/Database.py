@@ -1,26 +1,193 @@
+import threading
+import time
+from contextlib import contextmanager
 import mysql.connector
 
 
+class DatabaseException(Exception):
+    pass
+
+
 class Database:
+    """
+    Bounded, thread-safe pool of MySQL connections.
+    Every call checks a connection out, runs on its own cursor and checks the connection back in.
+    """
+
+    def __init__(self, host, user, password, database, size=5, timeout=10, validate_after=30):
+        """
+        :param size: int | Maximum number of open connections
+        :param timeout: int | Seconds to wait for a free connection before giving up
+        :param validate_after: int | Seconds of idleness after which a connection is pinged before reuse
+        """
+        self.__params = {
+            'host': host,
+            'user': user,
+            'password': password,
+            'database': database,
+            'charset': 'utf8',
+            'autocommit': True
+        }
+        self.__size = size
+        self.__timeout = timeout
+        self.__validate_after = validate_after
+
+        self.__idle = []  # (connection, checked in at), the last checked in at the end
+        self.__lock = threading.Lock()
+        self.__available = threading.Condition(self.__lock)  # Notified when a connection or a slot is freed
+        self.__closed = False
+
+        self.__opened = 0
+        self.__in_use = 0
+        self.__checkouts = 0
+        self.__waits = 0
+        self.__reconnects = 0
+        self.__checkout_time = 0.0
+        self.__checkout_time_max = 0.0
+
+    @property
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'size': self.__size,
+                'opened': self.__opened,
+                'in_use': self.__in_use,
+                'idle': len(self.__idle),
+                'checkouts': self.__checkouts,
+                'waits': self.__waits,
+                'reconnects': self.__reconnects,
+                'checkout_time_avg': self.__checkout_time / self.__checkouts if self.__checkouts else 0.0,
+                'checkout_time_max': self.__checkout_time_max
+            }
+
+    def __connect(self):
+        return mysql.connector.connect(**self.__params)
+
+    def __checkout(self):
+        """
+        An idle connection, else a new one while fewer than `size` are open, else wait for one of them to be freed
+        """
+        start = time.monotonic()
+        item = None
+        with self.__available:
+            waited = False
+            while True:
+                if self.__closed:
+                    raise DatabaseException('Pool closed')
+                if len(self.__idle):
+                    item = self.__idle.pop()
+                    break
+                if self.__opened < self.__size:
+                    self.__opened += 1
+                    break
+                remaining = start + self.__timeout - time.monotonic()
+                if remaining <= 0:
+                    raise DatabaseException(f'No free connection after {self.__timeout} s')
+                if not waited:
+                    self.__waits += 1
+                    waited = True
+                self.__available.wait(remaining)
+
+        try:
+            if item is None:
+                connection = self.__connect()
+            else:
+                connection, checked_in_at = item
+                if time.monotonic() - checked_in_at > self.__validate_after and not connection.is_connected():
+                    connection.reconnect(attempts=2, delay=1)
+                    with self.__lock:
+                        self.__reconnects += 1
+        except Exception:
+            with self.__available:
+                self.__opened -= 1
+                self.__available.notify()  # A waiter may open a connection in this slot
+            raise
+
+        elapsed = time.monotonic() - start
+        with self.__lock:
+            self.__in_use += 1
+            self.__checkouts += 1
+            self.__checkout_time += elapsed
+            self.__checkout_time_max = max(self.__checkout_time_max, elapsed)
+        return connection
+
+    def __checkin(self, connection, broken=False) -> None:
+        with self.__available:
+            self.__in_use -= 1
+            discard = broken or self.__closed
+            if discard:
+                self.__opened -= 1
+            else:
+                self.__idle.append((connection, time.monotonic()))
+            self.__available.notify()  # Either a connection or a slot to open one is free
+        if discard:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def cursor(self):
+        connection = self.__checkout()
+        broken = False
+        cursor = None
+        try:
+            cursor = connection.cursor(named_tuple=True)
+            yield cursor
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    broken = True
+            self.__checkin(connection, broken)
+
+    def warm_up(self, connections: int = 1) -> None:
+        """
+        Open connections ahead of the first query
+        :param connections: int | How many, at most the pool size
+        """
+        opened = []
+        try:
+            for _ in range(min(connections, self.__size)):
+                opened.append(self.__checkout())
+        finally:
+            for connection in opened:
+                self.__checkin(connection)
+
+    def fetchall(self, sql, *args) -> list:
+        with self.cursor() as cursor:
+            cursor.execute(sql, args)
+            return cursor.fetchall()
 
-    def __init__(self, host, user, password, database):
-        self.__db = mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database,
-            charset='utf8',
-            autocommit=True
-        )
-        self.__cursor = self.__db.cursor(named_tuple=True)
+    def fetchone(self, sql, *args):
+        with self.cursor() as cursor:
+            cursor.execute(sql, args)
+            row = cursor.fetchone()
+            cursor.fetchall()  # Consume any remaining rows before the cursor is closed
+            return row
 
-    def execute(self, sql, *args):
-        self.__cursor.execute(sql, args)
-        return self.__cursor
+    def execute(self, sql, *args) -> int:
+        with self.cursor() as cursor:
+            cursor.execute(sql, args)
+            return cursor.rowcount
 
-    def commit(self):
-        self.__db.commit()
+    def executemany(self, sql, rows: list) -> int:
+        with self.cursor() as cursor:
+            cursor.executemany(sql, rows)
+            return cursor.rowcount
 
     def close(self):
-        self.__cursor.close()
-        self.__db.close()
+        with self.__available:
+            self.__closed = True
+            idle, self.__idle = self.__idle, []
+            self.__opened -= len(idle)
+            self.__available.notify_all()
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
@@ -0,0 +1,134 @@
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, date, timedelta
+
+from lib import Clock
+
+LogRow = namedtuple('LogRow', ['intIdDevice', 'dtaDate', 'boolState'])
+
+
+class HistoryCache:
+    """
+    Per-day state changes of the devices.
+    Past days never change: they are kept with LRU eviction and a miss loads the whole
+    `prefetch_days` ending on that day in one range query.
+    Today is loaded once and then kept current by `append` on every logged state change.
+    The changes appended yesterday are kept for a day and merged into yesterday when it is loaded,
+    as the last ones may not have been written yet.
+    """
+
+    def __init__(self, dao, max_days: int = 1024, prefetch_days: int = 7):
+        self.__dao = dao
+        self.__max_days = max_days
+        self.__prefetch_days = prefetch_days
+
+        self.__lock = threading.Lock()
+        self.__days = OrderedDict()  # (device_id, day) -> rows
+        self.__today = None
+        self.__today_rows = {}  # device_id -> rows
+        self.__today_loaded = set()
+        self.__yesterday = None
+        self.__yesterday_rows = {}  # device_id -> rows appended
+
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'days': len(self.__days),
+                'hits': self.__hits,
+                'misses': self.__misses
+            }
+
+    def get(self, device_id: int, day: date) -> list:
+        """
+        :return: list | State changes of the device on that day, oldest first
+        """
+        device_id = int(device_id)
+        with self.__lock:
+            self.__roll_over()
+            if day == self.__today:
+                if device_id in self.__today_loaded:
+                    self.__hits += 1
+                    return list(self.__today_rows[device_id])
+            elif (device_id, day) in self.__days:
+                self.__hits += 1
+                self.__days.move_to_end((device_id, day))
+                return self.__days[(device_id, day)]
+            self.__misses += 1
+            today = self.__today
+
+        if day == today:
+            return self.__load_today(device_id, today)
+        elif day > today:
+            return []
+        return self.__load_days(device_id, day, today)
+
+    def append(self, device_id: int, dta_date: datetime, state: int) -> None:
+        """
+        Record a state change of today, before it is written to the database
+        """
+        with self.__lock:
+            self.__roll_over()
+            if dta_date.date() == self.__today:
+                self.__today_rows.setdefault(int(device_id), []).append(LogRow(int(device_id), dta_date, state))
+
+    def __roll_over(self) -> None:
+        today = Clock.today()
+        if self.__today == today:
+            return
+
+        if self.__today is not None:  # Yesterday is now a closed day
+            for device_id in self.__today_loaded:
+                self.__store(device_id, self.__today, self.__today_rows[device_id])
+        self.__yesterday, self.__yesterday_rows = self.__today, self.__today_rows
+        self.__today = today
+        self.__today_rows = {}
+        self.__today_loaded = set()
+
+    def __load_today(self, device_id: int, today: date) -> list:
+        start = datetime.combine(today, datetime.min.time())
+        rows = self.__dao.get_device_powers_on(device_id, start, start + timedelta(days=1))
+
+        with self.__lock:
+            if self.__today != today:  # Day changed during the query
+                return list(rows)
+            if device_id not in self.__today_loaded:
+                self.__today_rows[device_id] = _merge(rows, self.__today_rows.get(device_id, []))
+                self.__today_loaded.add(device_id)
+            return list(self.__today_rows[device_id])
+
+    def __load_days(self, device_id: int, day: date, today: date) -> list:
+        first = day - timedelta(days=self.__prefetch_days - 1)
+        start = datetime.combine(first, datetime.min.time())
+        end = datetime.combine(min(day + timedelta(days=1), today), datetime.min.time())
+        rows = self.__dao.get_device_powers_on(device_id, start, end)
+
+        days = {first + timedelta(days=i): [] for i in range((end - start).days)}
+        for row in rows:
+            days[row.dtaDate.date()].append(row)
+
+        with self.__lock:
+            if self.__yesterday in days:  # Its last changes may still be queued for writing
+                days[self.__yesterday] = _merge(days[self.__yesterday], self.__yesterday_rows.get(device_id, []))
+            for _day, _rows in days.items():
+                if (device_id, _day) not in self.__days:
+                    self.__store(device_id, _day, _rows)
+        return days[day]
+
+    def __store(self, device_id: int, day: date, rows: list) -> None:
+        self.__days[(device_id, day)] = rows
+        self.__days.move_to_end((device_id, day))
+        while len(self.__days) > self.__max_days:
+            self.__days.popitem(last=False)
+
+
+def _merge(rows: list, appended: list) -> list:
+    """
+    Rows read from the database and the appended ones not among them, oldest first
+    """
+    known = set((row.dtaDate, row.boolState) for row in rows)
+    return sorted(list(rows) + [row for row in appended if (row.dtaDate, row.boolState) not in known],
+                  key=lambda row: row.dtaDate)
@@ -0,0 +1,132 @@
+import time as tm
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from database.BatchWriter import BatchWriter
+from database.DAO import DAO
+from lib import Clock
+from lib.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Aggregate of the samples of one bucket
+Rollup = namedtuple('Rollup', ['date', 'count', 'mean', 'min', 'max'])
+
+RAW = 0
+MINUTE = 60
+HOUR = 60 * 60
+DAY = 24 * 60 * 60
+
+
+class TimeSeries:
+    """
+    Power history: raw samples and their per-minute, per-hour and per-day rollups.
+    Samples are queued and written in batches by a BatchWriter; every batch is also aggregated in memory
+    and merged into the rollups with one upsert per batch, so rollups are never recomputed from the raw rows.
+    Each tier keeps its rows for its own retention, queries read the coarsest tier that fits the range.
+    """
+
+    DEFAULT_RETENTION = {RAW: timedelta(days=2), MINUTE: timedelta(days=14), HOUR: timedelta(days=180), DAY: None}
+
+    def __init__(self, dao: DAO, retention: dict = None, batch_size: int = 500, interval: float = 10.0,
+                 prune_interval: float = 60 * 60):
+        """
+        :param retention: dict | Resolution (RAW, MINUTE, HOUR, DAY) -> timedelta rows are kept, None for ever
+        :param prune_interval: float | Seconds between two deletions of the expired rows
+        """
+        self.__dao = dao
+        self.__retention = retention if retention is not None else self.DEFAULT_RETENTION
+        self.__resolutions = [resolution for resolution in (MINUTE, HOUR, DAY) if resolution in self.__retention]
+        self.__prune_interval = prune_interval
+        self.__pruned_at = None
+        self.__writer = BatchWriter(self.__write, batch_size=batch_size, interval=interval, name='TimeSeries')
+
+    @property
+    def stats(self) -> dict:
+        return self.__writer.stats
+
+    def record(self, series: str, value: float, date: datetime = None) -> None:
+        """
+        Queue a sample, from any thread
+        :param series: str | e.g. device.12, site.PV
+        """
+        date = date if date is not None else Clock.now()
+        self.__writer.put((series, date.replace(microsecond=0), float(value)))
+
+    def query(self, series: str, start: datetime, end: datetime, resolution: int = None) -> list:
+        """
+        :param resolution: int | RAW, MINUTE, HOUR or DAY, picked from the length of the range if None
+        :return: list | Rollup, oldest first; raw samples are rollups of one sample
+        """
+        if resolution is None:
+            resolution = self.__pick(start, end)
+        if resolution == RAW:
+            return [Rollup(row.dtaDate, 1, row.dblValue, row.dblValue, row.dblValue)
+                    for row in self.__dao.get_power_samples(series, start, end)]
+        return [Rollup(row.dtaDate, row.intCount, row.dblSum / row.intCount, row.dblMin, row.dblMax)
+                for row in self.__dao.get_power_rollups(series, resolution, start, end)]
+
+    def mean(self, series: str, start: datetime, end: datetime) -> float or None:
+        """
+        Mean of the samples in the range, from the coarsest rollups
+        """
+        rows = self.query(series, start, end)
+        count = sum(row.count for row in rows)
+        return sum(row.mean * row.count for row in rows) / count if count else None
+
+    def flush(self) -> None:
+        self.__writer.flush()
+
+    def close(self) -> None:
+        self.__writer.close()
+
+    def __pick(self, start: datetime, end: datetime) -> int:
+        """
+        Minutes up to 6 hours, hours up to 7 days, then days; coarser if the tier no longer keeps `start`
+        """
+        span = (end - start).total_seconds()
+        wanted = DAY if span > 7 * DAY else HOUR if span > 6 * HOUR else MINUTE
+        now = Clock.now()
+        for resolution in self.__resolutions:
+            retention = self.__retention[resolution]
+            if resolution >= wanted and (retention is None or start >= now - retention):
+                return resolution
+        return self.__resolutions[-1] if len(self.__resolutions) else RAW
+
+    def __write(self, rows: list) -> None:
+        self.__dao.log_power_samples(rows)
+
+        rollups = {}  # (resolution, series, bucket) -> [count, sum, min, max]
+        for series, date, value in rows:
+            midnight = date.replace(hour=0, minute=0, second=0)
+            seconds = (date - midnight).seconds
+            for resolution in self.__resolutions:
+                key = (resolution, series, midnight + timedelta(seconds=seconds - seconds % resolution))
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollups[key] = [1, value, value, value]
+                else:
+                    rollup[0] += 1
+                    rollup[1] += value
+                    rollup[2] = min(rollup[2], value)
+                    rollup[3] = max(rollup[3], value)
+        self.__dao.merge_power_rollups([key + tuple(rollup) for key, rollup in rollups.items()])
+
+        if self.__pruned_at is None or tm.monotonic() - self.__pruned_at > self.__prune_interval:
+            self.__pruned_at = tm.monotonic()
+            try:  # Not retried with the batch, it is already merged
+                self.__prune()
+            except Exception as e:
+                logger.warning('TIMESERIES: prune failed: %s', repr(e))
+
+    def __prune(self) -> None:
+        now = Clock.now()
+        for resolution, retention in self.__retention.items():
+            if retention is None:
+                continue
+            if resolution == RAW:
+                deleted = self.__dao.delete_power_samples(now - retention)
+            else:
+                deleted = self.__dao.delete_power_rollups(resolution, now - retention)
+            if deleted:
+                logger.debug('TIMESERIES: %s expired rows deleted at resolution %s', deleted, resolution)
@@ -11,6 +11,7 @@ CREATE TABLE `devices` (
   `intUsage` int(11) NOT NULL,
   `timeDelayBeforePowerOff` time NOT NULL DEFAULT '00:00:00',
   `boolSolarPowerOn` tinyint(1) NOT NULL DEFAULT 1,
+  `intPriority` int(11) NOT NULL DEFAULT 0,
   `boolDisable` tinyint(1) NOT NULL DEFAULT 0,
   PRIMARY KEY (`intIdDevice`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
@@ -23,6 +24,7 @@ CREATE TABLE `logs` (
   `dtaDate` datetime NOT NULL DEFAULT current_timestamp(),
   `boolState` tinyint(1) NOT NULL,
   PRIMARY KEY (`intIdDevice`,`dtaDate`,`boolState`),
+  KEY `idxLastState` (`intIdDevice`,`boolState`,`dtaDate`),
   FOREIGN KEY (`intIdDevice`) REFERENCES `devices` (`intIdDevice`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
 
@@ -61,4 +63,57 @@ CREATE TABLE `users` (
   PRIMARY KEY (`strIdTelegram`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
 
+--
+-- Table structure for table `configchanges`
+-- Filled by the triggers below: one row for every change of a device or of its times always power on
+--
+CREATE TABLE `configchanges` (
+  `intIdChange` int(11) NOT NULL AUTO_INCREMENT,
+  `intIdDevice` int(11) NOT NULL,
+  `dtaDate` datetime NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`intIdChange`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TRIGGER `trgDevicesInsert` AFTER INSERT ON `devices`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (NEW.`intIdDevice`);
+CREATE TRIGGER `trgDevicesUpdate` AFTER UPDATE ON `devices`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (NEW.`intIdDevice`);
+CREATE TRIGGER `trgDevicesDelete` AFTER DELETE ON `devices`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (OLD.`intIdDevice`);
+CREATE TRIGGER `trgTimesInsert` AFTER INSERT ON `timesalwayspoweron`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (NEW.`intIdDevice`);
+CREATE TRIGGER `trgTimesUpdate` AFTER UPDATE ON `timesalwayspoweron`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (NEW.`intIdDevice`);
+CREATE TRIGGER `trgTimesDelete` AFTER DELETE ON `timesalwayspoweron`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (OLD.`intIdDevice`);
+
+--
+-- Table structure for table `powersamples`
+-- Raw power readings: `device.<intIdDevice>` for the measured consumption of a device,
+-- `site.PV`, `site.LOAD` and `site.GRID` for the SolarEdge power flow
+--
+CREATE TABLE `powersamples` (
+  `strSeries` varchar(32) NOT NULL,
+  `dtaDate` datetime NOT NULL,
+  `dblValue` double NOT NULL,
+  PRIMARY KEY (`strSeries`,`dtaDate`),
+  KEY `idxDate` (`dtaDate`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+--
+-- Table structure for table `powerrollups`
+-- Aggregates of `powersamples` per minute, hour and day (intResolution seconds), merged as samples are written
+--
+CREATE TABLE `powerrollups` (
+  `intResolution` int(11) NOT NULL,
+  `strSeries` varchar(32) NOT NULL,
+  `dtaDate` datetime NOT NULL,
+  `intCount` int(11) NOT NULL,
+  `dblSum` double NOT NULL,
+  `dblMin` double NOT NULL,
+  `dblMax` double NOT NULL,
+  PRIMARY KEY (`intResolution`,`strSeries`,`dtaDate`),
+  KEY `idxDate` (`intResolution`,`dtaDate`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
 ---
@@ -0,0 +1,5 @@
+--
+-- Lets MAX(dtaDate) ... WHERE boolState = ? GROUP BY intIdDevice use a loose index scan
+-- instead of reading every row of `logs` (see DAO.get_devices_snapshot)
+--
+ALTER TABLE `logs` ADD KEY `idxLastState` (`intIdDevice`,`boolState`,`dtaDate`);
@@ -0,0 +1,22 @@
+--
+-- Change tracking of the devices configuration, read incrementally by controller.get_devices
+--
+CREATE TABLE `configchanges` (
+  `intIdChange` int(11) NOT NULL AUTO_INCREMENT,
+  `intIdDevice` int(11) NOT NULL,
+  `dtaDate` datetime NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`intIdChange`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TRIGGER `trgDevicesInsert` AFTER INSERT ON `devices`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (NEW.`intIdDevice`);
+CREATE TRIGGER `trgDevicesUpdate` AFTER UPDATE ON `devices`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (NEW.`intIdDevice`);
+CREATE TRIGGER `trgDevicesDelete` AFTER DELETE ON `devices`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (OLD.`intIdDevice`);
+CREATE TRIGGER `trgTimesInsert` AFTER INSERT ON `timesalwayspoweron`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (NEW.`intIdDevice`);
+CREATE TRIGGER `trgTimesUpdate` AFTER UPDATE ON `timesalwayspoweron`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (NEW.`intIdDevice`);
+CREATE TRIGGER `trgTimesDelete` AFTER DELETE ON `timesalwayspoweron`
+  FOR EACH ROW INSERT INTO `configchanges` (`intIdDevice`) VALUES (OLD.`intIdDevice`);
@@ -0,0 +1,4 @@
+--
+-- Priority of a device when the solar surplus is shared (see control/allocation.py), higher first
+--
+ALTER TABLE `devices` ADD `intPriority` int(11) NOT NULL DEFAULT 0 AFTER `boolSolarPowerOn`;
@@ -0,0 +1,27 @@
+--
+-- Power history, written by database/TimeSeries.py
+-- Raw power readings: `device.<intIdDevice>` for the measured consumption of a device,
+-- `site.PV`, `site.LOAD` and `site.GRID` for the SolarEdge power flow
+--
+CREATE TABLE `powersamples` (
+  `strSeries` varchar(32) NOT NULL,
+  `dtaDate` datetime NOT NULL,
+  `dblValue` double NOT NULL,
+  PRIMARY KEY (`strSeries`,`dtaDate`),
+  KEY `idxDate` (`dtaDate`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+--
+-- Aggregates of `powersamples` per minute, hour and day (intResolution seconds), merged as samples are written
+--
+CREATE TABLE `powerrollups` (
+  `intResolution` int(11) NOT NULL,
+  `strSeries` varchar(32) NOT NULL,
+  `dtaDate` datetime NOT NULL,
+  `intCount` int(11) NOT NULL,
+  `dblSum` double NOT NULL,
+  `dblMin` double NOT NULL,
+  `dblMax` double NOT NULL,
+  PRIMARY KEY (`intResolution`,`strSeries`,`dtaDate`),
+  KEY `idxDate` (`intResolution`,`dtaDate`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
@@ -0,0 +1,40 @@
+import time
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service: after `threshold` consecutive failures the circuit opens
+    and every call is refused for `cooldown` seconds, then a single trial call is let through
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold: int = 3, cooldown: float = 300):
+        self.__threshold = threshold
+        self.__cooldown = cooldown
+
+        self.__state = self.CLOSED
+        self.__failures = 0
+        self.__opened_at = None
+
+    @property
+    def state(self) -> str:
+        return self.__state
+
+    def allow(self) -> bool:
+        if self.__state == self.OPEN and time.monotonic() - self.__opened_at >= self.__cooldown:
+            self.__state = self.HALF_OPEN
+            return True
+        return self.__state == self.CLOSED
+
+    def success(self) -> None:
+        self.__state = self.CLOSED
+        self.__failures = 0
+
+    def failure(self) -> None:
+        self.__failures += 1
+        if self.__state == self.HALF_OPEN or self.__failures >= self.__threshold:
+            self.__state = self.OPEN
+            self.__opened_at = time.monotonic()
@@ -0,0 +1,92 @@
+import asyncio
+import time as tm
+from datetime import datetime, date, timedelta
+
+
+class SystemClock:
+    """
+    The wall clock
+    """
+
+    @staticmethod
+    def now() -> datetime:
+        return datetime.now()
+
+    @staticmethod
+    def today() -> date:
+        return date.today()
+
+    @staticmethod
+    def time() -> float:
+        return tm.time()
+
+
+class VirtualClock(SystemClock):
+    """
+    Time that only moves forward when the event loop it is installed on would wait.
+    The loop time becomes the virtual time, and a wait for the next timer becomes a jump to it:
+    sleeps, call_later and TimerService timers fire in order, as fast as the callbacks run.
+    Threads and blocking calls still take real time, which does not move the virtual clock.
+    """
+
+    def __init__(self, start: datetime):
+        self.__start = start
+        self.__elapsed = 0.0
+
+    def now(self) -> datetime:
+        return self.__start + timedelta(seconds=self.__elapsed)
+
+    def today(self) -> date:
+        return self.now().date()
+
+    def time(self) -> float:
+        return self.now().timestamp()
+
+    def monotonic(self) -> float:
+        """ Seconds since `start` """
+        return self.__elapsed
+
+    def advance(self, seconds: float) -> None:
+        self.__elapsed += max(seconds, 0)
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Drive `loop` with this clock, before it runs. Only selector event loops are supported.
+        """
+        selector = loop._selector
+        select = selector.select
+
+        def virtual_select(timeout: float = None) -> list:
+            events = select(0)
+            if not len(events):
+                if timeout is None:  # Nothing scheduled, only I/O can wake the loop
+                    events = select(None)
+                else:
+                    self.advance(timeout)
+            return events
+
+        loop.time = self.monotonic
+        selector.select = virtual_select
+
+
+_clock = SystemClock()
+
+
+def set_clock(clock: SystemClock) -> None:
+    """
+    Make `clock` the time of the process, e.g. a VirtualClock for a replay
+    """
+    global _clock
+    _clock = clock
+
+
+def now() -> datetime:
+    return _clock.now()
+
+
+def today() -> date:
+    return _clock.today()
+
+
+def time() -> float:
+    return _clock.time()
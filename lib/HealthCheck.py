@@ -0,0 +1,81 @@
+import asyncio
+import aiohttp
+
+from lib.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class HealthCheck:
+    """
+    Fire-and-forget signals to a healthchecks.io style endpoint:
+    `start` when a run begins, `success` or `fail` when it ends, each with a short message.
+    Signals are sent in the background over one kept-alive connection and never block the caller.
+    """
+
+    def __init__(self, webhook_url: str, timeout: float = 10, max_pending: int = 10):
+        """
+        :param timeout: float | Seconds before a signal is given up
+        :param max_pending: int | Signals in flight beyond which new ones are dropped
+        """
+        self.__webhook_url = webhook_url.rstrip('/') if webhook_url else None
+        self.__timeout = aiohttp.ClientTimeout(total=timeout)
+        self.__max_pending = max_pending
+
+        self.__session = None
+        self.__pending = set()
+
+        self.__sent = 0
+        self.__failures = 0
+        self.__dropped = 0
+        self.__last_error = None
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'pending': len(self.__pending),
+            'sent': self.__sent,
+            'failures': self.__failures,
+            'dropped': self.__dropped,
+            'last_error': self.__last_error
+        }
+
+    def start(self, message: str = '') -> None:
+        self.__signal('/start', message)
+
+    def success(self, message: str = '') -> None:
+        self.__signal('', message)
+
+    def fail(self, message: str = '') -> None:
+        self.__signal('/fail', message)
+
+    async def async_close(self) -> None:
+        if len(self.__pending):
+            await asyncio.wait(self.__pending, timeout=self.__timeout.total)
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    def __signal(self, path: str, message: str) -> None:
+        if self.__webhook_url is None:
+            return
+        if len(self.__pending) >= self.__max_pending:
+            self.__dropped += 1
+            logger.warning('Health check: %s signals pending, %s dropped', len(self.__pending), path or 'success')
+            return
+
+        task = asyncio.ensure_future(self.__async_send(self.__webhook_url + path, message))
+        self.__pending.add(task)
+        task.add_done_callback(self.__pending.discard)
+
+    async def __async_send(self, url: str, message: str) -> None:
+        if self.__session is None or self.__session.closed:
+            self.__session = aiohttp.ClientSession(timeout=self.__timeout)
+        try:
+            async with self.__session.post(url, data=message.encode()) as response:
+                response.raise_for_status()
+            self.__sent += 1
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.__failures += 1
+            self.__last_error = repr(e)
+            logger.warning('Health check failed: %s', repr(e))
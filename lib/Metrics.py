@@ -0,0 +1,193 @@
+import math
+from bisect import bisect_left
+
+
+class Counter:
+    """
+    Value that only goes up
+    """
+
+    def __init__(self):
+        self.__value = 0.0
+
+    @property
+    def value(self) -> float:
+        return self.__value
+
+    def inc(self, amount: float = 1) -> None:
+        self.__value += amount
+
+
+class Gauge:
+    """
+    Value that goes up and down, or read from `function` when collected
+    """
+
+    def __init__(self, function=None):
+        self.__value = 0.0
+        self.__function = function
+
+    @property
+    def value(self) -> float:
+        return self.__function() if self.__function is not None else self.__value
+
+    def set(self, value: float) -> None:
+        self.__value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.__value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.__value -= amount
+
+
+class Histogram:
+    """
+    Distribution of observed values in fixed buckets (upper bounds, Prometheus style)
+    """
+
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.__buckets = tuple(sorted(buckets))
+        self.__counts = [0] * (len(self.__buckets) + 1)  # Last one is +Inf
+        self.__sum = 0.0
+        self.__count = 0
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    @property
+    def sum(self) -> float:
+        return self.__sum
+
+    @property
+    def buckets(self) -> list:
+        """
+        :return: list | (upper bound, cumulative count) pairs, the last upper bound is inf
+        """
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.__buckets + (float('inf'),), self.__counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        return result
+
+    def observe(self, value: float) -> None:
+        self.__counts[bisect_left(self.__buckets, value)] += 1
+        self.__sum += value
+        self.__count += 1
+
+    def quantile(self, q: float) -> float or None:
+        """
+        Estimate of the q-quantile, linearly interpolated inside its bucket
+        """
+        if not self.__count:
+            return None
+        rank = q * self.__count
+        lower = 0.0
+        cumulative = 0
+        for bound, count in zip(self.__buckets, self.__counts):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return lower
+
+
+class Family:
+    """
+    A named metric and its children, one per combination of label values.
+    Children are created on the first `labels()` call and reused: callers on a hot path keep the child.
+    """
+
+    def __init__(self, kind: str, name: str, documentation: str, labels: tuple, factory):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.__factory = factory
+        self.__children = {}
+
+    @property
+    def children(self) -> list:
+        """
+        :return: list | (label values, metric) pairs
+        """
+        return list(self.__children.items())
+
+    def labels(self, *values):
+        child = self.__children.get(values)
+        if child is None:
+            child = self.__children.setdefault(values, self.__factory())
+        return child
+
+
+class Registry:
+    """
+    Metrics of the process, rendered in the Prometheus text format.
+    Metrics are plain attribute updates, without locks: an update racing with another thread may rarely be lost,
+    which is acceptable for monitoring and keeps the hot path cheap.
+    """
+
+    def __init__(self):
+        self.__families = {}
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()):
+        """
+        :return: Counter, or its Family if there are labels
+        """
+        return self.__get('counter', name, documentation, labels, Counter)
+
+    def gauge(self, name: str, documentation: str, labels: tuple = (), function=None):
+        """
+        :param function: callable | Read when collected, only without labels
+        :return: Gauge, or its Family if there are labels
+        """
+        return self.__get('gauge', name, documentation, labels, lambda: Gauge(function))
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = Histogram.DEFAULT_BUCKETS):
+        """
+        :return: Histogram, or its Family if there are labels
+        """
+        return self.__get('histogram', name, documentation, labels, lambda: Histogram(buckets))
+
+    def __get(self, kind: str, name: str, documentation: str, labels: tuple, factory):
+        family = self.__families.get(name)
+        if family is None:
+            family = self.__families.setdefault(name, Family(kind, name, documentation, tuple(labels), factory))
+        return family if len(family.label_names) else family.labels()
+
+    def render(self) -> str:
+        lines = []
+        for family in list(self.__families.values()):
+            lines.append(f'# HELP {family.name} {family.documentation}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for values, metric in family.children:
+                labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(family.label_names, values))
+                if family.kind == 'histogram':
+                    for bound, count in metric.buckets:
+                        le = f'le="{_format(bound)}"'
+                        lines.append(f'{family.name}_bucket{{{labels + "," + le if labels else le}}} {count}')
+                    suffix = f'{{{labels}}}' if labels else ''
+                    lines.append(f'{family.name}_sum{suffix} {_format(metric.sum)}')
+                    lines.append(f'{family.name}_count{suffix} {metric.count}')
+                else:
+                    lines.append(f'{family.name}{{{labels}}} {_format(metric.value)}' if labels
+                                 else f'{family.name} {_format(metric.value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# Metrics of the process
+REGISTRY = Registry()
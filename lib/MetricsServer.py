@@ -0,0 +1,56 @@
+import asyncio
+
+from lib.logger import get_logger
+from lib.Metrics import Registry
+
+logger = get_logger(__name__)
+
+
+class MetricsServer:
+    """
+    Minimal HTTP server on the event loop: GET /metrics answers the registry in the Prometheus text format
+    """
+
+    def __init__(self, registry: Registry, host: str = '127.0.0.1', port: int = 9464):
+        self.__registry = registry
+        self.__host = host
+        self.__port = port
+        self.__server = None
+
+    @property
+    def port(self) -> int or None:
+        """ Port listened to, the actual one if 0 was asked """
+        if self.__server is None or not len(self.__server.sockets):
+            return None
+        return self.__server.sockets[0].getsockname()[1]
+
+    async def async_start(self) -> None:
+        self.__server = await asyncio.start_server(self.__handle, self.__host, self.__port)
+        logger.info('METRICS: listening on %s:%s', self.__host, self.port)
+
+    async def async_stop(self) -> None:
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass  # Headers are not needed
+
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.__registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+            writer.write(f'HTTP/1.1 {status}\r\n'
+                         f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         f'Content-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug('METRICS: %s', repr(e))
+        finally:
+            writer.close()
@@ -0,0 +1,331 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import os
+import time as tm
+from datetime import datetime
+
+from lib.logger import get_logger
+from lib.Metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+# Metrics
+LOOP_LAG = REGISTRY.histogram('meross_event_loop_lag_seconds', 'Delay of the event loop in running a due timer',
+                              buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+STALLS = REGISTRY.counter('meross_event_loop_stalls_total', 'Times the event loop was blocked over the threshold')
+SLOW_TICKS = REGISTRY.counter('meross_slow_ticks_total', 'Traces over the profiling budget')
+
+# Innermost open span of the running task, and its trace; tasks created inside a span (gather) inherit them
+_current = contextvars.ContextVar('span', default=None)
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+class Span:
+    """
+    A named wall clock interval, and the spans opened inside it.
+    Children of concurrent tasks overlap, so their durations may add up to more than their parent's.
+    """
+
+    __slots__ = ('name', 'attributes', 'parent', 'start', 'end', 'children')
+
+    def __init__(self, name: str, attributes: dict, parent=None):
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.start = tm.perf_counter()
+        self.end = None
+        self.children = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else tm.perf_counter()) - self.start
+
+    @property
+    def label(self) -> str:
+        values = [str(value) for value in self.attributes.values() if isinstance(value, (str, int, float))]
+        return ' '.join([self.name] + values).replace(';', ',')
+
+    @property
+    def ancestors(self) -> list:
+        """
+        :return: list | Spans from the root down to this one
+        """
+        spans = [self]
+        while spans[0].parent is not None:
+            spans.insert(0, spans[0].parent)
+        return spans
+
+    def path(self, start: float, end: float) -> list:
+        """
+        :return: list | Spans from this one down to the innermost one overlapping [start, end] the most
+        """
+        best, overlap = None, 0
+        for child in self.children:
+            covered = min(end, child.end if child.end is not None else end) - max(start, child.start)
+            if covered > overlap:
+                best, overlap = child, covered
+        return [self] + (best.path(start, end) if best is not None else [])
+
+    def to_dict(self, origin: float) -> dict:
+        """
+        :param origin: float | perf_counter() the start offsets are relative to
+        """
+        return {
+            'name': self.name,
+            'attributes': self.attributes,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3),
+            'children': [child.to_dict(origin) for child in self.children]
+        }
+
+    def folded(self, prefix: str = '') -> list:
+        """
+        :return: list | 'root;child;leaf <self time in µs>' lines, the input of flamegraph.pl and speedscope
+        """
+        path = f'{prefix};{self.label}' if prefix else self.label
+        own = self.duration - sum(child.duration for child in self.children)
+        lines = [f'{path} {max(round(own * 1e6), 0)}']
+        for child in self.children:
+            lines.extend(child.folded(path))
+        return lines
+
+
+class _SpanContext:
+    """
+    Times a block: its duration goes to `histogram`, and it is added as a Span to the trace being recorded, if any.
+    Blocking code does not let other tasks run, so a stall noticed at a span boundary happened in the code
+    of the task crossing it: it is blamed on the span being left, or on the parent of the span being entered.
+    """
+
+    __slots__ = ('__name', '__histogram', '__attributes', '__start', '__span', '__token')
+
+    def __init__(self, name: str, histogram, attributes: dict):
+        self.__name = name
+        self.__histogram = histogram
+        self.__attributes = attributes
+        self.__span = None
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None:
+            _trace.get().check(parent)
+            self.__span = Span(self.__name, self.__attributes, parent)
+            parent.children.append(self.__span)
+            self.__token = _current.set(self.__span)
+        self.__start = tm.perf_counter()
+        return self.__span
+
+    def __exit__(self, *_):
+        end = tm.perf_counter()
+        if self.__histogram is not None:
+            self.__histogram.observe(end - self.__start)
+        if self.__span is not None:
+            self.__span.end = end
+            _trace.get().check(self.__span)
+            _current.reset(self.__token)
+
+
+class _Trace:
+    """
+    Root span of a profiled run, with the event loop stalls seen while it ran
+    and the tasks that were pending when it went over budget
+    """
+
+    def __init__(self, profiler, name: str, attributes: dict):
+        self.__profiler = profiler
+        self.root = Span(name, attributes)
+        self.stalls = []  # (start, end, Span or None if not blamed yet) perf_counter()
+        self.tasks = None
+        self.__token = None
+        self.__trace_token = None
+        self.__handle = None
+
+    def __enter__(self):
+        self.root.start = tm.perf_counter()
+        self.__token = _current.set(self.root)
+        self.__trace_token = _trace.set(self)
+        self.__handle = asyncio.get_running_loop().call_later(self.__profiler.budget, self.__capture)
+        self.__profiler.traces.add(self)
+        return self.root
+
+    def __exit__(self, *_):
+        self.root.end = tm.perf_counter()
+        self.check(self.root)
+        _current.reset(self.__token)
+        _trace.reset(self.__trace_token)
+        self.__handle.cancel()
+        self.__profiler.traces.discard(self)
+        if self.root.duration > self.__profiler.budget:
+            self.__profiler.dump(self)
+
+    def check(self, span: Span) -> None:
+        """
+        Blame `span` for the stall going on, if the watchdog is overdue
+        """
+        start = self.__profiler.overdue()
+        if start is not None:
+            self.stalls.append((start, tm.perf_counter(), span))
+
+    def __capture(self) -> None:
+        self.tasks = [_describe(task) for task in asyncio.all_tasks() if not task.done()]
+
+
+class Profiler:
+    """
+    Opt-in tracing of the control loop, and an always running event loop watchdog.
+    `trace` records the spans opened with `span` inside it, including those of the tasks it gathers;
+    a trace over `budget` is written to `directory` as a JSON span tree and as folded stacks,
+    with the pending tasks and the event loop stalls attributed to the span they happened in.
+    Spans also feed a histogram, whether profiling is enabled or not.
+    """
+
+    def __init__(self, enabled: bool = False, budget: float = 5, directory: str = 'profiles', keep: int = 50,
+                 lag_interval: float = 0.5, stall_threshold: float = 0.1):
+        """
+        :param enabled: bool | Record traces, spans only feed their histogram otherwise
+        :param budget: float | Seconds beyond which a trace is written to disk
+        :param directory: str | Where slow traces are written
+        :param keep: int | Slow traces kept, the oldest are deleted
+        :param lag_interval: float | Seconds between two wake-ups of the watchdog
+        :param stall_threshold: float | Seconds of event loop lag logged as a stall
+        """
+        self.budget = budget
+        self.traces = set()  # Being recorded
+        self.__enabled = enabled
+        self.__directory = directory
+        self.__keep = keep
+        self.__lag_interval = lag_interval
+        self.__stall_threshold = stall_threshold
+
+        self.__task = None
+        self.__expected = None  # perf_counter() the watchdog is due to wake up
+        self.__blamed = None  # __expected of the last stall blamed on a span
+        self.__slow = 0
+        self.__stalls = 0
+        self.__max_lag = 0.0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'slow': self.__slow,
+            'stalls': self.__stalls,
+            'max_lag': round(self.__max_lag, 3)
+        }
+
+    def start(self) -> None:
+        if self.__task is None:
+            self.__task = asyncio.ensure_future(self.__async_watch_lag())
+
+    async def async_stop(self) -> None:
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+            self.__expected = None
+
+    def trace(self, name: str, **attributes):
+        """
+        Context manager recording a trace, on the event loop; does nothing if profiling is disabled
+        """
+        if not self.__enabled:
+            return contextlib.nullcontext()
+        return _Trace(self, name, attributes)
+
+    @staticmethod
+    def span(name: str, histogram=None, **attributes):
+        """
+        Context manager timing a block as a child of the current span
+        :param histogram: Histogram | Observes the duration of the block
+        """
+        return _SpanContext(name, histogram, attributes)
+
+    def overdue(self) -> float or None:
+        """
+        :return: float or None | When the watchdog was due, if it is late by a stall that was not blamed yet
+        """
+        expected = self.__expected
+        if expected is None or expected == self.__blamed or tm.perf_counter() - expected < self.__stall_threshold:
+            return None
+        self.__blamed = expected
+        return expected
+
+    def dump(self, trace: _Trace) -> None:
+        """
+        Write a slow trace to disk, in the background
+        """
+        self.__slow += 1
+        SLOW_TICKS.inc()
+        root = trace.root
+        stalls = [{
+            'start_ms': round((start - root.start) * 1000, 3),
+            'duration_ms': round((end - start) * 1000, 3),
+            'span': ' > '.join(span.label for span in (blamed.ancestors if blamed is not None
+                                                        else root.path(start, end)))
+        } for start, end, blamed in trace.stalls]
+        data = {
+            'date': datetime.now().isoformat(timespec='milliseconds'),
+            'budget_ms': round(self.budget * 1000, 3),
+            'duration_ms': round(root.duration * 1000, 3),
+            'spans': root.to_dict(root.start),
+            'stalls': stalls,
+            'tasks': trace.tasks if trace.tasks is not None else []
+        }
+        path = os.path.join(self.__directory, f'{root.name}-{datetime.now():%Y%m%d-%H%M%S-%f}')
+        logger.warning('PROFILER: %s took %.3f s, over the %.3f s budget, %s stalls: %s.json',
+                       root.name, root.duration, self.budget, len(stalls), path)
+        asyncio.get_running_loop().run_in_executor(None, self.__write, path, data, root.folded())
+
+    def __write(self, path: str, data: dict, folded: list) -> None:
+        try:
+            os.makedirs(self.__directory, exist_ok=True)
+            with open(f'{path}.json', 'w') as file:
+                json.dump(data, file, indent=2, default=str)
+            with open(f'{path}.folded', 'w') as file:
+                file.write('\n'.join(folded) + '\n')
+
+            names = sorted({os.path.splitext(name)[0] for name in os.listdir(self.__directory)
+                            if name.endswith(('.json', '.folded'))}, key=lambda name: name.rsplit('-', 3)[-3:])
+            for name in names[:max(len(names) - self.__keep, 0)]:
+                for extension in ('.json', '.folded'):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(os.path.join(self.__directory, name + extension))
+        except OSError as e:
+            logger.error('PROFILER: %s', repr(e))
+
+    async def __async_watch_lag(self) -> None:
+        """
+        Sleep `lag_interval` over and over: waking up late means something blocked the event loop meanwhile
+        """
+        while True:
+            self.__expected = expected = tm.perf_counter() + self.__lag_interval
+            await asyncio.sleep(self.__lag_interval)
+            now = tm.perf_counter()
+            self.__expected = None
+            lag = max(now - expected, 0)
+            LOOP_LAG.observe(lag)
+            self.__max_lag = max(self.__max_lag, lag)
+            if lag < self.__stall_threshold:
+                continue
+
+            self.__stalls += 1
+            STALLS.inc()
+            if expected != self.__blamed:  # Not seen at a span boundary, blamed on the spans it overlaps
+                for trace in self.traces:
+                    trace.stalls.append((expected, now, None))
+            logger.warning('PROFILER: event loop blocked for %.3f s', lag)
+
+
+def _describe(task: asyncio.Task) -> dict:
+    """
+    :return: dict | Name of the task, and where each coroutine of its await chain is suspended
+    """
+    stack = []
+    awaited = task.get_coro()
+    while awaited is not None:
+        frame = getattr(awaited, 'cr_frame', None) or getattr(awaited, 'gi_frame', None)
+        if frame is None:
+            break
+        stack.append(f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})')
+        awaited = getattr(awaited, 'cr_await', None) or getattr(awaited, 'gi_yieldfrom', None)
+    return {'name': task.get_name(), 'stack': stack}
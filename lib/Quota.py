@@ -0,0 +1,75 @@
+from datetime import datetime, date, time
+
+
+class QuotaBudget:
+    """
+    Daily API request quota, spread over the remaining daylight.
+    The polling interval shrinks when the readings change fast and grows when they are stable,
+    and is recomputed from what is left after every request, so the day never runs out of requests.
+    """
+
+    def __init__(self, daily_limit: int = 300, reserve: int = 10, min_interval: float = 60,
+                 max_interval: float = 1800, used: int = 0, day: date = None):
+        """
+        :param reserve:      int   | Requests kept aside for restarts and manual checks
+        :param min_interval: float | Seconds, never poll faster than this
+        :param max_interval: float | Seconds, never poll slower than this
+        :param used:         int   | Requests already sent on `day`
+        """
+        self.__daily_limit = daily_limit
+        self.__reserve = reserve
+        self.__min_interval = min_interval
+        self.__max_interval = max_interval
+
+        self.__day = day if day is not None else date.today()
+        self.__used = used
+
+    @property
+    def day(self) -> date:
+        return self.__day
+
+    @property
+    def used(self) -> int:
+        self.__roll_over()
+        return self.__used
+
+    @property
+    def remaining(self) -> int:
+        self.__roll_over()
+        return max(self.__daily_limit - self.__used, 0)
+
+    def consume(self) -> bool:
+        """
+        Count a request, if there is still quota for it
+        """
+        self.__roll_over()
+        if self.__used >= self.__daily_limit:
+            return False
+        self.__used += 1
+        return True
+
+    def interval(self, sunset: time, volatility: float = 0.0) -> float:
+        """
+        :param sunset:     time  | End of the period to cover
+        :param volatility: float | Relative change between the last two readings, 0 -> stable
+        :return: float | Seconds until the next request
+        """
+        now = datetime.now()
+        seconds_left = (datetime.combine(now.date(), sunset) - now).total_seconds()
+        available = self.remaining - self.__reserve
+        if seconds_left <= 0:
+            return self.__max_interval
+        if available <= 0:
+            return max(seconds_left, self.__min_interval)
+
+        interval = seconds_left / available
+        if volatility > 0.2:
+            interval /= 2
+        elif volatility < 0.02:
+            interval *= 2
+        return min(max(interval, self.__min_interval), self.__max_interval)
+
+    def __roll_over(self) -> None:
+        if self.__day != date.today():
+            self.__day = date.today()
+            self.__used = 0
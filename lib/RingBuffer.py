@@ -0,0 +1,96 @@
+from array import array
+
+
+class RingBuffer:
+    """
+    Last `capacity` timestamped samples of a few numeric fields, in preallocated arrays:
+    memory does not grow with the time sampled, the oldest sample is overwritten by the newest.
+    Timestamps must not decrease, windows are found by binary search.
+    """
+
+    def __init__(self, capacity: int, fields: tuple, typecode: str = 'f'):
+        """
+        :param capacity: int | Samples kept
+        :param fields: tuple | Names of the values of a sample
+        :param typecode: str | array typecode of the values, timestamps are always doubles
+        """
+        self.__capacity = capacity
+        self.__fields = {field: i for i, field in enumerate(fields)}
+        self.__timestamps = array('d', bytes(8 * capacity))
+        self.__values = [array(typecode, [0]) * capacity for _ in fields]
+        self.__start = 0  # Physical position of the oldest sample
+        self.__length = 0
+
+    def __len__(self) -> int:
+        return self.__length
+
+    @property
+    def capacity(self) -> int:
+        return self.__capacity
+
+    @property
+    def nbytes(self) -> int:
+        return sum(values.itemsize * len(values) for values in [self.__timestamps] + self.__values)
+
+    def append(self, timestamp: float, *values) -> None:
+        """
+        :param values: One per field, in the order of `fields`
+        """
+        if self.__length < self.__capacity:
+            position = (self.__start + self.__length) % self.__capacity
+            self.__length += 1
+        else:
+            position = self.__start
+            self.__start = (self.__start + 1) % self.__capacity
+
+        self.__timestamps[position] = timestamp
+        for column, value in zip(self.__values, values):
+            column[position] = value
+
+    def clear(self) -> None:
+        self.__start = 0
+        self.__length = 0
+
+    def latest(self, field: str) -> tuple or None:
+        """
+        :return: tuple or None | (timestamp, value) of the newest sample
+        """
+        if not self.__length:
+            return None
+        position = (self.__start + self.__length - 1) % self.__capacity
+        return self.__timestamps[position], self.__values[self.__fields[field]][position]
+
+    def values(self, field: str, since: float = None) -> list:
+        """
+        :param since: float | Only the samples with a timestamp >= since, all of them if None
+        :return: list | Oldest first
+        """
+        first = self.__first_since(since) if since is not None else 0
+        column = self.__values[self.__fields[field]]
+        return [column[(self.__start + i) % self.__capacity] for i in range(first, self.__length)]
+
+    def mean(self, field: str, since: float = None) -> float or None:
+        values = self.values(field, since)
+        return sum(values) / len(values) if len(values) else None
+
+    def percentile(self, field: str, q: float, since: float = None) -> float or None:
+        """
+        :param q: float | Between 0 and 1, linearly interpolated between the closest samples
+        """
+        values = sorted(self.values(field, since))
+        if not len(values):
+            return None
+        rank = q * (len(values) - 1)
+        lower = int(rank)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+    def __first_since(self, since: float) -> int:
+        low, high = 0, self.__length
+        while low < high:
+            middle = (low + high) // 2
+            if self.__timestamps[(self.__start + middle) % self.__capacity] < since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
@@ -1,22 +1,96 @@
-import urllib3
-import certifi
+import asyncio
 import json
-from datetime import datetime, time
+import os
+import random
+import ssl
+import time as tm
+import aiohttp
+import certifi
+from datetime import datetime, date, time, timedelta
+
+from lib.CircuitBreaker import CircuitBreaker
+from lib.logger import get_logger
+from lib.Metrics import Histogram, REGISTRY
+from lib.Quota import QuotaBudget
+
+logger = get_logger(__name__)
 
 
 class SolarEdge:
 
-    __WEBSITE = 'https://monitoringapi.solaredge.com/site/{site_id}/{action}.json?api_key={api_token}'
-    __METHOD = 'GET'
+    __WEBSITE = '{base_url}/site/{site_id}/{action}.json'
+    __BASE_URL = 'https://monitoringapi.solaredge.com'
 
-    def __init__(self, api_token: str, site_id: int or str, home_default_load: int):
-        self.__request = urllib3.PoolManager(ca_certs=certifi.where())
+    def __init__(self, api_token: str, site_id: int or str, home_default_load: int,
+                 connect_timeout: float = 5, read_timeout: float = 15, retries: int = 2, backoff: float = 1,
+                 daily_quota: int = 300, cache_file: str = None, base_url: str = __BASE_URL, on_reading=None):
+        """
+        :param connect_timeout: float | Seconds to open the connection
+        :param read_timeout:    float | Seconds to wait for the response data
+        :param retries:         int   | Retries after a failed request, with jittered exponential backoff
+        :param backoff:         float | Seconds before the first retry
+        :param daily_quota:     int   | API requests allowed per day
+        :param cache_file:      str   | Where the last reading and the used quota survive restarts
+        :param on_reading:      callable | Called with every new reading from the API
+        """
+        self.__session = None
+        self.__lock = asyncio.Lock()
 
         self.__api_token = api_token
         self.__site_id = site_id
         self.__home_default_load = home_default_load
+        self.__base_url = base_url
+
+        self.__timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+        self.__retries = retries
+        self.__backoff = backoff
+        self.__breaker = CircuitBreaker()
+
+        self.__latency = REGISTRY.histogram('solaredge_request_seconds', 'Duration of the SolarEdge API requests')
+
+        self.__daily_quota = daily_quota
+        self.__quota = QuotaBudget(daily_quota)
+        self.__cache_file = cache_file
+        self.__on_reading = on_reading
+        self.__reading = None
+        self.__expires_at = None
+        self.__volatility = 0.0
+        self.__cache_hits = 0
+        self.__cache_misses = 0
+        self.__load_cache()
 
-    def get_current_power_flow(self, sunrise: time, sunset: time) -> dict or None:
+    @property
+    def latency(self) -> Histogram:
+        """ Seconds taken by the successful requests """
+        return self.__latency
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self.__breaker
+
+    @property
+    def quota(self) -> QuotaBudget:
+        return self.__quota
+
+    @property
+    def expires_at(self) -> datetime or None:
+        """ When the cached power flow will be refreshed """
+        return self.__expires_at
+
+    @property
+    def cache_hits(self) -> int:
+        return self.__cache_hits
+
+    @property
+    def cache_misses(self) -> int:
+        return self.__cache_misses
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        total = self.__cache_hits + self.__cache_misses
+        return self.__cache_hits / total if total else 0.0
+
+    async def async_get_current_power_flow(self, sunrise: time, sunset: time) -> dict or None:
         """
         :param sunrise: time | Sunrise hour
         :param sunset:  time | Sunset hour
@@ -26,22 +100,30 @@ class SolarEdge:
         unit = 'W'
 
         if sunrise <= now.time() < sunset:
-            data = self.__execute('currentPowerFlow')
-            if not data:
-                return None
+            async with self.__lock:  # Concurrent callers share one request
+                if self.__reading is not None and datetime.now() < self.__expires_at:
+                    self.__cache_hits += 1
+                    return dict(self.__reading)
+                self.__cache_misses += 1
 
-            data = data['siteCurrentPowerFlow']
+                data = await self.__async_execute('currentPowerFlow')
+                if not data:
+                    return None
 
-            pv = int(data['PV']['currentPower'] * (1000 if data['unit'] == 'kW' else 1)) if 'PV' in data else None
-            load = int(data['LOAD']['currentPower'] * (1000 if data['unit'] == 'kW' else 1))
-            grid = int(data['GRID']['currentPower'] * (1000 if data['unit'] == 'kW' else 1))
+                data = data['siteCurrentPowerFlow']
 
-            return {
-                'PV': pv,
-                'LOAD': load,
-                'GRID': grid,
-                'unit': unit
-            }
+                pv = int(data['PV']['currentPower'] * (1000 if data['unit'] == 'kW' else 1)) if 'PV' in data else None
+                load = int(data['LOAD']['currentPower'] * (1000 if data['unit'] == 'kW' else 1))
+                grid = int(data['GRID']['currentPower'] * (1000 if data['unit'] == 'kW' else 1))
+
+                reading = {
+                    'PV': pv,
+                    'LOAD': load,
+                    'GRID': grid,
+                    'unit': unit
+                }
+                self.__cache(reading, sunset)
+                return dict(reading)
         else:
             return {
                 'PV': 0,
@@ -50,7 +132,88 @@ class SolarEdge:
                 'unit': unit
             }
 
-    def __execute(self, action: str):
-        url = self.__WEBSITE.format(site_id=self.__site_id, action=action, api_token=self.__api_token)
-        result = self.__request.request(self.__METHOD, url)
-        return json.loads(result.data) if result.status == 200 else None
+    def invalidate(self) -> None:
+        """
+        Drop the cached power flow, the next call requests it to the API
+        """
+        self.__expires_at = datetime.min
+
+    def __cache(self, reading: dict, sunset: time) -> None:
+        if self.__reading is not None:
+            previous, current = self.__reading['PV'] or 0, reading['PV'] or 0
+            self.__volatility = abs(current - previous) / max(previous, current, 1000)
+
+        interval = self.__quota.interval(sunset, self.__volatility)
+        self.__reading = reading
+        self.__expires_at = datetime.now() + timedelta(seconds=interval)
+        self.__save_cache()
+        if self.__on_reading is not None:
+            self.__on_reading(dict(reading))
+
+    def __load_cache(self) -> None:
+        if self.__cache_file is None or not os.path.exists(self.__cache_file):
+            return
+        try:
+            with open(self.__cache_file, 'r') as file:
+                cache = json.loads(file.read())
+            self.__quota = QuotaBudget(self.__daily_quota, used=cache['used'], day=date.fromisoformat(cache['day']))
+            self.__reading = cache['reading']
+            self.__expires_at = datetime.fromisoformat(cache['expires_at'])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning('SOLAREDGE: invalid cache file %s: %s', self.__cache_file, e)
+
+    def __save_cache(self) -> None:
+        if self.__cache_file is None:
+            return
+        with open(self.__cache_file, 'w') as file:
+            file.write(json.dumps({
+                'day': self.__quota.day.isoformat(),
+                'used': self.__quota.used,
+                'reading': self.__reading,
+                'expires_at': self.__expires_at.isoformat()
+            }))
+
+    async def async_close(self) -> None:
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=2, keepalive_timeout=300,
+                                             ssl=ssl.create_default_context(cafile=certifi.where()))
+            self.__session = aiohttp.ClientSession(connector=connector, timeout=self.__timeout)
+        return self.__session
+
+    async def __async_execute(self, action: str) -> dict or None:
+        if not self.__breaker.allow():
+            logger.warning('SOLAREDGE: circuit %s, request skipped', self.__breaker.state)
+            return None
+
+        url = self.__WEBSITE.format(base_url=self.__base_url, site_id=self.__site_id, action=action)
+        params = {'api_key': self.__api_token}
+
+        for attempt in range(self.__retries + 1):
+            if attempt:
+                await asyncio.sleep(self.__backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+            if not self.__quota.consume():
+                logger.warning('SOLAREDGE: daily quota exhausted')
+                break
+
+            start = tm.perf_counter()
+            try:
+                async with self.__get_session().get(url, params=params) as response:
+                    if response.status == 200:
+                        data = await response.json(content_type=None)
+                        self.__latency.observe(tm.perf_counter() - start)
+                        self.__breaker.success()
+                        return data
+                    logger.warning('SOLAREDGE: %s responded %s', action, response.status)
+                    if 400 <= response.status < 500 and response.status != 429:  # Retrying cannot help
+                        break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning('SOLAREDGE: %s failed (attempt %s): %s', action, attempt + 1, repr(e))
+
+        self.__breaker.failure()
+        return None
@@ -1,13 +1,30 @@
+import asyncio
+import heapq
+import itertools
 import threading
+import time
 from datetime import datetime, timedelta
 
+from lib import Clock
+from lib.logger import get_logger
 
-class Timer(threading.Timer):
+logger = get_logger(__name__)
+
+
+class Timer:
+    """
+    Callback scheduled on a TimerService
+    """
+
+    def __init__(self, service, interval: float, function, args=None, kwargs=None):
+        self.__service = service
+        self.__function = function
+        self.__args = args if args is not None else []
+        self.__kwargs = kwargs if kwargs is not None else {}
 
-    def __init__(self, interval, function, args=None, kwargs=None):
-        super().__init__(interval, function, args, kwargs)
         self.__interval = timedelta(seconds=interval)
         self.__started_at = None
+        self.when = None  # Loop time of expiry, None when not pending
 
     @property
     def started_at(self) -> datetime or None:
@@ -22,7 +39,7 @@ class Timer(threading.Timer):
     @property
     def elapsed(self) -> timedelta or None:
         if self.started_at is not None:
-            return datetime.now() - self.started_at
+            return Clock.now() - self.started_at
         return None
 
     @property
@@ -31,10 +48,134 @@ class Timer(threading.Timer):
             return self.__interval - self.elapsed
         return None
 
-    def start(self):
-        super().start()
-        self.__started_at = datetime.now()
+    def is_alive(self) -> bool:
+        return self.when is not None
+
+    def cancel(self) -> None:
+        self.__service.cancel(self)
+
+    def reschedule(self, interval: float) -> None:
+        self.__service.reschedule(self, interval)
+
+    def _start(self, interval: float = None) -> None:
+        if interval is not None:
+            self.__interval = timedelta(seconds=interval)
+        self.__started_at = Clock.now()
 
-    def cancel(self):
-        super().cancel()
+    def _stop(self) -> None:
         self.__started_at = None
+        self.when = None
+
+    def _run(self) -> None:
+        self.__function(*self.__args, **self.__kwargs)
+
+
+class TimerService:
+    """
+    Every timer of the process on the asyncio loop: a heap ordered by expiry
+    and a single loop.call_at for the earliest one, so pending timers cost no thread and no wakeup.
+    Timers can be scheduled, cancelled and rescheduled from any thread, callbacks always run on the loop thread.
+    """
+
+    def __init__(self):
+        self.__loop = None
+        self.__lock = threading.Lock()
+        self.__heap = []  # (when, sequence, timer), cancelled or rescheduled entries are skipped when popped
+        self.__sequence = itertools.count()
+        self.__pending = 0
+        self.__handle = None
+        self.__handle_when = None
+
+    def __len__(self) -> int:
+        return self.__pending
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.__loop = loop
+        self.__rearm()
+
+    def stop(self) -> None:
+        with self.__lock:
+            for _, _, timer in self.__heap:
+                timer._stop()
+            self.__heap = []
+            self.__pending = 0
+        if self.__handle is not None:
+            self.__handle.cancel()
+            self.__handle = None
+            self.__handle_when = None
+
+    def schedule(self, interval: float, function, *args, **kwargs) -> Timer:
+        """
+        Run `function(*args, **kwargs)` on the loop in `interval` seconds
+        """
+        timer = Timer(self, interval, function, args, kwargs)
+        self.__push(timer, interval)
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        with self.__lock:
+            if timer.is_alive():
+                self.__pending -= 1
+            timer._stop()
+            if len(self.__heap) > 64 and self.__pending < len(self.__heap) // 2:  # Drop stale entries
+                self.__heap = [entry for entry in self.__heap if entry[2].when == entry[0]]
+                heapq.heapify(self.__heap)
+
+    def reschedule(self, timer: Timer, interval: float) -> None:
+        self.cancel(timer)
+        self.__push(timer, interval)
+
+    def __time(self) -> float:
+        return self.__loop.time() if self.__loop is not None else time.monotonic()
+
+    def __push(self, timer: Timer, interval: float) -> None:
+        with self.__lock:
+            timer._start(interval)
+            timer.when = self.__time() + interval
+            heapq.heappush(self.__heap, (timer.when, next(self.__sequence), timer))
+            self.__pending += 1
+        self.__rearm()
+
+    def __rearm(self) -> None:
+        if self.__loop is None:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self.__loop
+        except RuntimeError:
+            on_loop = False
+        if not on_loop:
+            self.__loop.call_soon_threadsafe(self.__rearm)
+            return
+
+        with self.__lock:
+            while len(self.__heap) and self.__heap[0][2].when != self.__heap[0][0]:
+                heapq.heappop(self.__heap)
+            when = self.__heap[0][0] if len(self.__heap) else None
+
+        if when == self.__handle_when:
+            return
+        if self.__handle is not None:
+            self.__handle.cancel()
+        self.__handle = self.__loop.call_at(when, self.__fire) if when is not None else None
+        self.__handle_when = when
+
+    def __fire(self) -> None:
+        self.__handle = None
+        self.__handle_when = None
+
+        due = []
+        with self.__lock:
+            now = self.__time()
+            while len(self.__heap) and self.__heap[0][0] <= now:
+                when, _, timer = heapq.heappop(self.__heap)
+                if timer.when == when:
+                    timer._stop()
+                    self.__pending -= 1
+                    due.append(timer)
+
+        for timer in due:
+            try:
+                timer._run()
+            except Exception as e:
+                logger.error('Timer callback failed: %s', repr(e))
+        self.__rearm()
@@ -6,7 +6,8 @@ StreamHandler = logging.StreamHandler(sys.stdout)
 StreamHandler.setLevel(logging.INFO)
 StreamHandler.setFormatter(logging.Formatter('%(levelname)s:%(asctime)s: %(message)s'))
 
-FileHandler = handlers.TimedRotatingFileHandler('syslog.log', when='W0', backupCount=3)
+# The file is opened on the first record, not at import
+FileHandler = handlers.TimedRotatingFileHandler('syslog.log', when='W0', backupCount=3, delay=True)
 FileHandler.setLevel(logging.WARNING)
 FileHandler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(message)s'))
 
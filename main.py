@@ -1,24 +1,17 @@
 import time
 import asyncio
-from datetime import datetime
 
-from app.App import App
-from control.Config import Config
+started_at = time.perf_counter()
 
-config = Config()
+from app.App import App
+from control.Config import get_config
 
 
 if __name__ == '__main__':
+    config = get_config()
     loop = asyncio.get_event_loop()
 
-    if config.env != 'development':
-        timeout_minutes = 5
-        current_time = datetime.now()
-        wait_time = timeout_minutes * 60 - (current_time.minute % timeout_minutes)*60 - current_time.second
-        print(f'Waiting for {wait_time} seconds to startup')
-        time.sleep(wait_time)
-
-    app = App(loop)
+    app = App(loop, started_at=started_at, align=config.env != 'development')
 
     try:
         loop.run_forever()
@@ -1,24 +1,43 @@
-import asyncio
+from collections import namedtuple
 from datetime import datetime
 from meross_iot.controller.mixins.electricity import ElectricityMixin
 from meross_iot.model.enums import Namespace
 from meross_iot.model.plugin.power import PowerInfo
 
+from lib import Clock
 from lib.logger import get_logger
-from lib.Timer import Timer
+from lib.Metrics import REGISTRY
+from lib.Timer import TimerService
 import control.controller as controller
 
 logger = get_logger(__name__)
 
+PUSH_NOTIFICATIONS = REGISTRY.counter('meross_push_notifications_total', 'Push notifications received from the devices',
+                                      ('namespace',))
+
+# What the Telegram views show of a device, copied on the event loop to be read from any thread
+DeviceSnapshot = namedtuple('DeviceSnapshot', ['id', 'name', 'current_power_usage', 'is_on', 'is_locked',
+                                               'lock_expire_at'])
+
 
 class Device:
 
-    def __init__(self, device, **kwargs):
+    def __init__(self, device, timers: TimerService, on_change=None, last_state=None, **kwargs):
+        """
+        :param timers: TimerService | Where lock expiry is scheduled
+        :param on_change: callable | Called with a reason when the state of the device changes,
+                                     and whether the devices should be evaluated again
+        :param last_state: bool | State known from a previous run, used until the device is updated
+        """
         self.__device = device
+        self.__timers = timers
+        self.__on_change = on_change
         self.__kwargs = kwargs
 
-        self.__last_state = None
+        self.__last_state = last_state
         self.__last_power_on = kwargs['lastPowerOn']
+        self.__last_power_off = None
+        self.__expected = None  # State a command of the controller is turning the device to
 
         self.__locked = False
         self.__locked_timer = None
@@ -29,6 +48,15 @@ class Device:
     def get(self):
         return self.__device
 
+    def rebind(self, device) -> None:
+        """
+        Control the same device through a new Meross session, keeping its lock and its state changes
+        :param device: Device of the new session, with the same uuid
+        """
+        self.__unregister_push_notification()
+        self.__device = device
+        self.__register_push_notification()
+
     def update(self, **kwargs) -> None:
         for key, value in kwargs.items():
             if not (key in self.__kwargs and value == self.__kwargs[key]):
@@ -59,6 +87,10 @@ class Device:
     def solar_power_on(self) -> bool:
         return self.__kwargs['solarPowerOn']
 
+    @property
+    def priority(self) -> int:
+        return self.__kwargs.get('priority', 0)
+
     @property
     def times_always_on(self) -> list:
         return self.__kwargs['timesAlwaysOn']
@@ -79,6 +111,8 @@ class Device:
 
     @property
     def is_on(self) -> bool:
+        if self.last_async_update_timestamp is None and self.__last_state is not None:
+            return bool(self.__last_state)
         return self.__device.is_on()
 
     @property
@@ -93,6 +127,11 @@ class Device:
     def last_power_on(self) -> datetime:
         return self.__last_power_on
 
+    @property
+    def last_power_off(self) -> datetime or None:
+        """ Last time it was seen turning off in this process """
+        return self.__last_power_off
+
     @property
     def last_async_update_timestamp(self):
         return self.__device.last_full_update_timestamp
@@ -103,33 +142,67 @@ class Device:
 
     @property
     def next_power_status_change(self) -> datetime:
+        if self.__last_power_on is None:  # Never seen turning on: its minimum on time is over
+            return datetime.min
         return self.__last_power_on + self.__kwargs['timeDelayBeforePowerOff']
 
+    def snapshot(self) -> DeviceSnapshot:
+        return DeviceSnapshot(self.id, self.name, self.current_power_usage, self.is_on, self.__locked,
+                              self.lock_expire_at)
+
+    def expect(self, state: bool or None) -> None:
+        """
+        The next toggle to `state` comes from a command of the controller: it is recorded
+        without asking for an evaluation, the one that sent the command already accounted for it
+        :param state: bool or None | None when the command failed
+        """
+        self.__expected = state
+
+    def forget_last_state(self) -> None:
+        """
+        The state known from a previous run is not used any more: if the device was never updated,
+        it is updated again by the next async_update
+        """
+        if self.last_async_update_timestamp is None:
+            self.__last_state = None
+
     def unlock(self) -> None:
         if self.__locked:
             logger.info('%s unlocked', self.name)
             self.__locked = False
             self.__cancel_lock()
+            self.__notify_change('unlock')
 
     def lock(self) -> None:
         if not self.__locked:
-            logger.info('%s locked', self.name)
-            self.__locked = True
-            self.__cancel_lock()
+            self.__lock()
 
     def lock_for(self, delay: int) -> None:
         logger.info('Lock %s for %s minutes', self.name, delay)
-        self.lock()
-        if delay > 0:
-            self.__locked_timer = Timer(delay, self.unlock)
-            self.__locked_timer.start()
+        self.__lock(delay if delay > 0 else None)
+
+    def __lock(self, delay: int = None) -> None:
+        """
+        Lock the device, until `delay` expires if given; the change is notified once the expiry is known
+        """
+        logger.info('%s locked', self.name)
+        self.__locked = True
+        self.__cancel_lock()
+        if delay is not None:
+            self.__locked_timer = self.__timers.schedule(delay, self.unlock)
+        self.__notify_change('lock')
 
     def __cancel_lock(self) -> None:
-        if self.__locked_timer is not None and self.__locked_timer.is_alive():
+        if self.__locked_timer is not None:
             self.__locked_timer.cancel()
+            self.__locked_timer = None
+
+    def __notify_change(self, reason: str, evaluate: bool = True) -> None:
+        if self.__on_change is not None:
+            self.__on_change(f'{reason} {self.name}', evaluate)
 
     async def async_update(self) -> None:
-        if self.last_async_update_timestamp is None:
+        if self.last_async_update_timestamp is None and self.__last_state is None:
             await self.__device.async_update()
             self.__last_state = self.is_on
 
@@ -147,15 +220,22 @@ class Device:
             self.__notification_register = False
 
     async def __notifications(self, namespace: Namespace, data: dict, device_internal_id: int) -> None:
+        PUSH_NOTIFICATIONS.labels(namespace.name).inc()
 
         if namespace == Namespace.CONTROL_TOGGLEX:
             toggle = int(data['togglex'][0]['onoff'])
             if toggle != self.__last_state:
                 logger.info(f'CONTROL_TOGGLEX {self.name} is %s', 'on' if toggle else 'off')
 
-                asyncio.ensure_future(controller.log(self.id, toggle))
+                controller.log(self.id, toggle)
+                commanded = self.__expected is not None and bool(toggle) == self.__expected
+                self.__expected = None
                 self.__last_state = toggle
-                self.__last_power_on = datetime.now() if toggle else self.__last_power_on
+                if toggle:
+                    self.__last_power_on = Clock.now()
+                else:
+                    self.__last_power_off = Clock.now()
+                self.__notify_change('command' if commanded else 'toggle', evaluate=not commanded)
             else:
                 logger.debug(f'CONTROL_TOGGLEX {self.name}: Same state!')
 
@@ -164,6 +244,7 @@ class Device:
 
         elif namespace == Namespace.SYSTEM_ONLINE:
             logger.warning(f'SYSTEM_ONLINE {self.name}: {data}')
+            self.__notify_change('online')
 
         else:
             logger.debug(f'Notification: {namespace} {self.name}: {data}')
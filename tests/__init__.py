@@ -0,0 +1,6 @@
+import logging
+
+from lib import logger
+
+# The warnings logged by the tests are not written to the syslog.log of the checkout
+logger.FileHandler.setLevel(logging.CRITICAL + 1)
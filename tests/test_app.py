@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from benchmarks.fakes import FakeSolarEdge, FakeSun, fake_config
+import app.App as app_module
+import app.modal as modal_module
+
+
+class Started(Exception):
+    pass
+
+
+class StartingUpdater:
+    """ Stops the App when it starts polling, recording what the handlers would find """
+
+    app = None
+
+    def __init__(self, token: str, workers: int, defaults=None):
+        self.handlers = []
+        self.dispatcher = SimpleNamespace(add_handler=self.handlers.append, add_error_handler=lambda handler: None)
+
+    def start_polling(self, *args, **kwargs):
+        StartingUpdater.app = self.handlers[0].callback.__self__
+        raise Started()
+
+
+class StartupTest(unittest.TestCase):
+
+    def test_handlers_have_what_they_use_when_polling_starts(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with mock.patch.object(app_module, 'get_config', fake_config), \
+                mock.patch.object(app_module, 'Updater', StartingUpdater), \
+                mock.patch.object(modal_module, 'SolarEdge', FakeSolarEdge), \
+                mock.patch.object(modal_module, 'Sun', FakeSun):
+            with self.assertRaises(Started):
+                app_module.App(loop, align=False)
+
+        self.assertIsNotNone(getattr(StartingUpdater.app, '_App__view', None))
+        self.assertIsNotNone(getattr(StartingUpdater.app, '_App__modal', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from benchmarks.control_loop import reset_controller
+from benchmarks.sqlite_database import SQLiteDatabase, populate
+from database.DAO import DAO
+import control.controller as controller
+
+
+class ConfigSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = SQLiteDatabase()
+        populate(self.db, 5, logs_per_device=0)
+        reset_controller(DAO(self.db))
+        controller.get_devices()
+
+    def tearDown(self):
+        reset_controller(None)
+        self.db.close()
+
+    def usage(self, device_id: int) -> int:
+        return next(device['currentPowerUsage'] for device in controller.get_devices() if device['id'] == device_id)
+
+    def test_change_committed_after_a_later_one_is_applied(self):
+        version = controller.config_version
+        # Device 3 changes first but its change commits after the change of device 2
+        self.db.execute("UPDATE devices SET intUsage = 1234 WHERE intIdDevice = 3")
+        self.db.execute("DELETE FROM configchanges WHERE intIdChange = %s", version + 1)
+        self.db.execute("INSERT INTO configchanges (intIdChange, intIdDevice) VALUES (%s, 2)", version + 2)
+        self.assertNotEqual(self.usage(3), 1234)
+        self.assertEqual(controller.config_version, version + 2)
+
+        self.db.execute("INSERT INTO configchanges (intIdChange, intIdDevice) VALUES (%s, 3)", version + 1)
+        self.assertEqual(self.usage(3), 1234)
+
+    def test_change_is_applied_once(self):
+        self.db.execute("UPDATE devices SET intUsage = 1234 WHERE intIdDevice = 3")
+        controller.get_devices()
+        self.db.reset_stats()
+        controller.get_devices()
+        self.assertEqual(self.db.queries, 1)  # The changes only, no device read again
+
+    def test_full_sync_deletes_the_changes_before_the_overlap(self):
+        for usage in range(controller.CONFIG_CHANGES_OVERLAP + 10):
+            self.db.execute("UPDATE devices SET intUsage = %s WHERE intIdDevice = 1", usage)
+        controller.config_version = None
+        controller.get_devices()
+
+        rows = self.db.fetchall("SELECT intIdChange FROM configchanges")
+        self.assertEqual(len(rows), controller.CONFIG_CHANGES_OVERLAP)
+        self.assertEqual(max(row.intIdChange for row in rows), controller.config_version)
+        self.assertEqual(self.usage(1), controller.CONFIG_CHANGES_OVERLAP + 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from mysql.connector.conversion import MySQLConverter
+from mysql.connector.cursor import MySQLCursor
+
+from database.DAO import DAO
+
+
+class CursorDatabase:
+    """
+    Runs executemany on a mysql-connector cursor, recording the statements it would send to the server
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def executemany(self, sql, rows: list) -> int:
+        connection = mock.MagicMock(python_charset='utf8', converter=MySQLConverter('utf8'))
+        cursor = MySQLCursor(connection)
+        with mock.patch.object(MySQLCursor, 'execute', side_effect=self.__execute):
+            cursor.executemany(sql, rows)
+        return len(rows)
+
+    def __execute(self, operation, params=None, multi=False):
+        self.statements.append(operation)
+
+
+class BatchInsertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = CursorDatabase()
+        self.dao = DAO(self.db)
+        self.now = datetime(2026, 6, 21, 12, 0, 0)
+
+    def test_log_many_is_one_statement(self):
+        self.dao.log_many([(device, self.now + timedelta(seconds=i), i % 2)
+                           for device in range(1, 4) for i in range(50)])
+        self.assertEqual(len(self.db.statements), 1)
+        self.assertEqual(self.db.statements[0].count(b'),('), 149)
+
+    def test_log_power_samples_is_one_statement(self):
+        self.dao.log_power_samples([(f'device.{device}', self.now + timedelta(seconds=i), 100.0 + i)
+                                    for device in range(1, 4) for i in range(50)])
+        self.assertEqual(len(self.db.statements), 1)
+        self.assertEqual(self.db.statements[0].count(b'),('), 149)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from database.Database import Database, DatabaseException
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def is_connected(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class PoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database('localhost', 'user', 'password', 'database', size=1, timeout=2)
+        connect = mock.patch.object(self.db, '_Database__connect', side_effect=FakeConnection)
+        connect.start()
+        self.addCleanup(connect.stop)
+
+    def test_waiter_opens_a_connection_when_a_broken_one_is_discarded(self):
+        connection = self.db._Database__checkout()
+        result = []
+
+        def wait():
+            result.append(self.db._Database__checkout())
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        time.sleep(0.1)
+        self.db._Database__checkin(connection, broken=True)
+        waiter.join(1)
+
+        self.assertEqual(len(result), 1)
+        self.assertIsNot(result[0], connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.db.stats['opened'], 1)
+
+    def test_waiter_opens_a_connection_when_a_connect_fails(self):
+        blocker = threading.Event()
+        attempts = []
+
+        def connect():
+            attempts.append(1)
+            if len(attempts) == 1:
+                blocker.wait(1)
+                raise OSError('Connection refused')
+            return FakeConnection()
+
+        self.db._Database__connect.side_effect = connect
+        failed = []
+
+        def first():
+            try:
+                self.db._Database__checkout()
+            except OSError as e:
+                failed.append(e)
+
+        thread = threading.Thread(target=first)
+        thread.start()
+        time.sleep(0.1)
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(self.db._Database__checkout()))
+        waiter.start()
+        time.sleep(0.1)
+        blocker.set()
+        thread.join(1)
+        waiter.join(1)
+
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(len(result), 1)
+
+    def test_timeout_when_every_connection_is_in_use(self):
+        self.db._Database__timeout = 0.1
+        self.db._Database__checkout()
+        with self.assertRaises(DatabaseException):
+            self.db._Database__checkout()
+
+    def test_close_rejects_checkouts(self):
+        self.db._Database__checkin(self.db._Database__checkout())
+        self.db.close()
+        self.assertEqual(self.db.stats['opened'], 0)
+        with self.assertRaises(DatabaseException):
+            self.db._Database__checkout()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import asyncio
+import unittest
+from datetime import timedelta
+
+from benchmarks.fakes import FakeMerossDevice
+from lib.Timer import TimerService
+from obj.Device import Device
+
+
+class LockTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.timers = TimerService()
+        self.timers.start(asyncio.get_running_loop())
+        self.addCleanup(self.timers.stop)
+        self.published = []  # Snapshot of the device at each change
+        self.device = Device(FakeMerossDevice('uuid-0', 'boiler'), timers=self.timers,
+                             on_change=lambda reason, evaluate: self.published.append(self.device.snapshot()),
+                             id=1, currentPowerUsage=1000, solarPowerOn=True, priority=0, timesAlwaysOn=[],
+                             timeDelayBeforePowerOff=timedelta(minutes=15), lastPowerOn=None)
+
+    async def test_lock_for_publishes_its_expiry(self):
+        self.device.lock_for(60)
+        self.assertTrue(self.published[-1].is_locked)
+        self.assertIsNotNone(self.published[-1].lock_expire_at)
+
+    async def test_lock_for_again_replaces_the_timer(self):
+        self.device.lock_for(0.05)
+        self.device.lock_for(60)
+        await asyncio.sleep(0.1)
+        self.assertTrue(self.device.is_locked)
+        self.assertEqual(len(self.timers), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
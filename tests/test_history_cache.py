@@ -0,0 +1,58 @@
+import unittest
+from datetime import datetime, date, timedelta
+
+from database.HistoryCache import HistoryCache, LogRow
+from lib import Clock
+
+
+class FakeDAO:
+    """ The logs table, with only the rows written so far """
+
+    def __init__(self):
+        self.rows = []
+
+    def get_device_powers_on(self, device_id: int, start: datetime, end: datetime) -> list:
+        return [row for row in self.rows if row.intIdDevice == device_id and start <= row.dtaDate < end]
+
+
+class FakeClock(Clock.SystemClock):
+    current = date(2026, 6, 21)
+
+    def today(self) -> date:
+        return self.current
+
+
+class RollOverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dao = FakeDAO()
+        self.cache = HistoryCache(self.dao)
+        self.clock = FakeClock()
+        Clock.set_clock(self.clock)
+        self.addCleanup(Clock.set_clock, Clock.SystemClock())
+
+    def test_yesterday_read_before_its_last_rows_are_written(self):
+        written = LogRow(1, datetime(2026, 6, 21, 10, 0), 1)
+        queued = LogRow(1, datetime(2026, 6, 21, 23, 59, 58), 0)
+        self.dao.rows.append(written)
+        self.cache.append(1, written.dtaDate, 1)
+        self.cache.append(1, queued.dtaDate, 0)  # Not flushed yet
+
+        self.clock.current = date(2026, 6, 22)
+        self.assertEqual(self.cache.get(1, date(2026, 6, 21)), [written, queued])
+
+        self.dao.rows.append(queued)  # Flushed: the cached day does not change
+        self.assertEqual(self.cache.get(1, date(2026, 6, 21)), [written, queued])
+
+    def test_loaded_today_becomes_a_closed_day(self):
+        row = LogRow(1, datetime(2026, 6, 21, 10, 0), 1)
+        self.cache.get(1, date(2026, 6, 21))
+        self.cache.append(1, row.dtaDate, 1)
+
+        self.clock.current = date(2026, 6, 22)
+        self.assertEqual(self.cache.get(1, date(2026, 6, 21)), [row])
+        self.assertEqual(self.cache.get(1, date(2026, 6, 21) - timedelta(days=1)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.control_loop import reset_controller
+from benchmarks.fakes import FakeMerossDevice, FakeMerossHttpClient, FakeMerossManager, Latency
+from benchmarks.sqlite_database import SQLiteDatabase, populate
+from database.DAO import DAO
+from lib.Timer import TimerService
+import control.Meross as meross_module
+
+DEVICES = 4
+
+
+class SessionManager(FakeMerossManager):
+    """ Rejects the discovery of a saved session, or its start with `fail_init`, counts the managers closed """
+
+    closed = 0
+    fail_init = False
+
+    def __init__(self, http_client: FakeMerossHttpClient, **kwargs):
+        super().__init__(http_client, **kwargs)
+        self.http_client = http_client
+        self.initialised = False
+
+    async def async_init(self) -> None:
+        if self.fail_init and not self.http_client.logins:
+            raise RuntimeError('MQTT connection refused')
+        self.initialised = True
+
+    async def async_device_discovery(self, *args, **kwargs) -> list:
+        if not self.http_client.logins:
+            raise RuntimeError('Session expired')
+        return await super().async_device_discovery(*args, **kwargs)
+
+    def close(self) -> None:
+        SessionManager.closed += 1
+
+
+class WarmStartTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.db = SQLiteDatabase()
+        populate(self.db, DEVICES, logs_per_device=0)
+        reset_controller(DAO(self.db))
+        self.addCleanup(self.db.close)
+        self.addCleanup(reset_controller, None)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.snapshot_file = os.path.join(self.directory.name, 'meross.json')
+
+        patches = [mock.patch.object(Latency, name, 0) for name in ('login', 'list_devices', 'abilities', 'update')]
+        patches += [mock.patch.object(FakeMerossManager, 'count', DEVICES),
+                    mock.patch.object(FakeMerossManager, 'on', 1),
+                    mock.patch.object(meross_module, 'MerossHttpClient', FakeMerossHttpClient),
+                    mock.patch.object(meross_module, 'MerossManager', SessionManager),
+                    mock.patch.object(meross_module, 'RELOGIN_DELAY', 0.01)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        SessionManager.closed = 0
+        SessionManager.fail_init = False
+
+        meross = meross_module.Meross('user@example.com', 'password', TimerService(),
+                                      snapshot_file=self.snapshot_file)
+        await meross.async_init()  # Cold start, every device on in the snapshot it saves
+        await asyncio.gather(*[device.async_update() for device in meross.find_devices()])
+        await meross.async_stop()
+
+    async def warm_start(self) -> meross_module.Meross:
+        meross = meross_module.Meross('user@example.com', 'password', TimerService(),
+                                      snapshot_file=self.snapshot_file)
+        await meross.async_init()
+        self.addAsyncCleanup(meross.async_stop)
+        return meross
+
+    async def test_failed_login_is_retried_and_keeps_the_saved_devices(self):
+        logins = []
+        original = FakeMerossHttpClient.async_from_user_password
+
+        async def login(cls, email: str, password: str, **kwargs):
+            logins.append(email)
+            if len(logins) < 3:
+                raise ConnectionError('Cloud unreachable')
+            return await original(email, password, **kwargs)
+
+        closed = SessionManager.closed
+        with mock.patch.object(FakeMerossHttpClient, 'async_from_user_password', classmethod(login)):
+            meross = await self.warm_start()
+            saved = meross.find_devices()
+            self.assertEqual(len(saved), DEVICES)
+            saved[0].lock_for(3600)  # From Telegram, while the saved session is being validated
+            with self.assertLogs(meross_module.logger.name, 'ERROR'):
+                await meross._Meross__refresh_task
+
+        self.assertEqual(len(logins), 3)
+        self.assertEqual(SessionManager.closed, closed + 1)  # The saved session only, once the login succeeded
+        devices = meross.find_devices()
+        self.assertEqual(devices, saved)
+        self.assertTrue(all(device.last_async_update_timestamp is not None for device in devices))
+        self.assertTrue(devices[0].is_locked)
+        self.assertIsNotNone(devices[0].lock_expire_at)
+
+        await devices[1].get().async_toggle(False)  # Pushed by the device of the new session
+        self.assertFalse(devices[1].is_on)
+
+    async def test_warm_start_initialises_the_saved_manager(self):
+        with mock.patch.object(SessionManager, 'async_device_discovery', FakeMerossManager.async_device_discovery):
+            meross = await self.warm_start()
+            self.assertIsNotNone(meross._Meross__refresh_task)
+            self.assertTrue(meross._Meross__manager.initialised)
+            await meross._Meross__refresh_task
+
+    async def test_saved_session_that_fails_to_start_is_a_cold_start(self):
+        SessionManager.fail_init = True
+        meross = await self.warm_start()
+        self.assertIsNone(meross._Meross__refresh_task)
+        self.assertTrue(meross._Meross__manager.initialised)
+        self.assertEqual(len(meross.find_devices()), DEVICES)
+
+    async def test_device_not_updated_by_the_refresh_is_updated_later(self):
+        update = FakeMerossDevice.async_update
+
+        async def offline(device, *args, **kwargs):
+            if device.uuid == 'uuid-1':
+                raise TimeoutError('Offline')
+            await update(device, *args, **kwargs)
+
+        with mock.patch.object(FakeMerossHttpClient, 'async_from_user_password',
+                               classmethod(lambda cls, *args, **kwargs: self.fail('No login expected'))):
+            with mock.patch.object(SessionManager, 'async_device_discovery', FakeMerossManager.async_device_discovery):
+                meross = await self.warm_start()
+                device = meross.find_devices()[1]
+                device.get()._FakeMerossDevice__on = False  # Turned off while the controller was down
+                self.assertTrue(device.is_on)  # From the snapshot
+                with mock.patch.object(FakeMerossDevice, 'async_update', offline):
+                    await meross._Meross__refresh_task
+
+        self.assertIsNone(device.last_async_update_timestamp)
+        await device.async_update()
+        self.assertIsNotNone(device.last_async_update_timestamp)
+        self.assertFalse(device.is_on)
+
+    async def test_device_renamed_in_the_app_is_removed(self):
+        meross = meross_module.Meross('user@example.com', 'password', TimerService())
+        await meross.async_init()
+        self.addAsyncCleanup(meross.async_stop)
+        device = meross.find_devices()[1]
+
+        device.get().name = 'Renamed'
+        names = [device.name for device in meross.find_devices()]
+        self.assertEqual(len(names), DEVICES - 1)
+        self.assertNotIn('Renamed', names)
+        self.assertIsNone(meross.get_device_by_uuid(device.uuid))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+from datetime import datetime, timedelta
+
+from control.allocation import GreedyAllocator
+from control.policy import DeviceState, SURPLUS, decide
+
+NOW = datetime(2026, 6, 21, 12, 0)
+
+
+def state(name: str, is_on: bool = False, next_power_on: datetime = datetime.min) -> DeviceState:
+    return DeviceState(name, is_on, True, 0, [], datetime.min, 1000, 1000, next_power_on)
+
+
+class MinimumOffTimeTest(unittest.TestCase):
+
+    def test_device_turned_off_is_not_turned_on_before_its_minimum_off_time(self):
+        states = [state('boiler', next_power_on=NOW + timedelta(minutes=1)), state('pump')]
+        commands = decide(states, 5000, NOW, True, GreedyAllocator())
+        self.assertEqual(commands, [('pump', True, SURPLUS)])
+
+    def test_device_is_turned_on_once_its_minimum_off_time_elapsed(self):
+        states = [state('boiler', next_power_on=NOW)]
+        commands = decide(states, 5000, NOW, True, GreedyAllocator())
+        self.assertEqual(commands, [('boiler', True, SURPLUS)])
+
+    def test_never_turned_off(self):
+        states = [DeviceState('boiler', False, True, 0, [], datetime.min, 1000, 1000)]
+        self.assertEqual(len(decide(states, 5000, NOW, True, GreedyAllocator())), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import time
+import unittest
+from datetime import time as dtime
+from types import SimpleNamespace
+from unittest import mock
+
+from benchmarks.solaredge import FakeSolarEdgeServer
+from lib.CircuitBreaker import CircuitBreaker
+from lib.SolarEdge import SolarEdge
+
+DAY = (dtime.min, dtime.max)
+
+
+class SolarEdgeTest(unittest.IsolatedAsyncioTestCase):
+    """
+    The client against a local fake of the monitoring API
+    """
+
+    async def asyncSetUp(self):
+        self.server = FakeSolarEdgeServer()
+        await self.server.async_start()
+        self.client = SolarEdge('token', 1, 500, connect_timeout=1, read_timeout=0.2, retries=2, backoff=0.1,
+                                daily_quota=10000, base_url=f'http://127.0.0.1:{self.server.port}')
+
+    async def asyncTearDown(self):
+        await self.client.async_close()
+        await self.server.async_stop()
+
+    async def test_kilowatts_are_converted_to_watts(self):
+        self.assertEqual(await self.client.async_get_current_power_flow(*DAY),
+                         {'PV': 3200, 'LOAD': 1100, 'GRID': 0, 'unit': 'W'})
+
+        self.server.payload = {'siteCurrentPowerFlow': {'unit': 'W', 'PV': {'currentPower': 2500},
+                                                        'LOAD': {'currentPower': 700}, 'GRID': {'currentPower': 0}}}
+        self.client.invalidate()
+        self.assertEqual(await self.client.async_get_current_power_flow(*DAY),
+                         {'PV': 2500, 'LOAD': 700, 'GRID': 0, 'unit': 'W'})
+
+    async def test_night_is_answered_without_request(self):
+        reading = await self.client.async_get_current_power_flow(dtime.max, dtime.max)
+        self.assertEqual(reading, {'PV': 0, 'LOAD': 500, 'GRID': 500, 'unit': 'W'})
+        self.assertEqual(self.server.requests, 0)
+
+    async def test_concurrent_callers_share_one_request(self):
+        self.server.delay = 0.1
+        readings = await asyncio.gather(*[self.client.async_get_current_power_flow(*DAY) for _ in range(20)])
+        self.assertEqual(self.server.requests, 1)
+        self.assertTrue(all(reading == readings[0] for reading in readings))
+        self.assertEqual(self.client.cache_hits, 19)
+
+    async def test_read_timeout_is_retried_with_backoff(self):
+        self.server.delay = 1
+        start = time.perf_counter()
+        self.assertIsNone(await self.client.async_get_current_power_flow(*DAY))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(self.server.requests, 3)
+        # 3 read timeouts of 0.2 s, and backoffs of 0.1 and 0.2 s jittered by at least 0.5
+        self.assertGreaterEqual(elapsed, 3 * 0.2 + 0.5 * (0.1 + 0.2))
+        self.assertLess(elapsed, 3 * 0.2 + 1.5 * (0.1 + 0.2) + 0.5)
+
+    async def test_client_errors_are_not_retried(self):
+        self.server.status = 403
+        self.assertIsNone(await self.client.async_get_current_power_flow(*DAY))
+        self.assertEqual(self.server.requests, 1)
+
+    async def test_circuit_opens_and_closes(self):
+        self.server.status = 500
+        clock = [1000.0]
+        with mock.patch('lib.CircuitBreaker.time', SimpleNamespace(monotonic=lambda: clock[0])):
+            for _ in range(3):
+                self.client.invalidate()
+                self.assertIsNone(await self.client.async_get_current_power_flow(*DAY))
+            self.assertEqual(self.client.breaker.state, CircuitBreaker.OPEN)
+
+            requests = self.server.requests
+            self.client.invalidate()
+            self.assertIsNone(await self.client.async_get_current_power_flow(*DAY))
+            self.assertEqual(self.server.requests, requests)  # Refused without reaching the server
+
+            clock[0] += 300  # Cooldown over: one trial call, which succeeds
+            self.server.status = 200
+            self.client.invalidate()
+            self.assertEqual((await self.client.async_get_current_power_flow(*DAY))['PV'], 3200)
+            self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+            self.assertEqual(self.server.requests, requests + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()